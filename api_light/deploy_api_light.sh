@@ -9,6 +9,11 @@ REPO_BRANCH="main"
 
 echo "🔵 Iniciando Despliegue de API LIGERA..."
 
+# 0. Sincronizar módulos compartidos con el Predictor Live (app/ -> api_light/)
+SCRIPT_DIR=$(cd "$(dirname "$0")" && pwd)
+cp "$SCRIPT_DIR/../app/summary_format.py" "$SCRIPT_DIR/summary_format.py"
+cp "$SCRIPT_DIR/../app/grid_format.py" "$SCRIPT_DIR/grid_format.py"
+
 # 1. Sincronización con GitHub 
 # (Equivalente al ZIP+S3, pero para CodeBuild conectado a Git)
 echo "📦 Sincronizando cambios con GitHub..."
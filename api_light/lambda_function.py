@@ -5,13 +5,24 @@ import numpy as np
 import os
 import gzip
 import time
+import threading
+from email.utils import format_datetime, parsedate_to_datetime
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from zoneinfo import ZoneInfo
+from summary_format import SummaryHeader, read_cell
+from grid_format import decode_columns, to_frame, to_records, GEOMETRY_PREFIX
+import base64
+try:
+    import brotli
+except ImportError:
+    brotli = None # Opcional: sin la librería solo se negocia gzip
 
 # --- CONFIGURACIÓN ---
 S3_BUCKET = os.environ.get('S3_BUCKET', 'smability-data-lake')
 GRID_KEY = 'live_grid/latest_grid.json'
+# Snapshot columnar (solo valores dinámicos) + geometría inmutable referenciada en su meta
+GRID_COLS_KEY = 'live_grid/latest_grid.cols.gz'
 s3 = boto3.client('s3')
 
 LIMITS = {'LAT_MIN': 19.13, 'LAT_MAX': 19.80, 'LON_MIN': -99.40, 'LON_MAX': -98.80}
@@ -22,6 +33,15 @@ CACHED_GRID = None
 CACHED_GRID = None
 LAST_CACHE_TIME = 0
 CACHE_TTL = 300 # 🔥 5 minutos (300 segundos) para estar siempre sincronizados
+CACHED_GRID_BLOB = None # Snapshot columnar tal cual (mode=map&format=columnar)
+GEOMETRY_CACHE = {} # llave -> columnas decodificadas; nunca caduca (la llave cambia si cambia la malla)
+# Versión S3 del grid en RAM (llave, ETag/VersionId, LastModified) y cuerpos de mode=map ya
+# serializados por codificación ('identity', 'gzip', 'br'); se vacían cuando cambia la versión
+CACHED_GRID_VERSION = {'key': None, 'etag': None, 'last_modified': None}
+MAP_BODIES = {}
+MAP_CACHE_CONTROL = 'no-cache' # El navegador siempre revalida; sin cambios -> 304 sin cuerpo
+# Índice espacial del grid en RAM (cubetas del tamaño de la celda) + respuesta por celda ya en dict
+POINT_INDEX = None
 
 def get_s3_json(key):
     try:
@@ -41,8 +61,142 @@ def get_s3_gzip_json(key):
         print(f"⚠️ No se pudo cargar el resumen GZIP de S3: {e}")
         return None
 
+# --- CACHÉ DE RESÚMENES (ayer / hoy / pronóstico) ---
+# Cada resumen binario (~1 MB) vive completo en RAM; una consulta warm es solo búsqueda en memoria.
+# Al caducar su TTL se sirve la copia vieja y se revalida en segundo plano (HEAD + ETag); si S3
+# falla se sigue sirviendo la copia vieja. Más allá de SUMMARY_MAX_STALE se revalida en línea.
+SUMMARY_TTLS = [ # (prefijo, TTL s) - el primero que coincida
+    ('daily_summaries/summary_today', int(os.environ.get('SUMMARY_TTL_TODAY', '300'))),
+    ('forecast_summary/', int(os.environ.get('SUMMARY_TTL_FORECAST', '600'))),
+    ('daily_summaries/summary_', 86400), # Resumen de un día cerrado: inmutable
+]
+SUMMARY_MAX_STALE = int(os.environ.get('SUMMARY_MAX_STALE', '3600'))
+SUMMARY_RETRY_S = 60 # Tras un error de S3 (o un resumen inexistente) no se reintenta antes de 1 min
+SUMMARY_CACHE_MAX = 4 # Entradas (llaves con fecha entran y salen cada día)
+SUMMARY_CACHE = {} # json_key -> {'etag', 'header', 'buf' | 'json', 'expires_at', 'fetched_at', 'used_at', 'refreshing'} | {'missing', 'expires_at', 'used_at'}
+SUMMARY_LOCK = threading.Lock()
+# Persistente entre invocaciones: lecturas concurrentes en frío + revalidaciones en segundo plano
+# (Lambda congela el contenedor entre invocaciones; una revalidación pendiente sigue en la próxima)
+SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+def summary_ttl(json_key):
+    return next((ttl for prefix, ttl in SUMMARY_TTLS if json_key.startswith(prefix)), 300)
+
+def fetch_summary(json_key):
+    """Resumen completo desde S3: el .bin si existe, si no el json.gz"""
+    bin_key = json_key.replace('.json.gz', '.bin')
+    try:
+        buf, version = get_s3_object(bin_key)
+        return {'key': bin_key, 'etag': version['etag'], 'header': SummaryHeader(buf), 'buf': buf}
+    except Exception as e:
+        print(f"⚠️ Resumen binario no disponible ({bin_key}): {e}. Usando JSON.")
+    try:
+        body, version = get_s3_object(json_key)
+        res = json.loads(gzip.decompress(body).decode('utf-8'))
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el resumen GZIP de S3: {e}")
+        return None
+    if "celdas" not in res: return None
+    return {'key': json_key, 'etag': version['etag'], 'json': res}
+
+def store_summary(json_key, entry):
+    with SUMMARY_LOCK:
+        SUMMARY_CACHE[json_key] = entry
+        while len(SUMMARY_CACHE) > SUMMARY_CACHE_MAX:
+            del SUMMARY_CACHE[min(SUMMARY_CACHE, key=lambda k: SUMMARY_CACHE[k]['used_at'])]
+
+def refresh_summary(json_key):
+    """Revalida por ETag (HEAD) y descarga solo si cambió; ante error conserva la copia vieja"""
+    entry = SUMMARY_CACHE.get(json_key)
+    if entry is not None and entry.get('missing'): entry = None
+    now = time.time()
+    try:
+        if entry is not None:
+            head = s3.head_object(Bucket=S3_BUCKET, Key=entry['key'])
+            if (head.get('VersionId') or head.get('ETag') or '').strip('"') == entry['etag']:
+                entry.update(expires_at=now + summary_ttl(json_key), fetched_at=now, refreshing=False)
+                return entry
+        fresh = fetch_summary(json_key)
+        if fresh is None:
+            raise RuntimeError("resumen no disponible")
+    except Exception as e:
+        if entry is None:
+            # Sin copia previa: se recuerda la ausencia para no repetir los dos GET (y avisos) en cada consulta
+            store_summary(json_key, {'missing': True, 'expires_at': now + SUMMARY_RETRY_S, 'used_at': now})
+            return None
+        print(f"⚠️ Revalidación de {json_key} falló ({e}). Sirviendo copia de hace {int(now - entry['fetched_at'])}s.")
+        entry.update(expires_at=now + SUMMARY_RETRY_S, refreshing=False)
+        return entry
+    fresh.update(expires_at=now + summary_ttl(json_key), fetched_at=now, used_at=now, refreshing=False)
+    store_summary(json_key, fresh)
+    return fresh
+
+def get_summary(json_key):
+    entry = SUMMARY_CACHE.get(json_key)
+    now = time.time()
+    if entry is not None and entry.get('missing'):
+        return None if now < entry['expires_at'] else refresh_summary(json_key)
+    if entry is None or now - entry['expires_at'] > SUMMARY_MAX_STALE:
+        return refresh_summary(json_key)
+    entry['used_at'] = now
+    if now >= entry['expires_at']:
+        with SUMMARY_LOCK:
+            launch = not entry['refreshing']
+            entry['refreshing'] = True
+        if launch: SUMMARY_EXECUTOR.submit(refresh_summary, json_key)
+    return entry
+
+def get_summary_cell(json_key, geo_key):
+    """Vector de 24 h de UNA celda desde la caché de resúmenes. Regresa (celda|None, atributos)"""
+    entry = get_summary(json_key)
+    if entry is None:
+        return None, {}
+    if 'json' in entry:
+        return entry['json']["celdas"].get(geo_key), entry['json']
+    cell, header = read_cell(entry['buf'], geo_key, entry['header'])
+    return cell, header.attrs
+
+def get_s3_bytes(key):
+    return get_s3_object(key)[0]
+
+def get_s3_object(key):
+    """(bytes, versión) -> versión = VersionId si el bucket versiona, si no el ETag del objeto"""
+    obj = s3.get_object(Bucket=S3_BUCKET, Key=key)
+    version = {'key': key, 'etag': (obj.get('VersionId') or obj.get('ETag') or '').strip('"'), 'last_modified': obj.get('LastModified')}
+    return obj['Body'].read(), version
+
+def get_geometry(key):
+    if key not in GEOMETRY_CACHE:
+        GEOMETRY_CACHE[key] = decode_columns(get_s3_bytes(key))
+    return GEOMETRY_CACHE[key]
+
+def load_columnar_grid(key):
+    """Snapshot columnar + su geometría -> (DataFrame con las columnas del JSON, bytes del snapshot, versión S3)"""
+    body, version = get_s3_object(key)
+    snapshot = decode_columns(body)
+    geometry_key = snapshot[1]['attrs']['geometry_key']
+    df = to_frame(get_geometry(geometry_key), snapshot)
+    df.attrs['geometry_key'] = geometry_key
+    return df, body, version
+
+def grid_version_unchanged():
+    """HEAD barato: ¿el objeto que tenemos en RAM sigue siendo la versión vigente en S3?"""
+    if not CACHED_GRID_VERSION['key']: return False
+    try:
+        head = s3.head_object(Bucket=S3_BUCKET, Key=CACHED_GRID_VERSION['key'])
+        return (head.get('VersionId') or head.get('ETag') or '').strip('"') == CACHED_GRID_VERSION['etag']
+    except Exception:
+        return False
+
+def set_cached_grid(df, version, blob=None):
+    global CACHED_GRID, LAST_CACHE_TIME, CACHED_GRID_BLOB, CACHED_GRID_VERSION
+    CACHED_GRID, CACHED_GRID_BLOB, CACHED_GRID_VERSION = df, blob, version
+    LAST_CACHE_TIME = time.time() # Guardamos la hora exacta de la descarga
+    MAP_BODIES.clear()
+    build_point_index(df)
+
 def get_grid_data():
-    global CACHED_GRID, LAST_CACHE_TIME
+    global CACHED_GRID, LAST_CACHE_TIME, CACHED_GRID_BLOB
     
     # 1. ¿Tenemos caché? Vamos a ver qué tan "fresca" está
     if CACHED_GRID is not None:
@@ -52,19 +206,69 @@ def get_grid_data():
             return CACHED_GRID
         else:
             print(f"♻️ [CACHE EXPIRED] El grid en RAM caducó (tenía {int(edad_cache)}s). Hay que renovar.")
+            if grid_version_unchanged():
+                LAST_CACHE_TIME = time.time()
+                print("✅ [CACHE REVALIDATED] Misma versión en S3; se conserva el grid (y los cuerpos comprimidos).")
+                return CACHED_GRID
             
-    # 2. Si no hay caché o ya caducó, vamos a S3
+    # 2. Si no hay caché o ya caducó, vamos a S3 (primero el snapshot columnar, ~30x más ligero)
     print("☁️ [S3 FETCH] Descargando grid fresco de S3...")
-    data = get_s3_json(GRID_KEY)
+    try:
+        df, blob, version = load_columnar_grid(GRID_COLS_KEY)
+        set_cached_grid(df, version, blob)
+        print("✅ [CACHE UPDATED] Grid columnar reconstruido en memoria RAM.")
+        return CACHED_GRID
+    except Exception as e:
+        print(f"⚠️ Grid columnar no disponible ({e}). Usando JSON.")
+    try:
+        body, version = get_s3_object(GRID_KEY)
+        data = json.loads(body)
+    except Exception:
+        data = None
     
     if data:
-        CACHED_GRID = pd.DataFrame(data)
-        LAST_CACHE_TIME = time.time() # Guardamos la hora exacta de la descarga
+        set_cached_grid(pd.DataFrame(data), version)
         print("✅ [CACHE UPDATED] Nuevo grid guardado exitosamente en memoria RAM.")
         return CACHED_GRID
         
     return None
 
+# --- MODE=MAP: CUERPOS PRECOMPRIMIDOS + VALIDACIÓN CONDICIONAL ---
+def negotiate_encoding(headers):
+    accepted = {t.split(';')[0].strip().lower() for t in headers.get('accept-encoding', '').split(',')}
+    if 'br' in accepted and brotli is not None: return 'br'
+    if 'gzip' in accepted: return 'gzip'
+    return 'identity'
+
+def get_map_body(encoding):
+    """Serializa/comprime una sola vez por versión del grid"""
+    if 'identity' not in MAP_BODIES:
+        MAP_BODIES['identity'] = CACHED_GRID.to_json(orient='records').encode('utf-8')
+    if encoding not in MAP_BODIES:
+        raw = MAP_BODIES['identity']
+        MAP_BODIES[encoding] = brotli.compress(raw, quality=9) if encoding == 'br' else gzip.compress(raw, compresslevel=6)
+    return MAP_BODIES[encoding]
+
+def map_validators(variant):
+    """ETag débil (misma versión S3 en cualquier codificación) + Last-Modified"""
+    headers = {'ETag': f'W/"{CACHED_GRID_VERSION["etag"]}-{variant}"', 'Cache-Control': MAP_CACHE_CONTROL, 'Vary': 'Accept-Encoding',
+               'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag, Last-Modified, X-Geometry-Key'}
+    if CACHED_GRID_VERSION['last_modified'] is not None:
+        headers['Last-Modified'] = format_datetime(CACHED_GRID_VERSION['last_modified'], usegmt=True)
+    return headers
+
+def not_modified(request_headers, validators):
+    """If-None-Match (comparación débil) manda; If-Modified-Since solo si no viene ETag"""
+    inm = request_headers.get('if-none-match')
+    if inm:
+        tags = {t.strip().removeprefix('W/') for t in inm.split(',')}
+        return '*' in tags or validators['ETag'].removeprefix('W/') in tags
+    ims = request_headers.get('if-modified-since')
+    if ims and CACHED_GRID_VERSION['last_modified'] is not None:
+        try: return CACHED_GRID_VERSION['last_modified'].replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except Exception: return False
+    return False
+
 def haversine_vectorized(lon1, lat1, df):
     lon1, lat1 = np.radians(lon1), np.radians(lat1)
     lon2, lat2 = np.radians(df['lon'].values), np.radians(df['lat'].values)
@@ -72,6 +276,69 @@ def haversine_vectorized(lon1, lat1, df):
     a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
     return 6367 * (2 * np.arcsin(np.sqrt(a)))
 
+# --- ÍNDICE ESPACIAL (consulta de punto sin barrer todo el grid) ---
+# La malla es casi regular (~0.0103°): se proyecta a km (equirectangular) y se reparte en cubetas
+# del tamaño de una celda. Una consulta revisa anillos de cubetas alrededor del punto hasta que
+# ninguna cubeta más lejana pueda ganar; entre esos candidatos decide haversine, igual que antes.
+POINT_RING_SLACK = 1.02 # Margen por la diferencia proyección vs haversine dentro de la ZMVM
+
+def build_point_index(df):
+    global POINT_INDEX
+    POINT_INDEX = None
+    try:
+        lat, lon = df['lat'].to_numpy(dtype=float), df['lon'].to_numpy(dtype=float)
+        kx = 111.195 * np.cos(np.radians(np.nanmean(lat)))
+        x, y = lon * kx, lat * 111.195
+        uy = np.unique(np.round(lat, 5))
+        step = float(np.median(np.diff(uy)) * 111.195) if len(uy) > 1 else 1.0
+        bx, by = np.floor(x / step).astype(int), np.floor(y / step).astype(int)
+        buckets = {}
+        for i, cell in enumerate(zip(bx.tolist(), by.tolist())):
+            buckets.setdefault(cell, []).append(i)
+        POINT_INDEX = {
+            'kx': kx, 'step': step, 'lat': lat, 'lon': lon,
+            'buckets': {cell: np.array(idx) for cell, idx in buckets.items()},
+            'max_ring': int(max(bx.max() - bx.min(), by.max() - by.min())) + 1,
+            # Respuesta por celda (antes: iloc + replace + to_dict en cada consulta)
+            'records': df.astype(object).where(df.notna(), None).to_dict('records')
+        }
+    except Exception as e:
+        print(f"⚠️ No se pudo construir el índice espacial ({e}). Se usará el barrido completo.")
+
+def nearest_cell(u_lat, u_lon):
+    """(índice, distancia km) de la celda más cercana; mismo resultado que argmin(haversine)"""
+    ix = POINT_INDEX
+    step = ix['step']
+    qx, qy = u_lon * ix['kx'], u_lat * 111.195
+    cx, cy = int(np.floor(qx / step)), int(np.floor(qy / step))
+    found, best = [], None
+    for r in range(ix['max_ring'] + 1):
+        # Todo punto en el anillo r está a >= (r - 1) * step del punto consultado
+        if best is not None and best * POINT_RING_SLACK <= (r - 1) * step: break
+        ring = [(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1) if max(abs(dx), abs(dy)) == r]
+        hits = [ix['buckets'][c] for c in ring if c in ix['buckets']]
+        if not hits: continue
+        found.extend(hits)
+        cand = np.concatenate(hits)
+        d = np.hypot(ix['lon'][cand] * ix['kx'] - qx, ix['lat'][cand] * 111.195 - qy).min()
+        best = d if best is None else min(best, d)
+    cand = np.sort(np.concatenate(found)) # Orden original: en empate gana el primer índice, como argmin
+    lon1, lat1 = np.radians(u_lon), np.radians(u_lat)
+    lon2, lat2 = np.radians(ix['lon'][cand]), np.radians(ix['lat'][cand])
+    a = np.sin((lat2 - lat1)/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2.0)**2
+    distances = 6367 * (2 * np.arcsin(np.sqrt(a)))
+    k = int(np.argmin(distances))
+    return int(cand[k]), distances[k]
+
+def lookup_point(u_lat, u_lon, grid):
+    """(registro de la celda, distancia km); sin índice cae al barrido haversine completo"""
+    if POINT_INDEX is not None:
+        idx, dist = nearest_cell(u_lat, u_lon)
+        return dict(POINT_INDEX['records'][idx]), dist
+    distances = haversine_vectorized(u_lon, u_lat, grid)
+    idx = np.argmin(distances)
+    return grid.iloc[idx].replace({np.nan: None}).to_dict(), distances[idx]
+
 # --- HELPERS ---
 def safe_float(val, precision=1):
     try: return round(float(val), precision)
@@ -103,14 +370,37 @@ def lambda_handler(event, context):
     global CACHED_GRID
     try:
         params = event.get('queryStringParameters') or {}
+        request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
         mode = params.get('mode')
         
-        # 1. MAPA WEB
+        # 1. MAPA WEB (cuerpo serializado y comprimido una vez por versión; 304 si el cliente ya la tiene)
         if mode == 'map':
-            if CACHED_GRID is None: get_grid_data()
-            if CACHED_GRID is not None:
-                return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': CACHED_GRID.to_json(orient='records')}
-            return {'statusCode': 503, 'body': 'Error cargando Live Grid'}
+            get_grid_data()
+            if CACHED_GRID is None:
+                return {'statusCode': 503, 'body': 'Error cargando Live Grid'}
+            columnar = params.get('format') == 'columnar' and CACHED_GRID_BLOB is not None
+            validators = map_validators('cols' if columnar else 'json')
+            if not_modified(request_headers, validators):
+                return {'statusCode': 304, 'headers': validators, 'body': ''}
+            # Formato compacto: el cliente descomprime y une con la geometría (mode=geometry)
+            if columnar:
+                headers = {**validators, 'Content-Type': 'application/octet-stream', 'X-Geometry-Key': CACHED_GRID.attrs.get('geometry_key', '')}
+                return {'statusCode': 200, 'headers': headers, 'body': base64.b64encode(CACHED_GRID_BLOB).decode('ascii'), 'isBase64Encoded': True}
+            encoding = negotiate_encoding(request_headers)
+            body = get_map_body(encoding)
+            headers = {**validators, 'Content-Type': 'application/json'}
+            if encoding == 'identity':
+                return {'statusCode': 200, 'headers': headers, 'body': body.decode('utf-8')}
+            headers['Content-Encoding'] = encoding
+            return {'statusCode': 200, 'headers': headers, 'body': base64.b64encode(body).decode('ascii'), 'isBase64Encoded': True}
+
+        # 1b. GEOMETRÍA DEL MAPA (inmutable, cacheable para siempre)
+        elif mode == 'geometry':
+            key = params.get('key', '')
+            if not key.startswith(GEOMETRY_PREFIX): return {'statusCode': 400, 'body': json.dumps({'error': 'Llave de geometría inválida'})}
+            try: body = get_s3_bytes(key)
+            except Exception: return {'statusCode': 404, 'body': json.dumps({'error': 'Geometría no encontrada'})}
+            return {'statusCode': 200, 'headers': {'Content-Type': 'application/octet-stream', 'Access-Control-Allow-Origin': '*', 'Cache-Control': 'public, max-age=31536000, immutable'}, 'body': base64.b64encode(body).decode('ascii'), 'isBase64Encoded': True}
 
         # 2. FORECAST RAW (Data completa de una hora)
         elif mode == 'forecast_data':
@@ -126,7 +416,8 @@ def lambda_handler(event, context):
             if not ts: return {'statusCode': 400, 'body': json.dumps({'error': 'Falta timestamp'})}
             # OJO: Aquí es donde tu frontend puede estar fallando. 
             # Verifica si el frontend manda "2026-01-28_10-00" o "2026-01-28 10:00"
-            data = get_s3_json(f"live_grid/grid_{ts}.json")
+            try: data = to_records(load_columnar_grid(f"live_grid/grid_{ts}.cols.gz")[0])
+            except Exception: data = get_s3_json(f"live_grid/grid_{ts}.json")
             if data: return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps(data)}
             return {'statusCode': 404, 'body': json.dumps({'error': 'Historial no encontrado'})}
 
@@ -145,10 +436,7 @@ def lambda_handler(event, context):
         if grid_actual is None:
             return {'statusCode': 503, 'body': 'Error cargando datos de aire'}
 
-        distances = haversine_vectorized(u_lon, u_lat, grid_actual) # <-- Ojo, usamos grid_actual
-        idx = np.argmin(distances)
-        dist = distances[idx]
-        p = CACHED_GRID.iloc[idx].replace({np.nan: None}).to_dict()
+        p, dist = lookup_point(u_lat, u_lon, grid_actual)
 
         # HOMOLOGACIÓN
         o3_val = get_smart_val(p, ['o3', 'o3 1h', 'o3_1h'])
@@ -176,24 +464,23 @@ def lambda_handler(event, context):
             grid_lat, grid_lon = p.get('lat', 0.0), p.get('lon', 0.0)
             geo_key = f"{round(grid_lat, 3)},{round(grid_lon, 3)}"
             
-            # Descarga concurrente
-            with ThreadPoolExecutor(max_workers=3) as executor:
-                f_ayer = executor.submit(get_s3_gzip_json, f"daily_summaries/summary_{ayer_str}.json.gz")
-                f_hoy = executor.submit(get_s3_gzip_json, "daily_summaries/summary_today.json.gz")
-                f_futuro = executor.submit(get_s3_gzip_json, "forecast_summary/latest_forecast.json.gz")
-                res_ayer, res_hoy, res_futuro = f_ayer.result(), f_hoy.result(), f_futuro.result()
+            # Caché de resúmenes en RAM; solo en frío (o muy viejos) se leen de S3, en paralelo
+            f_ayer = SUMMARY_EXECUTOR.submit(get_summary_cell, f"daily_summaries/summary_{ayer_str}.json.gz", geo_key)
+            f_hoy = SUMMARY_EXECUTOR.submit(get_summary_cell, "daily_summaries/summary_today.json.gz", geo_key)
+            f_futuro = SUMMARY_EXECUTOR.submit(get_summary_cell, "forecast_summary/latest_forecast.json.gz", geo_key)
+            (cell_ayer, _), (cell_hoy, attrs_hoy), (cell_futuro, attrs_futuro) = f_ayer.result(), f_hoy.result(), f_futuro.result()
             
             # Asignaciones
-            if res_ayer and "celdas" in res_ayer and geo_key in res_ayer["celdas"]:
-                vector_ayer = res_ayer["celdas"][geo_key]
+            if cell_ayer is not None:
+                vector_ayer = cell_ayer
                 
-            if res_hoy and "celdas" in res_hoy and geo_key in res_hoy["celdas"]:
-                vector_hoy = res_hoy["celdas"][geo_key]
-                meta_hoy_hora = res_hoy.get("ultima_hora_procesada")
+            if cell_hoy is not None:
+                vector_hoy = cell_hoy
+                meta_hoy_hora = attrs_hoy.get("ultima_hora_procesada")
                 
-            if res_futuro and "celdas" in res_futuro and geo_key in res_futuro["celdas"]:
-                vector_futuro = res_futuro["celdas"][geo_key]
-                meta_futuro_start = res_futuro.get("timestamp_start")
+            if cell_futuro is not None:
+                vector_futuro = cell_futuro
+                meta_futuro_start = attrs_futuro.get("timestamp_start")
                 
         except Exception as e:
             print(f"⚠️ Error extrayendo trinidad de vectores: {e}")
@@ -0,0 +1,63 @@
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+import lambda_function as api
+
+# --- PRUEBA DE CARGA: CONSULTA DE PUNTO (lat/lon -> celda) ---
+# Llegadas a ritmo fijo (lazo abierto, 1 consulta cada 1/qps s). La latencia se mide desde la
+# llegada programada, así que incluye la cola si el servicio no alcanza el ritmo.
+# Uso (no va en la imagen Docker):
+#   python load_test.py                      -> grid vigente desde S3
+#   python load_test.py latest_grid.json     -> grid local
+#   python load_test.py latest_grid.json 1000 5
+
+def load_grid(path=None):
+    if path:
+        with open(path) as f:
+            api.set_cached_grid(pd.DataFrame(json.load(f)), {'key': None, 'etag': None, 'last_modified': None})
+        return api.CACHED_GRID
+    return api.get_grid_data()
+
+
+def run(grid, points, qps):
+    period = 1.0 / qps
+    latencies = np.empty(len(points))
+    start = time.perf_counter()
+    for i, (la, lo) in enumerate(points):
+        arrival = start + i * period
+        while time.perf_counter() < arrival: pass
+        api.lookup_point(la, lo, grid)
+        latencies[i] = time.perf_counter() - arrival
+    return latencies
+
+
+def main(path=None, qps=1000, seconds=5):
+    grid = load_grid(path)
+    if grid is None:
+        print("❌ Sin grid para la prueba")
+        return 1
+    rng = np.random.default_rng(0)
+    n = int(qps * seconds)
+    points = np.c_[rng.uniform(api.LIMITS['LAT_MIN'], api.LIMITS['LAT_MAX'], n),
+                   rng.uniform(api.LIMITS['LON_MIN'], api.LIMITS['LON_MAX'], n)]
+
+    index = api.POINT_INDEX
+    results = {}
+    for name, ix in (('barrido haversine', None), ('índice espacial', index)):
+        api.POINT_INDEX = ix
+        run(grid, points[:200], qps) # calentamiento
+        results[name] = run(grid, points, qps) * 1000
+    api.POINT_INDEX = index
+
+    print(f"📊 Consulta de punto: {len(grid)} celdas, {n} consultas a {qps} qps")
+    for name, lat_ms in results.items():
+        p50, p99 = np.percentile(lat_ms, [50, 99])
+        print(f"   {name:18s}: p50 {p50:7.3f} ms | p99 {p99:8.3f} ms | máx {lat_ms.max():8.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    sys.exit(main(args[0] if args else None, int(args[1]) if len(args) > 1 else 1000, float(args[2]) if len(args) > 2 else 5))
@@ -0,0 +1,170 @@
+import json
+import struct
+import numpy as np
+
+# --- 1. FORMATO BINARIO DE RESÚMENES (ayer / hoy / forecast) ---
+# Layout (little endian):
+#   HEADER FIJO  : magic(8) | version u32 | meta_len u32 | n_cells u32 | n_hours u32 | record_size u32 | index_offset u32 | data_offset u32
+#   META JSON    : atributos del resumen (fecha, ultima_hora_procesada, ...) + especificación de params
+#   ÍNDICE       : int64[n_cells] ordenado -> lat_milli * 10^6 + lon_milli (una entrada por celda)
+#   DATOS        : n_cells registros de record_size bytes, mismo orden que el índice
+# Un registro = los 24 valores de cada param, contiguos. Con el índice en memoria, una
+# celda se lee con un solo byte-range GET (o un slice del resumen ya en memoria).
+
+SUMMARY_MAGIC = b"SMSUM001"
+SUMMARY_VERSION = 1
+SUMMARY_FIXED_HEADER = struct.Struct('<8s7I')
+SUMMARY_ALIGN = 8
+INT16_NULL = -32768
+
+# Especificación por tipo de resumen: (nombre, dtype, escala | categorías)
+SUMMARY_SPECS = {
+    'daily': [
+        {'name': 'pm25_12h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'o3_1h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'pm10_12h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'ias', 'dtype': 'int16', 'scale': 10}
+    ],
+    'today': [
+        {'name': 'ias', 'dtype': 'int16', 'scale': 1},
+        {'name': 'pm25_12h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'pm10_12h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'o3_1h', 'dtype': 'int16', 'scale': 10}
+    ],
+    'forecast': [
+        {'name': 'ias', 'dtype': 'int16', 'scale': 1},
+        {'name': 'o3_1h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'pm10_12h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'pm25_12h', 'dtype': 'int16', 'scale': 10},
+        {'name': 'dominante', 'dtype': 'int8', 'categories': ['N/A', 'O3', 'PM10', 'PM2.5', 'CO', 'SO2']}
+    ]
+}
+
+
+def geo_key_to_code(geo_key):
+    """'19.772,-99.351' -> 19772 * 10^6 + (-99351)"""
+    lat_s, lon_s = geo_key.split(',')
+    return int(round(float(lat_s) * 1000)) * 1_000_000 + int(round(float(lon_s) * 1000))
+
+
+def _align(n):
+    return (n + SUMMARY_ALIGN - 1) // SUMMARY_ALIGN * SUMMARY_ALIGN
+
+
+# --- 2. ESCRITURA ---
+def encode_summary(resumen, kind, n_hours=24):
+    """Convierte el dict JSON {'celdas': {geo_key: {param: [24]}}} al formato binario"""
+    spec = SUMMARY_SPECS[kind]
+    celdas = resumen.get('celdas', {})
+    keys = list(celdas)
+    codes = np.array([geo_key_to_code(k) for k in keys], dtype=np.int64)
+    order = np.argsort(codes, kind='stable')
+
+    record_dtype = np.dtype([(p['name'], np.dtype(p['dtype']).newbyteorder('<'), (n_hours,)) for p in spec])
+    records = np.zeros(len(keys), dtype=record_dtype)
+    for p in spec:
+        name = p['name']
+        if 'categories' in p:
+            lookup = {c: i for i, c in enumerate(p['categories'])}
+            values = [[lookup.get(v, 0) for v in (celdas[k].get(name) or [])[:n_hours]] for k in keys]
+        else:
+            values = [[INT16_NULL if v is None else int(round(float(v) * p['scale']))
+                       for v in (celdas[k].get(name) or [])[:n_hours]] for k in keys]
+        column = np.full((len(keys), n_hours), 0 if 'categories' in p else INT16_NULL, dtype=np.int64)
+        for i, row in enumerate(values):
+            column[i, :len(row)] = row
+        if 'categories' not in p:
+            valid = column != INT16_NULL
+            column[valid] = np.clip(column[valid], INT16_NULL + 1, 32767)
+        records[name] = column
+
+    meta = {k: v for k, v in resumen.items() if k != 'celdas'}
+    meta_bytes = json.dumps({'kind': kind, 'params': spec, 'attrs': meta}, ensure_ascii=False).encode('utf-8')
+    index_offset = _align(SUMMARY_FIXED_HEADER.size + len(meta_bytes))
+    data_offset = _align(index_offset + 8 * len(keys))
+
+    out = bytearray(data_offset + record_dtype.itemsize * len(keys))
+    SUMMARY_FIXED_HEADER.pack_into(out, 0, SUMMARY_MAGIC, SUMMARY_VERSION, len(meta_bytes), len(keys),
+                                   n_hours, record_dtype.itemsize, index_offset, data_offset)
+    out[SUMMARY_FIXED_HEADER.size:SUMMARY_FIXED_HEADER.size + len(meta_bytes)] = meta_bytes
+    out[index_offset:index_offset + 8 * len(keys)] = codes[order].astype('<i8').tobytes()
+    out[data_offset:] = records[order].tobytes()
+    return bytes(out)
+
+
+# --- 3. LECTURA ---
+class SummaryHeader:
+    """Header + índice de un resumen binario (se puede cachear por ETag)"""
+
+    def __init__(self, buf):
+        magic, version, meta_len, n_cells, n_hours, record_size, index_offset, data_offset = \
+            SUMMARY_FIXED_HEADER.unpack_from(buf, 0)
+        if magic != SUMMARY_MAGIC or version != SUMMARY_VERSION:
+            raise ValueError("Resumen binario inválido o de otra versión")
+        meta = json.loads(bytes(buf[SUMMARY_FIXED_HEADER.size:SUMMARY_FIXED_HEADER.size + meta_len]).decode('utf-8'))
+        self.kind = meta['kind']
+        self.params = meta['params']
+        self.attrs = meta['attrs']
+        self.n_cells = n_cells
+        self.n_hours = n_hours
+        self.record_size = record_size
+        self.data_offset = data_offset
+        self.index = np.frombuffer(bytes(buf[index_offset:index_offset + 8 * n_cells]), dtype='<i8')
+        self.record_dtype = np.dtype([(p['name'], np.dtype(p['dtype']).newbyteorder('<'), (n_hours,)) for p in self.params])
+
+    @staticmethod
+    def required_bytes(buf):
+        """Bytes necesarios (header + índice) a partir de los primeros SUMMARY_FIXED_HEADER.size bytes"""
+        _, _, _, n_cells, _, _, index_offset, _ = SUMMARY_FIXED_HEADER.unpack_from(buf, 0)
+        return index_offset + 8 * n_cells
+
+    def locate(self, geo_key):
+        """Rango de bytes (inicio, fin inclusivo) del registro de la celda, o None"""
+        code = geo_key_to_code(geo_key)
+        i = int(np.searchsorted(self.index, code))
+        if i >= self.n_cells or self.index[i] != code:
+            return None
+        start = self.data_offset + i * self.record_size
+        return start, start + self.record_size - 1
+
+    def decode_record(self, record_bytes):
+        """Registro binario -> {param: [24 valores]} con la misma forma que el JSON"""
+        rec = np.frombuffer(record_bytes, dtype=self.record_dtype, count=1)[0]
+        cell = {}
+        for p in self.params:
+            raw = rec[p['name']].tolist()
+            if 'categories' in p:
+                cats = p['categories']
+                cell[p['name']] = [cats[v] if 0 <= v < len(cats) else 'N/A' for v in raw]
+            elif p['scale'] == 1:
+                cell[p['name']] = [None if v == INT16_NULL else v for v in raw]
+            else:
+                cell[p['name']] = [None if v == INT16_NULL else v / p['scale'] for v in raw]
+        return cell
+
+
+def code_to_geo_key(code):
+    """Inversa de geo_key_to_code (mismo texto que f"{round(lat, 3)},{round(lon, 3)}")"""
+    lat_milli = int(round(code / 1_000_000))
+    return f"{lat_milli / 1000},{(code - lat_milli * 1_000_000) / 1000}"
+
+
+def decode_summary(buf):
+    """Resumen binario completo -> dict con la misma forma que el JSON (atributos + 'celdas')"""
+    header = SummaryHeader(buf)
+    resumen = dict(header.attrs)
+    resumen['celdas'] = {}
+    for i, code in enumerate(header.index.tolist()):
+        start = header.data_offset + i * header.record_size
+        resumen['celdas'][code_to_geo_key(code)] = header.decode_record(bytes(buf[start:start + header.record_size]))
+    return resumen
+
+
+def read_cell(buf, geo_key, header=None):
+    """Lee una celda de un buffer completo (bytes o archivo mapeado). Regresa (celda|None, header)"""
+    header = header or SummaryHeader(buf)
+    rng = header.locate(geo_key)
+    if rng is None:
+        return None, header
+    return header.decode_record(bytes(buf[rng[0]:rng[1] + 1])), header
+
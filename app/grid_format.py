@@ -0,0 +1,162 @@
+import json
+import gzip
+import struct
+import hashlib
+import numpy as np
+import pandas as pd
+
+# --- 1. FORMATO COLUMNAR DEL GRID EN VIVO ---
+# Un grid = geometría inmutable (lat, lon, colonia, municipio, ...) + snapshot con los valores
+# que cambian en cada corrida. Ambos comparten el layout (little endian, todo dentro de gzip):
+#   HEADER FIJO : magic(8) | meta_len u32 | n_rows u32
+#   META JSON   : kind, attrs y una entrada por columna (codificación, dtype, escala, categorías, offset)
+#   COLUMNAS    : arreglos contiguos; la fila i de cualquier snapshot es la celda i de su geometría
+# Codificaciones: 'q' = entero escalado (int16, o int32 si no cabe), 'cat' = diccionario
+# (códigos int16, -1 = nulo), 'raw' = arreglo numérico tal cual (sin pérdida).
+# Cada arreglo se guarda por planos de bytes (byte 0 de todas las filas, luego byte 1, ...):
+# celdas vecinas tienen valores parecidos y gzip comprime mejor los planos altos.
+
+GRID_MAGIC = b"SMGRD001"
+GRID_FIXED_HEADER = struct.Struct('<8sII')
+GRID_ALIGN = 8
+GEOMETRY_PREFIX = "live_grid/geometry/"
+
+# Columnas que no cambian entre corridas (van a la geometría, se suben una sola vez)
+STATIC_COLUMNS = ['lat', 'lon', 'col', 'mun', 'edo', 'pob', 'altitude', 'building_vol']
+# Escala de cuantización de los valores dinámicos (mismo criterio que SUMMARY_SPECS)
+SNAPSHOT_SCALES = {
+    'tmp': 100, 'rh': 100, 'wsp': 100, 'wdr': 10,
+    'o3 1h': 10, 'pm10 12h': 10, 'pm25 12h': 10, 'co 8h': 100, 'so2 1h': 10,
+    'ias': 10
+}
+NULLS = {'int16': np.iinfo(np.int16).min, 'int32': np.iinfo(np.int32).min}
+
+
+def _align(n):
+    return (n + GRID_ALIGN - 1) // GRID_ALIGN * GRID_ALIGN
+
+
+def _shuffle(arr):
+    return arr.view(np.uint8).reshape(-1, arr.itemsize).T.tobytes()
+
+
+def _unshuffle(raw, offset, dtype, n_rows):
+    planes = np.frombuffer(raw, dtype=np.uint8, count=n_rows * dtype.itemsize, offset=offset)
+    return planes.reshape(dtype.itemsize, n_rows).T.copy().view(dtype).ravel()
+
+
+# --- 2. ESCRITURA ---
+def _encode_column(series, scale=None):
+    """Regresa (entrada de meta, bytes) para una columna"""
+    if scale is not None:
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+        valid = np.isfinite(values)
+        scaled = np.round(values[valid] * scale)
+        fits16 = scaled.size == 0 or (scaled.min() > NULLS['int16'] and scaled.max() <= np.iinfo(np.int16).max)
+        dtype = 'int16' if fits16 else 'int32'
+        column = np.full(len(values), NULLS[dtype], dtype=dtype)
+        column[valid] = scaled.astype(dtype)
+        return {'enc': 'q', 'dtype': dtype, 'scale': scale}, _shuffle(column.astype(np.dtype(dtype).newbyteorder('<')))
+
+    if not pd.api.types.is_numeric_dtype(series):
+        values = series.tolist()
+        missing = series.isna().to_numpy()
+        categories, codes = [], np.full(len(values), -1, dtype='<i2')
+        lookup = {}
+        for i, v in enumerate(values):
+            if missing[i]: continue
+            code = lookup.get(v)
+            if code is None:
+                code = lookup[v] = len(categories)
+                categories.append(v)
+            codes[i] = code
+        if len(categories) > np.iinfo(np.int16).max:
+            raise ValueError(f"Demasiadas categorías en '{series.name}' ({len(categories)})")
+        return {'enc': 'cat', 'dtype': 'int16', 'categories': categories}, _shuffle(codes)
+
+    column = series.to_numpy()
+    dtype = column.dtype.newbyteorder('<')
+    return {'enc': 'raw', 'dtype': dtype.str}, _shuffle(column.astype(dtype))
+
+
+def encode_columns(df, kind, scales=None, attrs=None, level=6):
+    """DataFrame -> bytes gzip en formato columnar (columnas en el orden del DataFrame)"""
+    scales = scales or {}
+    entries, blobs, offset = [], [], 0
+    for name in df.columns:
+        entry, data = _encode_column(df[name], scales.get(name))
+        entry.update({'name': name, 'offset': offset, 'nbytes': len(data)})
+        entries.append(entry)
+        padded = _align(len(data))
+        blobs.append(data + b'\0' * (padded - len(data)))
+        offset += padded
+
+    meta = json.dumps({'kind': kind, 'attrs': attrs or {}, 'columns': entries}, ensure_ascii=False).encode('utf-8')
+    meta += b' ' * (_align(GRID_FIXED_HEADER.size + len(meta)) - GRID_FIXED_HEADER.size - len(meta))
+    raw = GRID_FIXED_HEADER.pack(GRID_MAGIC, len(meta), len(df)) + meta + b''.join(blobs)
+    return gzip.compress(raw, compresslevel=level)
+
+
+def split_grid(final_df):
+    """Grid completo -> (geometría, valores dinámicos)"""
+    dynamic = [c for c in final_df.columns if c not in STATIC_COLUMNS]
+    return final_df[STATIC_COLUMNS], final_df[dynamic]
+
+
+def encode_geometry(final_df):
+    """Geometría sin pérdida y su llave S3 (hash de contenido: el archivo nunca se sobrescribe)"""
+    static_df, _ = split_grid(final_df)
+    body = encode_columns(static_df.reset_index(drop=True), 'geometry', level=9)
+    digest = hashlib.sha256(gzip.decompress(body)).hexdigest()[:16]
+    return f"{GEOMETRY_PREFIX}geometry_{digest}.cols.gz", body
+
+
+def encode_snapshot(final_df, geometry_key, attrs=None):
+    """Solo los valores que cambian, cuantizados; 'order' guarda el orden original de columnas"""
+    _, dynamic_df = split_grid(final_df)
+    attrs = {**(attrs or {}), 'geometry_key': geometry_key, 'order': list(final_df.columns)}
+    return encode_columns(dynamic_df.reset_index(drop=True), 'snapshot', scales=SNAPSHOT_SCALES, attrs=attrs)
+
+
+# --- 3. LECTURA ---
+def decode_columns(body):
+    """bytes gzip -> (dict nombre -> arreglo/lista, meta)"""
+    raw = gzip.decompress(body)
+    magic, meta_len, n_rows = GRID_FIXED_HEADER.unpack_from(raw, 0)
+    if magic != GRID_MAGIC:
+        raise ValueError(f"Grid columnar inválido (magic {magic!r})")
+    meta = json.loads(raw[GRID_FIXED_HEADER.size:GRID_FIXED_HEADER.size + meta_len].decode('utf-8'))
+    base = GRID_FIXED_HEADER.size + meta_len
+    columns = {}
+    for c in meta['columns']:
+        arr = _unshuffle(raw, base + c['offset'], np.dtype(c['dtype']).newbyteorder('<'), n_rows)
+        if c['enc'] == 'q':
+            values = arr.astype(float) / c['scale']
+            values[arr == NULLS[c['dtype']]] = np.nan
+            columns[c['name']] = values
+        elif c['enc'] == 'cat':
+            lookup = np.array(c['categories'] + [None], dtype=object)
+            columns[c['name']] = lookup[arr]  # -1 -> None (último elemento)
+        else:
+            columns[c['name']] = arr
+    meta['n_rows'] = n_rows
+    return columns, meta
+
+
+def to_frame(geometry, snapshot):
+    """
+    (geometría, snapshot) decodificados -> DataFrame con las columnas del grid original.
+    Ambos argumentos son la salida de decode_columns.
+    """
+    geo_cols, geo_meta = geometry
+    snap_cols, snap_meta = snapshot
+    if geo_meta['n_rows'] != snap_meta['n_rows']:
+        raise ValueError(f"Geometría ({geo_meta['n_rows']}) y snapshot ({snap_meta['n_rows']}) no coinciden")
+    merged = {**geo_cols, **snap_cols}
+    order = snap_meta['attrs'].get('order') or list(merged)
+    return pd.DataFrame({name: merged[name] for name in order})
+
+
+def to_records(df):
+    """DataFrame -> lista de dicts como el latest_grid.json (NaN -> None)"""
+    return json.loads(df.to_json(orient='records'))
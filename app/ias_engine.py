@@ -0,0 +1,197 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# --- 1. NORMATIVIDAD (IAS - NOM-172-SEMARNAT-2019) ---
+# Tablas canónicas compartidas por el Predictor Live y el Forecast Engine.
+# Formato: (C_lo, C_hi, I_lo, I_hi)
+
+# O3 (1h) - Unidades: ppb
+BPS_O3 = [(0,58,0,50), (59,92,51,100), (93,135,101,150), (136,175,151,200), (176,240,201,300)]
+# PM10 (Promedio) - Unidades: µg/m³
+BPS_PM10 = [(0,45,0,50), (46,60,51,100), (61,132,101,150), (133,213,151,200), (214,354,201,300)]
+# PM2.5 (Promedio) - Unidades: µg/m³
+BPS_PM25 = [(0,25,0,50), (26,45,51,100), (46,79,101,150), (80,147,151,200), (148,250,201,300)]
+# CO (8h) - Unidades: ppm
+BPS_CO = [(0, 8.75, 0, 50), (8.76, 11.00, 51, 100), (11.01, 13.30, 101, 150), (13.31, 15.50, 151, 200), (15.51, 20.00, 201, 300)]
+# SO2 (1h) - Unidades: ppb
+BPS_SO2 = [(0, 40, 0, 50), (41, 75, 51, 100), (76, 185, 101, 150), (186, 304, 151, 200), (305, 500, 201, 300)]
+
+POLLUTANT_BPS = {'o3': BPS_O3, 'pm10': BPS_PM10, 'pm25': BPS_PM25, 'co': BPS_CO, 'so2': BPS_SO2}
+# Etiqueta que se publica en 'dominant' (el orden define el desempate)
+POLLUTANT_LABELS = {'o3': 'O3', 'pm10': 'PM10', 'pm25': 'PM2.5', 'co': 'CO', 'so2': 'SO2'}
+
+RISK_LEVELS = ["Bajo", "Moderado", "Alto", "Muy Alto", "Extremadamente Alto"]
+RISK_EDGES = np.array([50, 100, 150, 200], dtype=np.float64)
+
+
+def get_ias_score(c, pollutant):
+    """Calcula el índice Aire y Salud (IAS) interpolado (versión escalar de referencia)"""
+    try:
+        c = float(c)
+        bps = POLLUTANT_BPS.get(pollutant)
+        if bps is None: return 0
+
+        for (c_lo, c_hi, i_lo, i_hi) in bps:
+            if c <= c_hi:
+                return i_lo + ((c - c_lo) / (c_hi - c_lo)) * (i_hi - i_lo)
+        return bps[-1][3] # Saturación máxima (Riesgo Extremo)
+    except: return 0
+
+def get_risk_level(ias):
+    if ias <= 50: return "Bajo"
+    if ias <= 100: return "Moderado"
+    if ias <= 150: return "Alto"
+    if ias <= 200: return "Muy Alto"
+    return "Extremadamente Alto"
+
+
+# --- 2. TABLAS COMPILADAS (una vez por contenedor) ---
+def _compile_bps(bps):
+    table = np.array(bps, dtype=np.float64)
+    return {
+        'c_lo': table[:, 0],
+        'c_hi': table[:, 1],
+        'i_lo': table[:, 2],
+        'i_hi': table[:, 3],
+        'i_max': table[-1, 3]
+    }
+
+_COMPILED_BPS = {p: _compile_bps(bps) for p, bps in POLLUTANT_BPS.items()}
+
+
+def _as_float(values):
+    """
+    Convierte una columna a float64 respetando las reglas de get_ias_score:
+    NaN satura (no pasa ningún 'c <= c_hi'), lo no convertible vale 0.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind in 'fiub':
+        return arr.astype(np.float64), None
+
+    conv = pd.to_numeric(pd.Series(arr, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    is_real_nan = np.array([isinstance(v, float) and v != v for v in arr], dtype=bool)
+    invalid = np.isnan(conv) & ~is_real_nan
+    return conv, invalid
+
+
+# --- 3. MOTOR VECTORIZADO ---
+def ias_scores(values, pollutant):
+    """IAS por celda para un contaminante sobre la columna completa"""
+    c, invalid = _as_float(values)
+    bps = _COMPILED_BPS.get(pollutant)
+    if bps is None:
+        return np.zeros(c.shape, dtype=np.float64)
+
+    # Primer tramo cuyo C_hi >= c (misma regla que el 'for' escalar)
+    seg = np.searchsorted(bps['c_hi'], c, side='left')
+    saturated = seg >= len(bps['c_hi'])
+    seg = np.minimum(seg, len(bps['c_hi']) - 1)
+
+    c_lo, c_hi = bps['c_lo'][seg], bps['c_hi'][seg]
+    i_lo, i_hi = bps['i_lo'][seg], bps['i_hi'][seg]
+    # Mismo orden de operaciones que la versión escalar -> resultado bit a bit idéntico
+    scores = i_lo + ((c - c_lo) / (c_hi - c_lo)) * (i_hi - i_lo)
+    scores = np.where(saturated, bps['i_max'], scores)
+    if invalid is not None:
+        scores = np.where(invalid, 0.0, scores)
+    return scores
+
+
+def compute_ias(columns, pollutants=('o3', 'pm10', 'pm25')):
+    """
+    Calcula IAS máximo, contaminante dominante y nivel de riesgo.
+    columns: DataFrame o dict {contaminante: array}. Acepta cualquier forma
+    (celdas, horas × celdas, ...) mientras todas las columnas coincidan.
+    Regresa (ias, dominant_codes, risk_codes); los códigos indexan
+    dominant_categories(pollutants) y RISK_LEVELS.
+    """
+    scores = np.stack([ias_scores(np.asarray(columns[p]), p) for p in pollutants], axis=-1)
+    dominant_codes = np.argmax(scores, axis=-1).astype(np.int8)
+    ias = np.take_along_axis(scores, dominant_codes[..., None].astype(np.intp), axis=-1)[..., 0]
+    risk_codes = np.searchsorted(RISK_EDGES, ias, side='left').astype(np.int8)
+    return ias, dominant_codes, risk_codes
+
+
+def dominant_categories(pollutants=('o3', 'pm10', 'pm25')):
+    return [POLLUTANT_LABELS[p] for p in pollutants]
+
+
+def apply_ias(df, pollutants=('o3', 'pm10', 'pm25')):
+    """Escribe 'ias', 'dominant' y 'risk' en el DataFrame (columnas categóricas)"""
+    ias, dominant_codes, risk_codes = compute_ias(df, pollutants)
+    df['ias'] = ias
+    df['dominant'] = pd.Categorical.from_codes(dominant_codes, categories=dominant_categories(pollutants))
+    df['risk'] = pd.Categorical.from_codes(risk_codes, categories=RISK_LEVELS)
+    return df
+
+
+# --- 4. BENCHMARK CONTRA LA RUTA FILA POR FILA ---
+def _rowwise_reference(df, pollutants):
+    """Ruta original: DataFrame.apply(axis=1) + get_ias_score por celda"""
+    labels = dominant_categories(pollutants)
+
+    def calc_ias_row(row):
+        scores = {label: get_ias_score(row[p], p) for p, label in zip(pollutants, labels)}
+        dom_pol = max(scores, key=scores.get)
+        return pd.Series([max(scores.values()), dom_pol])
+
+    out = pd.DataFrame(index=df.index)
+    out[['ias', 'dominant']] = df.apply(calc_ias_row, axis=1)
+    out['risk'] = out['ias'].apply(get_risk_level)
+    return out
+
+
+def _synthetic_grid(n_cells, hours, seed):
+    """Concentraciones que recorren todos los tramos, huecos entre tramos y saturación"""
+    rng = np.random.default_rng(seed)
+    n = n_cells * hours
+    data = {}
+    for p, bps in POLLUTANT_BPS.items():
+        top = bps[-1][1]
+        vals = rng.uniform(0, top * 1.2, n)
+        # Forzamos valores exactos en bordes y en los huecos (p.ej. 58 < c < 59 para O3)
+        edges = np.array([b[1] for b in bps] + [b[0] for b in bps] + [b[1] + 0.5 for b in bps[:-1]])
+        vals[:len(edges)] = edges
+        vals[len(edges)] = np.nan
+        data[p] = vals
+    return pd.DataFrame(data)
+
+
+def benchmark(n_cells=2928, hours=24, pollutants=('o3', 'pm10', 'pm25', 'co', 'so2'), seed=0):
+    """Compara la ruta vectorizada vs. la fila por fila y exige salida idéntica"""
+    df = _synthetic_grid(n_cells, hours, seed)
+    pollutants = list(pollutants)
+
+    t0 = time.perf_counter()
+    ref = _rowwise_reference(df, pollutants)
+    t_row = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for h in range(hours):
+        # Misma granularidad que el forecast: una llamada por hora
+        compute_ias(df.iloc[h * n_cells:(h + 1) * n_cells], pollutants)
+    t_hourly = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ias, dominant_codes, risk_codes = compute_ias(df, pollutants)
+    t_vec = time.perf_counter() - t0
+
+    ref_ias = ref['ias'].astype(np.float64).to_numpy()
+    assert np.array_equal(ias.view(np.int64), ref_ias.view(np.int64)), "IAS difiere de la ruta fila por fila"
+    labels = np.array(dominant_categories(pollutants), dtype=object)
+    assert (labels[dominant_codes] == ref['dominant'].to_numpy(dtype=object)).all(), "Dominante difiere"
+    levels = np.array(RISK_LEVELS, dtype=object)
+    assert (levels[risk_codes] == ref['risk'].to_numpy(dtype=object)).all(), "Riesgo difiere"
+
+    print(f"📊 IAS {n_cells}×{hours} ({len(df)} filas, {len(pollutants)} gases) -> salida idéntica bit a bit")
+    print(f"   Fila por fila : {t_row * 1000:9.1f} ms")
+    print(f"   Vector x hora : {t_hourly * 1000:9.1f} ms ({t_row / t_hourly:,.0f}x)")
+    print(f"   Vector único  : {t_vec * 1000:9.1f} ms ({t_row / t_vec:,.0f}x)")
+    return {'rowwise_s': t_row, 'hourly_s': t_hourly, 'vectorized_s': t_vec}
+
+
+if __name__ == '__main__':
+    benchmark()
+    sys.exit(0)
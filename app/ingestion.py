@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- 1. CONFIGURACIÓN ---
+# Umbral de fallos seguidos para abrir el circuito y segundos que se queda abierto
+BREAKER_FAILURES = int(os.environ.get('INGEST_BREAKER_FAILURES', '3'))
+BREAKER_COOLDOWN = float(os.environ.get('INGEST_BREAKER_COOLDOWN', '600'))
+# Latencias recientes por fuente para estimar el p95 (disparo del hedge)
+LATENCY_WINDOW = 50
+MIN_HEDGE_SAMPLES = 5
+MIN_HEDGE_AFTER = 0.5
+
+# Pool compartido entre invocaciones 'warm': las peticiones perdedoras de un hedge
+# terminan en segundo plano sin bloquear la corrida
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+# Pool aparte para orquestar fuentes en paralelo (evita que compitan con sus propias peticiones)
+_ORCHESTRATOR = ThreadPoolExecutor(max_workers=4)
+_STATE_LOCK = threading.Lock()
+_SOURCES = {}  # nombre -> {'latencies': [...], 'failures': int, 'open_until': epoch}
+
+
+def new_session(pool_size=8):
+    """Session keep-alive (TLS y DNS se reutilizan entre invocaciones del contenedor)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# --- 2. RESULTADO ---
+class FetchResult:
+    def __init__(self, source, data=None, error=None, status_code=None, latency_ms=0.0, attempts=0, skipped=False):
+        self.source = source
+        self.data = data
+        self.error = error
+        self.status_code = status_code
+        self.latency_ms = latency_ms
+        self.attempts = attempts
+        self.skipped = skipped
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def json(self):
+        """Payload o la excepción original (para que el llamador aplique su propio fallback)"""
+        if self.error is not None:
+            raise self.error if isinstance(self.error, Exception) else RuntimeError(self.error)
+        return self.data
+
+    def describe(self):
+        if self.skipped: return f"{self.source}: circuito abierto (omitida)"
+        state = "ok" if self.ok else f"error ({self.error})"
+        return f"{self.source}: {state} en {self.latency_ms:.0f} ms, {self.attempts} intento(s)"
+
+
+# --- 3. ESTADO POR FUENTE (latencias + circuit breaker) ---
+def _state(name):
+    with _STATE_LOCK:
+        return _SOURCES.setdefault(name, {'latencies': [], 'failures': 0, 'open_until': 0.0})
+
+
+def _hedge_after(name, budget):
+    """p95 de las latencias exitosas recientes; sin historial, 60% del presupuesto"""
+    lat = _state(name)['latencies']
+    if len(lat) < MIN_HEDGE_SAMPLES:
+        return budget * 0.6
+    return float(np.clip(np.percentile(lat, 95), MIN_HEDGE_AFTER, budget * 0.8))
+
+
+def _record(name, ok, latency_s):
+    st = _state(name)
+    with _STATE_LOCK:
+        if ok:
+            st['failures'] = 0
+            st['open_until'] = 0.0
+            st['latencies'] = (st['latencies'] + [latency_s])[-LATENCY_WINDOW:]
+        else:
+            st['failures'] += 1
+            if st['failures'] >= BREAKER_FAILURES:
+                st['open_until'] = time.time() + BREAKER_COOLDOWN
+
+
+def circuit_open(name):
+    """Abierto = saltar la fuente. Al vencer el cooldown se permite un intento (half-open)."""
+    return time.time() < _state(name)['open_until']
+
+
+def source_stats():
+    """Resumen para logs: p95, fallos seguidos y estado del circuito por fuente"""
+    out = {}
+    for name, st in list(_SOURCES.items()):
+        lat = st['latencies']
+        out[name] = {
+            'p95_ms': round(float(np.percentile(lat, 95)) * 1000, 1) if lat else None,
+            'failures': st['failures'],
+            'circuit': 'open' if circuit_open(name) else 'closed'
+        }
+    return out
+
+
+# --- 4. PETICIÓN CON PRESUPUESTO + HEDGE ---
+def _get_json(http, url, timeout, accept_status):
+    resp = http.get(url, timeout=timeout)
+    if accept_status is not None and resp.status_code != accept_status:
+        raise requests.HTTPError(f"HTTP {resp.status_code}")
+    if accept_status is None:
+        resp.raise_for_status()
+    return resp.status_code, resp.json()
+
+
+def fetch_json(http, name, url, budget, hedge=True, accept_status=200):
+    """
+    GET con presupuesto total 'budget' (s). Si la primera petición no responde antes del
+    p95 histórico de la fuente, se lanza una segunda idéntica y gana la primera que termine bien.
+    """
+    if circuit_open(name):
+        return FetchResult(name, error=RuntimeError(f"Circuito abierto para {name}"), skipped=True)
+
+    t0 = time.perf_counter()
+    deadline = t0 + budget
+    pending = {_EXECUTOR.submit(_get_json, http, url, budget, accept_status)}
+    attempts = 1
+    hedge_at = t0 + _hedge_after(name, budget) if hedge else None
+    last_error = None
+
+    while pending:
+        now = time.perf_counter()
+        if now >= deadline: break
+        next_wake = deadline if hedge_at is None else min(deadline, hedge_at)
+        done, pending = wait(pending, timeout=max(0.0, next_wake - now), return_when=FIRST_COMPLETED)
+
+        for fut in done:
+            try:
+                status, data = fut.result()
+                latency = time.perf_counter() - t0
+                _record(name, True, latency)
+                return FetchResult(name, data=data, status_code=status, latency_ms=latency * 1000, attempts=attempts)
+            except Exception as e:
+                last_error = e
+
+        if hedge_at is not None and time.perf_counter() >= hedge_at:
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                pending.add(_EXECUTOR.submit(_get_json, http, url, remaining, accept_status))
+                attempts += 1
+            hedge_at = None
+        elif not pending and hedge_at is not None:
+            # Falló rápido antes del hedge: un reintento inmediato con lo que queda de presupuesto
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                pending.add(_EXECUTOR.submit(_get_json, http, url, remaining, accept_status))
+                attempts += 1
+            hedge_at = None
+
+    latency = time.perf_counter() - t0
+    _record(name, False, latency)
+    error = last_error or requests.Timeout(f"{name}: sin respuesta en {budget:.1f}s")
+    return FetchResult(name, error=error, latency_ms=latency * 1000, attempts=attempts)
+
+
+def fetch_all(http, requests_spec):
+    """
+    Lanza todas las fuentes en paralelo. requests_spec: {nombre: dict(url=..., budget=..., ...)}
+    Regresa {nombre: FetchResult} cuando termina la más lenta (cada una acotada por su presupuesto).
+    """
+    futures = {name: _ORCHESTRATOR.submit(fetch_json, http, name, **spec) for name, spec in requests_spec.items()}
+    return {name: fut.result() for name, fut in futures.items()}
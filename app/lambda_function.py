@@ -2,14 +2,26 @@ import json
 import boto3
 import pandas as pd
 import numpy as np
-import xgboost as xgb
-import requests
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import os
-from scipy.spatial import cKDTree
-from scipy.interpolate import griddata # <--- Movido aquí arriba (Buena práctica)
+import time
 import gzip
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from app.grid_store import get_static_grid, get_grid_tree
+from app.ias_engine import apply_ias
+from app.model_registry import get_models
+from app.inference_engine import build_feature_matrix, predict_all
+from app.summary_format import encode_summary, decode_summary
+from app.grid_format import encode_geometry, encode_snapshot, decode_columns, to_frame, to_records, STATIC_COLUMNS
+from app.spatial_interp import interpolate_fields
+from app.stage_metrics import StageTimer, ProfileSession
+from app.ingestion import new_session, fetch_all
+from app import station_cache
+from app.simat_parser import parse_stations
 
 # --- 1. CONFIGURACIÓN Y RUTAS ---
 BASE_PATH = os.environ.get('LAMBDA_TASK_ROOT', '/var/task')
@@ -29,34 +41,153 @@ MODEL_PATH_CO   = f"{BASE_PATH}/app/artifacts/model_co.json"   # <--- NUEVO
 MODEL_PATH_SO2  = f"{BASE_PATH}/app/artifacts/model_so2.json"  # <--- NUEVO
 STATIC_ADMIN_PATH = f"{BASE_PATH}/app/geograficos/grid_admin_info.json"
 SMABILITY_API_URL = "https://y4zwdmw7vf.execute-api.us-east-1.amazonaws.com/prod/api/air-quality/current?type=reference,smaa"
+# Presupuesto total por fuente (s); ambas se piden en paralelo al inicio de la corrida
+SIMAT_TIMEOUT = float(os.environ.get('SIMAT_TIMEOUT', '15'))
+OPENMETEO_TIMEOUT = float(os.environ.get('OPENMETEO_TIMEOUT', '3'))
+# 15 Puntos Virtuales (OpenMeteo) para el respaldo meteorológico nocturno
+OPENMETEO_LATS = [19.5, 19.5, 19.5, 19.4, 19.4, 19.4, 19.3, 19.3, 19.3, 19.2, 19.2, 19.2, 19.6, 19.1, 19.4]
+OPENMETEO_LONS = [-99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.1, -99.1, -98.9]
+OPENMETEO_URL = (
+    f"https://api.open-meteo.com/v1/forecast?latitude={','.join(map(str, OPENMETEO_LATS))}"
+    f"&longitude={','.join(map(str, OPENMETEO_LONS))}"
+    "&current=temperature_2m,relative_humidity_2m,wind_speed_10m,wind_direction_10m&timezone=auto"
+)
 
-s3_client = boto3.client('s3')
+# Pool de conexiones suficiente para las descargas concurrentes del resumen diario
+s3_client = boto3.client('s3', config=Config(max_pool_connections=int(os.environ.get('S3_MAX_POOL', '16'))))
+# Salida HTTP (SIMAT y Open-Meteo): Session keep-alive que sobrevive entre invocaciones.
+# Cualquier objeto con .get(url, timeout=...) sirve (ver set_io_adapters)
+http_client = new_session()
 
-# --- 2. LÓGICA NORMATIVA NOM-172-2024 ---
-BPS_O3 = [(0,58,0,50), (59,92,51,100), (93,135,101,150), (136,175,151,200), (176,240,201,300)]
-BPS_PM10 = [(0,45,0,50), (46,60,51,100), (61,132,101,150), (133,213,151,200), (214,354,201,300)]
-BPS_PM25 = [(0,25,0,50), (26,45,51,100), (46,79,101,150), (80,147,151,200), (148,250,201,300)]
+def set_io_adapters(s3=None, http=None):
+    """Sustituye S3 y/o HTTP (replay offline con app/replay.py, pruebas locales)"""
+    global s3_client, http_client
+    if s3 is not None: s3_client = s3
+    if http is not None: http_client = http
+
+# --- FORMATO DE RESÚMENES ---
+# El .bin (tensor int16 + índice por celda) es lo que lee la API Ligera; el .json.gz
+# se sigue publicando mientras el frontend migra (SUMMARY_WRITE_JSON=0 para apagarlo)
+SUMMARY_WRITE_JSON = os.environ.get('SUMMARY_WRITE_JSON', '1') == '1'
+
+def publish_summary(resumen, json_key, kind):
+    """Sube el resumen en binario (siempre) y en json.gz (si la bandera sigue activa). Regresa el ETag del primario."""
+    bin_key = json_key.replace('.json.gz', '.bin')
+    resp = s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=bin_key,
+        Body=encode_summary(resumen, kind),
+        ContentType='application/octet-stream'
+    )
+    if not SUMMARY_WRITE_JSON:
+        return (resp or {}).get('ETag')
+
+    json_str = json.dumps(resumen, separators=(',', ':'))
+    comprimido = gzip.compress(json_str.encode('utf-8'))
+    resp = s3_client.put_object(
+        Bucket=S3_BUCKET, 
+        Key=json_key, 
+        Body=comprimido, 
+        ContentType='application/json', 
+        ContentEncoding='gzip'
+    )
+    return (resp or {}).get('ETag')
 
+# --- FORMATO DEL GRID EN VIVO ---
+# Geometría inmutable (live_grid/geometry/geometry_<hash>.cols.gz) + snapshot columnar por corrida
+# (latest_grid.cols.gz y grid_<ts>.cols.gz). GRID_WRITE_JSON=0 apaga los JSON completos.
+GRID_WRITE_JSON = os.environ.get('GRID_WRITE_JSON', '1') == '1'
+GRID_COLS_KEY = S3_GRID_OUTPUT_KEY.replace('.json', '.cols.gz')
+_GEOMETRY_PUBLISHED = set()
 
-def get_ias_score(c, pollutant):
+def publish_geometry(geometry_key, body):
+    """Sube la geometría solo si esa versión (hash de contenido) no existe todavía en S3"""
+    if geometry_key in _GEOMETRY_PUBLISHED: return
     try:
-        c = float(c)
-        bps = BPS_O3 if pollutant == 'o3' else (BPS_PM10 if pollutant == 'pm10' else BPS_PM25)
-        for (c_lo, c_hi, i_lo, i_hi) in bps:
-            if c <= c_hi: return i_lo + ((c - c_lo) / (c_hi - c_lo)) * (i_hi - i_lo)
-        return bps[-1][3]
-    except: return 0
-
-def get_risk_level(ias):
-    if ias <= 50: return "Bajo"
-    if ias <= 100: return "Moderado"
-    if ias <= 150: return "Alto"
-    if ias <= 200: return "Muy Alto"
-    return "Extremadamente Alto"
+        s3_client.head_object(Bucket=S3_BUCKET, Key=geometry_key)
+    except Exception:
+        s3_client.put_object(Bucket=S3_BUCKET, Key=geometry_key, Body=body, ContentType='application/octet-stream',
+                             CacheControl='public, max-age=31536000, immutable')
+        print(f"🗺️ Geometría nueva publicada: {geometry_key}")
+    _GEOMETRY_PUBLISHED.add(geometry_key)
+
+_GEOMETRY_CACHE = {}
+
+def _grid_records(key, body):
+    """Registros de un grid histórico en cualquiera de sus formatos (JSON completo o snapshot columnar)"""
+    if not key.endswith('.cols.gz'):
+        return json.loads(body.decode('utf-8'))
+    snapshot = decode_columns(body)
+    geometry_key = snapshot[1]['attrs']['geometry_key']
+    if geometry_key not in _GEOMETRY_CACHE:
+        _GEOMETRY_CACHE[geometry_key] = decode_columns(s3_client.get_object(Bucket=S3_BUCKET, Key=geometry_key)['Body'].read())
+    return to_records(to_frame(_GEOMETRY_CACHE[geometry_key], snapshot))
+
+def _grid_history_keys(archivos):
+    """Una llave por corrida: el JSON si existe (valores exactos), si no el snapshot columnar"""
+    por_corrida = {}
+    for obj in archivos:
+        key = obj['Key']
+        for ext in ('.json', '.cols.gz'):
+            if key.endswith(ext):
+                stem = key[:-len(ext)]
+                if ext == '.json' or stem not in por_corrida: por_corrida[stem] = key
+    return [por_corrida[stem] for stem in sorted(por_corrida)]
+
+# --- 2. LÓGICA NORMATIVA NOM-172-2024 ---
+# Tablas BPS_* y motor vectorizado de IAS viven en app/ias_engine.py (compartido con Forecast)
+
+# --- RESUMEN DIARIO (AYER) ---
+# (llave en el resumen, columna en el grid, columna alterna)
+DAILY_SUMMARY_PARAMS = [
+    ('pm25_12h', 'pm25 12h', 'pm25_12h'),
+    ('o3_1h', 'o3 1h', 'o3_1h'),
+    ('pm10_12h', 'pm10 12h', 'pm10_12h'),
+    ('ias', 'ias', 'ias')
+]
+DAILY_SUMMARY_WORKERS = int(os.environ.get('DAILY_SUMMARY_WORKERS', '8'))
+# Mapa (lat, lon) -> fila del tensor; la malla es estática, se arma una vez por contenedor
+_CELL_INDEX = {'by_coord': None, 'geo_keys': None}
+_EXTRA_CELLS_LOCK = threading.Lock()
+
+def _get_cell_index():
+    if _CELL_INDEX['by_coord'] is None:
+        static_df = get_static_grid()
+        lats, lons = static_df['lat'].tolist(), static_df['lon'].tolist()
+        _CELL_INDEX['by_coord'] = {(lat, lon): i for i, (lat, lon) in enumerate(zip(lats, lons))}
+        _CELL_INDEX['geo_keys'] = [f"{round(lat, 3)},{round(lon, 3)}" for lat, lon in zip(lats, lons)]
+    return _CELL_INDEX['by_coord'], _CELL_INDEX['geo_keys']
+
+def _safe_extract(c_dict, key1, key2):
+    val = c_dict.get(key1)
+    if val is None: val = c_dict.get(key2)
+    if val is None: return 0.0
+    try: return float(val)
+    except: return 0.0
+
+def _decode_hour_grid(key, body, by_coord, geo_keys, extra_cells):
+    """
+    Decodifica un grid horario directo a arreglos por celda: (índices, valores[celdas × params]).
+    Las celdas que no están en la malla estática se agregan al final (extra_cells).
+    """
+    datos_hora = _grid_records(key, body)
+    idxs = np.empty(len(datos_hora), dtype=np.intp)
+    vals = np.empty((len(datos_hora), len(DAILY_SUMMARY_PARAMS)), dtype=np.float64)
+    for r, celda in enumerate(datos_hora):
+        i = by_coord.get((celda['lat'], celda['lon']))
+        if i is None:
+            geo_key = f"{round(celda['lat'], 3)},{round(celda['lon'], 3)}"
+            with _EXTRA_CELLS_LOCK:
+                i = extra_cells.setdefault(geo_key, len(geo_keys) + len(extra_cells))
+        idxs[r] = i
+        vals[r] = [_safe_extract(celda, k1, k2) for _, k1, k2 in DAILY_SUMMARY_PARAMS]
+    return idxs, vals
 
 def generate_daily_summary():
     """
     Busca los archivos generados ayer y crea un json.gz consolidado.
+    Por hora se usa el grid más reciente (si falla, el anterior de esa misma hora);
+    las descargas y el parseo corren en paralelo sobre un tensor celdas × 24 × params.
     """
     print("🌅 [DAILY SUMMARY] Iniciando proceso de consolidación...")
     try:
@@ -72,285 +203,379 @@ def generate_daily_summary():
         if not archivos:
             print(f"❌ [DAILY SUMMARY] No se encontraron archivos para {fecha_ayer_str}")
             return False
-            
-        resumen = {"fecha": fecha_ayer_str, "celdas": {}}
-        archivos_procesados = 0
-        
-        # --- FIX: FUNCIÓN DECLARADA AFUERA DE LOS LOOPS (Optimización de Memoria) ---
-        def safe_extract(c_dict, key1, key2):
-            val = c_dict.get(key1)
-            if val is None: val = c_dict.get(key2)
-            if val is None: return 0.0
-            try: return float(val)
-            except: return 0.0
-        # ----------------------------------------------------------------------------
         
-        for obj in archivos:
-            key = obj['Key']
+        # 1. Deduplicación determinista: candidatos por hora, del más reciente al más viejo
+        por_hora = {}
+        for key in _grid_history_keys(archivos):
             try:
                 # Extraemos la hora: "live_grid/grid_2026-02-17_14-20.json" -> "14"
-                hora_str = key.split('_')[-1].split('-')[0]
-                hora_int = int(hora_str)
+                hora_int = int(key.split('_')[-1].split('-')[0])
             except: 
                 continue
-                
-            try:
-                resp = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
-                datos_hora = json.loads(resp['Body'].read().decode('utf-8'))
-                
-                for celda in datos_hora:
-                    lat = round(celda['lat'], 3)
-                    lon = round(celda['lon'], 3)
-                    geo_key = f"{lat},{lon}"
-                    
-                    if geo_key not in resumen['celdas']:
-                        # --- FIX IAS: Agregamos el vector de ias ---
-                        resumen['celdas'][geo_key] = {"pm25_12h": [0.0]*24, "o3_1h": [0.0]*24, "pm10_12h": [0.0]*24, "ias": [0.0]*24}
-                    
-                    # Llamamos a la función que ya existe en memoria
-                    pm25 = safe_extract(celda, 'pm25 12h', 'pm25_12h')
-                    o3 = safe_extract(celda, 'o3 1h', 'o3_1h')
-                    pm10 = safe_extract(celda, 'pm10 12h', 'pm10_12h')
-                    ias_val = safe_extract(celda, 'ias', 'ias') # <--- Extraemos el IAS
-                    
-                    resumen['celdas'][geo_key]['pm25_12h'][hora_int] = pm25
-                    resumen['celdas'][geo_key]['o3_1h'][hora_int] = o3
-                    resumen['celdas'][geo_key]['pm10_12h'][hora_int] = pm10
-                    resumen['celdas'][geo_key]['ias'][hora_int] = ias_val # <--- Lo guardamos en su hora
-                    
+            por_hora.setdefault(hora_int, []).append(key)
+        for hora_int in por_hora:
+            por_hora[hora_int].sort(reverse=True)
+        
+        # 2. Tensor preasignado celdas × 24 × params
+        by_coord, geo_keys = _get_cell_index()
+        extra_cells = {}
+        tensor = np.zeros((len(geo_keys), 24, len(DAILY_SUMMARY_PARAMS)), dtype=np.float64)
+        seen = np.zeros(len(geo_keys), dtype=bool)
+        
+        def procesar_hora(hora_int):
+            for key in por_hora[hora_int]:
+                try:
+                    resp = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
+                    return hora_int, key, _decode_hour_grid(key, resp['Body'].read(), by_coord, geo_keys, extra_cells)
+                except Exception as e:
+                    print(f"⚠️ Error procesando archivo {key}: {e}")
+            return hora_int, None, None
+        
+        archivos_procesados = 0
+        with ThreadPoolExecutor(max_workers=DAILY_SUMMARY_WORKERS) as executor:
+            for hora_int, key, decoded in executor.map(procesar_hora, sorted(por_hora)):
+                if decoded is None: continue
+                idxs, vals = decoded
+                grow = len(geo_keys) + len(extra_cells) - len(tensor)
+                if grow > 0:
+                    tensor = np.concatenate([tensor, np.zeros((grow,) + tensor.shape[1:])])
+                    seen = np.concatenate([seen, np.zeros(grow, dtype=bool)])
+                tensor[idxs, hora_int, :] = vals
+                seen[idxs] = True
                 archivos_procesados += 1
-            except Exception as e:
-                print(f"⚠️ Error procesando archivo {key}: {e}")
-
-        # Interpolación rápida de huecos (si la Lambda falló alguna hora, repite la hora anterior)
-        for geo_key, series in resumen['celdas'].items():
-            # --- FIX IAS: Incluimos 'ias' en la lista de interpolación ---
-            for param in ['pm25_12h', 'o3_1h', 'pm10_12h', 'ias']:
-                for i in range(24):
-                    if series[param][i] == 0.0 and i > 0: 
-                        series[param][i] = series[param][i-1]
-
-        # Comprimir y Subir a S3
-        json_str = json.dumps(resumen, separators=(',', ':'))
-        comprimido = gzip.compress(json_str.encode('utf-8'))
-        output_key = f"daily_summaries/summary_{fecha_ayer_str}.json.gz"
         
-        s3_client.put_object(
-            Bucket=S3_BUCKET, 
-            Key=output_key, 
-            Body=comprimido, 
-            ContentType='application/json', 
-            ContentEncoding='gzip'
-        )
-        print(f"✅ [DAILY SUMMARY] Guardado en S3: {output_key} ({archivos_procesados} horas procesadas)")
+        # 3. Interpolación rápida de huecos (si la Lambda falló alguna hora, repite la hora anterior)
+        for i in range(1, 24):
+            tensor[:, i, :] = np.where(tensor[:, i, :] == 0.0, tensor[:, i-1, :], tensor[:, i, :])
+        
+        all_keys = geo_keys + list(extra_cells)
+        resumen = {"fecha": fecha_ayer_str, "celdas": {}}
+        for i in np.flatnonzero(seen).tolist():
+            series = tensor[i].T.tolist()
+            resumen['celdas'][all_keys[i]] = {param: series[j] for j, (param, _, _) in enumerate(DAILY_SUMMARY_PARAMS)}
+
+        # Subir a S3 (binario + json.gz de transición)
+        output_key = f"daily_summaries/summary_{fecha_ayer_str}.json.gz"
+        publish_summary(resumen, output_key, 'daily')
+        print(f"✅ [DAILY SUMMARY] Guardado en S3: {output_key} ({archivos_procesados} horas procesadas de {len(archivos)} archivos)")
         return True
     except Exception as e:
         print(f"❌ [DAILY SUMMARY] Error crítico: {e}")
         return False
 
-def generate_today_summary():
+# --- RESUMEN DE HOY (INCREMENTAL) ---
+TODAY_SUMMARY_KEY = "daily_summaries/summary_today.json.gz"
+# Subir si cambia la estructura de 'celdas' -> fuerza reconstrucción completa
+TODAY_SUMMARY_SCHEMA = 1
+# (llave en el resumen, columna en el grid, columna alterna)
+TODAY_SUMMARY_PARAMS = [
+    ('ias', 'ias', 'ias'),
+    ('pm25_12h', 'pm25 12h', 'pm25'),
+    ('pm10_12h', 'pm10 12h', 'pm10'),
+    ('o3_1h', 'o3 1h', 'o3')
+]
+# Copia en memoria del contenedor + ETag con el que la subimos
+_TODAY_CACHE = {'resumen': None, 'etag': None}
+
+def _fill_today_gaps(resumen):
+    """Si la Lambda falló alguna hora de hoy, repetimos la hora anterior para tapar el hueco"""
+    max_hora = resumen['ultima_hora_procesada']
+    for geo_key, series in resumen['celdas'].items():
+        for param, _, _ in TODAY_SUMMARY_PARAMS:
+            for i in range(1, max_hora + 1):
+                if series[param][i] is None and series[param][i-1] is not None:
+                    series[param][i] = series[param][i-1]
+
+def _today_primary_key():
+    """Objeto contra el que se valida la copia en memoria: el json.gz mientras exista, si no el .bin"""
+    return TODAY_SUMMARY_KEY if SUMMARY_WRITE_JSON else TODAY_SUMMARY_KEY.replace('.json.gz', '.bin')
+
+def _upload_today_summary(resumen):
+    _TODAY_CACHE['etag'] = publish_summary(resumen, TODAY_SUMMARY_KEY, 'today')
+    _TODAY_CACHE['resumen'] = resumen
+
+def _rebuild_today_summary(fecha_hoy_str):
+    """Reconstrucción completa: lista y descarga todos los grids de hoy (ruta lenta)"""
+    # Buscamos todos los archivos generados HOY
+    prefix = f"live_grid/grid_{fecha_hoy_str}"
+    response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=prefix)
+    archivos = response.get('Contents', [])
+    
+    if not archivos:
+        print(f"⚠️ [TODAY SUMMARY] Aún no hay archivos generados para hoy ({fecha_hoy_str})")
+        return None
+        
+    resumen = {
+        "origen": "today", 
+        "fecha": fecha_hoy_str,
+        "schema": TODAY_SUMMARY_SCHEMA,
+        "ultima_hora_procesada": -1,
+        "celdas": {}
+    }
+    
+    def safe_extract(c_dict, key1, key2):
+        val = c_dict.get(key1, c_dict.get(key2))
+        return float(val) if val is not None else 0.0
+
+    max_hora = -1
+    
+    for key in _grid_history_keys(archivos):
+        try:
+            # Extraer hora: live_grid/grid_2026-02-24_17-20.json -> 17
+            hora_str = key.split('_')[-1].split('-')[0]
+            hora_int = int(hora_str)
+            if hora_int > max_hora: max_hora = hora_int
+        except:
+            continue
+            
+        try:
+            resp = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
+            datos_hora = _grid_records(key, resp['Body'].read())
+            
+            for celda in datos_hora:
+                lat, lon = round(celda['lat'], 3), round(celda['lon'], 3)
+                geo_key = f"{lat},{lon}"
+                
+                if geo_key not in resumen['celdas']:
+                    # Inicializamos las 24 horas con 'None' (null en JSON)
+                    resumen['celdas'][geo_key] = {param: [None]*24 for param, _, _ in TODAY_SUMMARY_PARAMS}
+                
+                # Guardamos el dato en el índice de la hora correspondiente
+                for param, key1, key2 in TODAY_SUMMARY_PARAMS:
+                    val = safe_extract(celda, key1, key2)
+                    resumen['celdas'][geo_key][param][hora_int] = int(val) if param == 'ias' else val
+                
+        except Exception as e:
+            print(f"⚠️ Error procesando {key}: {e}")
+    
+    resumen['ultima_hora_procesada'] = max_hora
+    return resumen
+
+def _load_today_summary(fecha_hoy_str):
+    """
+    Resumen vigente de hoy: la copia en memoria si el ETag en S3 sigue siendo el nuestro,
+    si no el objeto de S3. None si no existe, es de otro día o de otro esquema.
+    """
+    resumen = None
+    try:
+        if _TODAY_CACHE['resumen'] is not None:
+            head = s3_client.head_object(Bucket=S3_BUCKET, Key=_today_primary_key())
+            if head.get('ETag') == _TODAY_CACHE['etag']:
+                resumen = _TODAY_CACHE['resumen']
+        if resumen is None:
+            obj = s3_client.get_object(Bucket=S3_BUCKET, Key=_today_primary_key())
+            body = obj['Body'].read()
+            if SUMMARY_WRITE_JSON:
+                resumen = json.loads(gzip.decompress(body).decode('utf-8'))
+            else:
+                resumen = decode_summary(body)
+            _TODAY_CACHE['etag'] = obj.get('ETag')
+    except Exception as e:
+        print(f"⚠️ [TODAY SUMMARY] Sin resumen previo utilizable ({e})")
+        return None
+
+    if resumen.get('fecha') != fecha_hoy_str or resumen.get('schema') != TODAY_SUMMARY_SCHEMA:
+        return None
+    return resumen
+
+def generate_today_summary(final_df=None, now_mx=None):
     """
     Consolida los archivos generados en lo que va del día de hoy
     para que la API Ligera tenga el 'presente' al instante.
+    Con final_df (el grid recién calculado) solo se escribe el slot de la hora actual
+    sobre el resumen existente; la reconstrucción completa queda para el cambio de día
+    o de esquema.
     """
     print("\n☀️ [TODAY SUMMARY] Construyendo el puente del presente...")
     try:
         tz = ZoneInfo("America/Mexico_City")
-        hoy_dt = datetime.now(tz)
+        hoy_dt = now_mx or datetime.now(tz)
         fecha_hoy_str = hoy_dt.strftime("%Y-%m-%d")
         
-        # Buscamos todos los archivos generados HOY
-        prefix = f"live_grid/grid_{fecha_hoy_str}"
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=prefix)
-        archivos = response.get('Contents', [])
+        resumen = _load_today_summary(fecha_hoy_str) if final_df is not None else None
+        modo = "incremental"
         
-        if not archivos:
-            print(f"⚠️ [TODAY SUMMARY] Aún no hay archivos generados para hoy ({fecha_hoy_str})")
-            return False
-            
-        resumen = {
-            "origen": "today", 
-            "fecha": fecha_hoy_str,
-            "ultima_hora_procesada": -1,
-            "celdas": {}
-        }
-        
-        def safe_extract(c_dict, key1, key2):
-            val = c_dict.get(key1, c_dict.get(key2))
-            return float(val) if val is not None else 0.0
-
-        max_hora = -1
-        
-        for obj in archivos:
-            key = obj['Key']
-            try:
-                # Extraer hora: live_grid/grid_2026-02-24_17-20.json -> 17
-                hora_str = key.split('_')[-1].split('-')[0]
-                hora_int = int(hora_str)
-                if hora_int > max_hora: max_hora = hora_int
-            except:
-                continue
-                
-            try:
-                resp = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
-                datos_hora = json.loads(resp['Body'].read().decode('utf-8'))
-                
-                for celda in datos_hora:
-                    lat, lon = round(celda['lat'], 3), round(celda['lon'], 3)
-                    geo_key = f"{lat},{lon}"
-                    
-                    if geo_key not in resumen['celdas']:
-                        # Inicializamos las 24 horas con 'None' (null en JSON)
-                        resumen['celdas'][geo_key] = {
-                            "ias": [None]*24,
-                            "pm25_12h": [None]*24,
-                            "pm10_12h": [None]*24,
-                            "o3_1h": [None]*24
-                        }
-                    
-                    # Guardamos el dato en el índice de la hora correspondiente
-                    resumen['celdas'][geo_key]['ias'][hora_int] = int(safe_extract(celda, 'ias', 'ias'))
-                    resumen['celdas'][geo_key]['pm25_12h'][hora_int] = safe_extract(celda, 'pm25 12h', 'pm25')
-                    resumen['celdas'][geo_key]['pm10_12h'][hora_int] = safe_extract(celda, 'pm10 12h', 'pm10')
-                    resumen['celdas'][geo_key]['o3_1h'][hora_int] = safe_extract(celda, 'o3 1h', 'o3')
-                    
-            except Exception as e:
-                print(f"⚠️ Error procesando {key}: {e}")
+        if resumen is None:
+            modo = "reconstrucción completa"
+            resumen = _rebuild_today_summary(fecha_hoy_str)
+            if resumen is None and final_df is None:
+                return False
+            if resumen is None:
+                resumen = {"origen": "today", "fecha": fecha_hoy_str, "schema": TODAY_SUMMARY_SCHEMA,
+                           "ultima_hora_procesada": -1, "celdas": {}}
         
-        resumen['ultima_hora_procesada'] = max_hora
-
-        # Interpolación rápida: Si la Lambda falló alguna hora de hoy, repetimos la hora anterior para tapar el hueco
-        for geo_key, series in resumen['celdas'].items():
-            for param in ['ias', 'pm25_12h', 'pm10_12h', 'o3_1h']:
-                for i in range(1, max_hora + 1):
-                    if series[param][i] is None and series[param][i-1] is not None:
-                        series[param][i] = series[param][i-1]
-
-        # Comprimir y guardar
-        json_str = json.dumps(resumen, separators=(',', ':'))
-        comprimido = gzip.compress(json_str.encode('utf-8'))
-        output_key = "daily_summaries/summary_today.json.gz"
+        # El slot de esta hora sale del grid en memoria: no depende de que su histórico ya esté en S3
+        # (la publicación sube ambos en paralelo)
+        if final_df is not None:
+            # Mismo encoder que el grid publicado -> mismos valores que una reconstrucción
+            cols = ['lat', 'lon'] + [c for _, c, _ in TODAY_SUMMARY_PARAMS]
+            rows = json.loads(final_df[cols].to_json(orient='values'))
+            hora_int = hoy_dt.hour
+            celdas = resumen['celdas']
+            
+            for row in rows:
+                geo_key = f"{round(row[0], 3)},{round(row[1], 3)}"
+                if geo_key not in celdas:
+                    celdas[geo_key] = {param: [None]*24 for param, _, _ in TODAY_SUMMARY_PARAMS}
+                for (param, _, _), val in zip(TODAY_SUMMARY_PARAMS, row[2:]):
+                    val = float(val) if val is not None else 0.0
+                    celdas[geo_key][param][hora_int] = int(val) if param == 'ias' else val
+            
+            resumen['ultima_hora_procesada'] = max(resumen['ultima_hora_procesada'], hora_int)
         
-        s3_client.put_object(
-            Bucket=S3_BUCKET, 
-            Key=output_key, 
-            Body=comprimido, 
-            ContentType='application/json', 
-            ContentEncoding='gzip'
-        )
-        print(f"✅ [TODAY SUMMARY] Guardado en S3: {output_key} (Datos actualizados hasta la hora {max_hora})")
+        _fill_today_gaps(resumen)
+        _upload_today_summary(resumen)
+        print(f"✅ [TODAY SUMMARY] Guardado en S3: {_today_primary_key()} ({modo}, datos hasta la hora {resumen['ultima_hora_procesada']})")
         return True
         
     except Exception as e:
         print(f"❌ [TODAY SUMMARY] Error crítico: {e}")
         return False
 
-# --- 3. FUNCIONES DE CARGA Y PROCESAMIENTO ---
-def load_models():
-    """Descarga modelos desde S3 y los carga en XGBoost"""
-    models = {}
+# --- PUBLICACIÓN CONDICIONAL DEL GRID ---
+# El hash cubre los valores dinámicos (sin 'timestamp') y la geometría. Si coincide con el del
+# latest en S3 (metadata content-sha256) no se resube nada: el histórico de esta corrida se crea
+# con copy_object (alias, sin transferir bytes) y el ETag del latest no cambia (If-None-Match).
+PUBLISH_WORKERS = int(os.environ.get('PUBLISH_WORKERS', '6'))
+# Último slot del resumen de hoy escrito por este contenedor (hora + hash)
+_TODAY_SLOT = {'slot': None, 'hash': None}
 
-    pollutants = ['o3', 'pm10', 'pm25', 'co', 'so2'] 
-    
-    print(f"🔄 Iniciando carga de modelos: {pollutants}")
-    
-    for p in pollutants:
-        s3_key = f"{MODEL_S3_PREFIX}model_{p}.json"
-        local_path = f"/tmp/model_{p}.json"
-        
+_GEOMETRY_MEMO = {'fingerprint': None, 'encoded': None}
+
+def _encoded_geometry(final_df):
+    """(llave, cuerpo) de la geometría; se recodifica solo si cambian las columnas estáticas"""
+    hashed = pd.util.hash_pandas_object(final_df[STATIC_COLUMNS], index=False).to_numpy()
+    fingerprint = hashlib.sha256(hashed.tobytes()).hexdigest()
+    if _GEOMETRY_MEMO['fingerprint'] != fingerprint:
+        _GEOMETRY_MEMO.update(fingerprint=fingerprint, encoded=encode_geometry(final_df))
+    return _GEOMETRY_MEMO['encoded']
+
+def grid_content_hash(final_df, geometry_key):
+    dynamic = final_df.drop(columns=['timestamp'] + STATIC_COLUMNS, errors='ignore')
+    hashed = pd.util.hash_pandas_object(dynamic, index=False).to_numpy()
+    return hashlib.sha256(geometry_key.encode('utf-8') + hashed.tobytes()).hexdigest()
+
+def _published_meta():
+    """Metadata del latest publicado (content-sha256, history-stem, today-slot); {} si no existe"""
+    try:
+        return s3_client.head_object(Bucket=S3_BUCKET, Key=GRID_COLS_KEY).get('Metadata') or {}
+    except Exception:
+        return {}
+
+def _alias_or_put(dst_key, src_key, make_body, content_type):
+    """Copia server-side del histórico anterior; si no se puede, sube el contenido completo"""
+    if src_key:
         try:
-            # Optimización Cold Start: Solo descargar si no existe en /tmp
-            if not os.path.exists(local_path):
-                print(f"⬇️ Descargando de S3: {s3_key}...")
-                s3_client.download_file(S3_BUCKET, s3_key, local_path)
-            
-            # Cargar en XGBoost
-            m = xgb.XGBRegressor()
-            m.load_model(local_path)
-            models[p] = m
-            print(f"✅ Modelo {p} cargado correctamente.")
+            s3_client.copy_object(Bucket=S3_BUCKET, Key=dst_key, CopySource={'Bucket': S3_BUCKET, 'Key': src_key})
+            return 'alias'
         except Exception as e:
-            # Si falla (ej. no existe el archivo en S3), avisamos pero no tronamos
-            print(f"⚠️ No se pudo cargar el modelo {p}. Razón: {e}")
-            
-    return models
+            print(f"⚠️ Alias {src_key} -> {dst_key} falló ({e}). Subiendo completo.")
+    s3_client.put_object(Bucket=S3_BUCKET, Key=dst_key, Body=make_body(), ContentType=content_type)
+    return 'put'
 
-def inverse_distance_weighting(x, y, z, xi, yi):
-    """Interpolación espacial IDW"""
-    dist = np.sqrt((xi[:, None] - x[None, :])**2 + (yi[:, None] - y[None, :])**2)
-    dist = np.maximum(dist, 1e-12)
-    weights = 1.0 / (dist ** 2)
-    return np.sum(weights * z[None, :], axis=1) / np.sum(weights, axis=1)
+def publish_grid(final_df, now_mx):
+    """
+    Publica el grid de la corrida: latest + histórico (columnar y JSON) y el slot del resumen de hoy,
+    en paralelo; latest.cols (con la marca de publicación completa) se sube al final.
+    Si el contenido no cambió respecto al latest, solo se re-codifica el snapshot (~36 KB) con el
+    timestamp de esta corrida; el JSON histórico es un alias del anterior y latest_grid.json no se
+    reescribe, así que su 'timestamp' es el de la corrida que produjo ese contenido (la hora de la
+    corrida está en la llave grid_<ts> y en los .cols).
+    """
+    timestamp_name = now_mx.strftime("%Y-%m-%d_%H-%M")
+    stem = f"live_grid/grid_{timestamp_name}"
+    slot = now_mx.strftime("%Y-%m-%d_%H")
+    geometry_key, geometry_body = _encoded_geometry(final_df)
+    content_hash = grid_content_hash(final_df, geometry_key)
+    published = _published_meta()
+    unchanged = published.get('content-sha256') == content_hash
+
+    def snapshot_body():
+        return encode_snapshot(final_df, geometry_key, {'timestamp': timestamp_name})
+
+    def json_body():
+        return final_df.replace({np.nan: None}).to_json(orient='records')
+
+    tasks = {}
+    cols = None
+    if unchanged and published.get('history-stem') == stem:
+        pass  # misma corrida/minuto: el histórico ya es este contenido
+    else:
+        if unchanged:
+            # La geometría ya está publicada; el JSON (~1.4 MB) solo se referencia con un alias
+            src = published.get('history-stem')
+            if GRID_WRITE_JSON:
+                tasks['histórico.json'] = lambda: _alias_or_put(f"{stem}.json", src and f"{src}.json", json_body, 'application/json')
+        else:
+            # La geometría va primero: el latest que la referencia no debe quedar visible antes que ella
+            publish_geometry(geometry_key, geometry_body)
+            if GRID_WRITE_JSON:
+                final_json = json_body()
+                tasks['latest.json'] = lambda: s3_client.put_object(Bucket=S3_BUCKET, Key=S3_GRID_OUTPUT_KEY, Body=final_json, ContentType='application/json')
+                tasks['histórico.json'] = lambda: s3_client.put_object(Bucket=S3_BUCKET, Key=f"{stem}.json", Body=final_json, ContentType='application/json')
+        # El snapshot lleva el timestamp de la corrida: se codifica siempre (no se copia el anterior)
+        cols = snapshot_body()
+        print(f"🗜️ Snapshot columnar: {len(cols) / 1024:.1f} KB ({geometry_key})")
+        tasks['histórico.cols'] = lambda: s3_client.put_object(Bucket=S3_BUCKET, Key=f"{stem}.cols.gz", Body=cols, ContentType='application/octet-stream')
+
+    # Mismo contenido y mismo slot horario -> el resumen de hoy ya tiene exactamente estos valores
+    today_current = unchanged and (published.get('today-slot') == slot or _TODAY_SLOT == {'slot': slot, 'hash': content_hash})
+
+    def today_summary():
+        # generate_today_summary atrapa sus errores y regresa False: el slot solo se marca si se escribió
+        if not generate_today_summary(final_df, now_mx): return False
+        _TODAY_SLOT.update(slot=slot, hash=content_hash)
+        return True
+
+    if not today_current:
+        tasks['today_summary'] = today_summary
+    # Última lectura buena por estación (solo si el SIMAT respondió en esta corrida)
+    tasks['station_cache'] = lambda: station_cache.persist(s3_client, S3_BUCKET)
+
+    with ThreadPoolExecutor(max_workers=PUBLISH_WORKERS) as executor:
+        futures = {name: executor.submit(fn) for name, fn in tasks.items()}
+    errors = {name: fut.exception() for name, fut in futures.items() if fut.exception() is not None}
+    today_ok = today_current or ('today_summary' not in errors and futures['today_summary'].result())
+    published_names = list(futures)
+
+    if cols is not None:
+        # latest.cols va al final: su metadata es la marca que lee la siguiente corrida. content-sha256
+        # solo se registra si todas las tareas salieron bien (si no, la siguiente corrida republica todo,
+        # incluido un latest.json fallido) y today-slot solo si además el resumen de hoy se escribió.
+        meta = {'history-stem': stem}
+        if not errors:
+            meta['content-sha256'] = content_hash
+            if today_ok: meta['today-slot'] = slot
+        try:
+            s3_client.put_object(Bucket=S3_BUCKET, Key=GRID_COLS_KEY, Body=cols, ContentType='application/octet-stream', Metadata=meta)
+        except Exception as e:
+            errors['latest.cols'] = e
+        published_names.append('latest.cols')
+
+    estado = "sin cambios (snapshot con nuevo timestamp, JSON alias del histórico)" if unchanged else "contenido nuevo"
+    omitidos = "" if not today_current else " | today_summary omitido (slot vigente)"
+    if not today_ok:
+        omitidos += " | ⚠️ today_summary falló (se reintenta en la siguiente corrida)"
+    print(f"📤 Publicación {estado}: {', '.join(published_names)}{omitidos} | sha256 {content_hash[:12]}")
+    if errors:
+        name, err = next(iter(errors.items()))
+        raise RuntimeError(f"Publicación falló en {name}: {err}")
+    return {'timestamp': timestamp_name, 'unchanged': unchanged, 'content_hash': content_hash}
+
+# --- 3. FUNCIONES DE CARGA Y PROCESAMIENTO ---
+def load_models():
+    """Modelos XGBoost desde el registro del contenedor (recarga solo si cambió su ETag en S3)"""
+    return get_models(s3_client, S3_BUCKET, MODEL_S3_PREFIX)
 
 def prepare_grid_features(stations_df):
     """
-    Carga malla y cruza datos usando VECINO MÁS CERCANO (Spatial Join).
-    Esto soluciona el problema de coordenadas que no coinciden exactamente.
+    Toma la malla estática precompilada (colonias + edificios ya cruzados con KDTree
+    en el paso de build) y le agrega las variables temporales.
     """
-    print("🏗️ Preparando Grid Features (Spatial KDTree Strategy)...")
-    
-    # 1. Cargar Malla Valle (Target)
-    MALLA_PATH = f"{BASE_PATH}/app/geograficos/malla_valle_mexico_final.geojson"
-    with open(MALLA_PATH, 'r') as f:
-        malla_data = json.load(f)
-    
-    malla_list = []
-    for feature in malla_data['features']:
-        coords = feature['geometry']['coordinates']
-        malla_list.append({
-            'lon': coords[0],
-            'lat': coords[1],
-            'altitude': feature['properties'].get('elevation', 2240)
-        })
-    grid_df = pd.DataFrame(malla_list)
+    print("🏗️ Preparando Grid Features (Malla Estática Precompilada)...")
     
-    # 2. Cargar Bases de Datos (Sources)
-    # A) Colonias
-    COLONIAS_PATH = f"{BASE_PATH}/app/geograficos/grid_colonias_db.json"
-    try:
-        with open(COLONIAS_PATH, 'r') as f:
-            cols_df = pd.DataFrame(json.load(f))
-    except:
-        cols_df = pd.DataFrame()
-
-    # B) Edificios
-    EDIFICIOS_PATH = f"{BASE_PATH}/app/geograficos/capa_edificios_v2.json"
-    try:
-        with open(EDIFICIOS_PATH, 'r') as f:
-            edificios_df = pd.DataFrame(json.load(f))
-    except:
-        edificios_df = pd.DataFrame()
-
-    # --- FUNCIÓN DE MERGE ESPACIAL (EL FIX REAL) ---
-    def spatial_merge(target, source, cols_to_merge):
-        if source.empty:
-            for c in cols_to_merge: target[c] = 0 if c == 'building_vol' else None
-            return
-
-        # Creamos el árbol espacial con las coordenadas de la FUENTE
-        tree = cKDTree(source[['lat', 'lon']].values)
-        
-        # Buscamos el vecino más cercano para cada punto del TARGET (Malla)
-        # k=1 significa "el único más cercano"
-        dists, idxs = tree.query(target[['lat', 'lon']].values, k=1)
-        
-        # Asignamos valores
-        for c in cols_to_merge:
-            if c in source.columns:
-                target[c] = source.iloc[idxs][c].values
-
-    # 3. Ejecutar Cruces Espaciales
-    # Cruzar Colonias
-    spatial_merge(grid_df, cols_df, ['col', 'mun', 'edo', 'pob'])
-    
-    # Cruzar Edificios (Asegura que building_vol pase aunque las coords varien milímetros)
-    spatial_merge(grid_df, edificios_df, ['building_vol'])
-
-    # 4. Limpieza y Defaults
-    grid_df['col'] = grid_df['col'].fillna("Zona Federal / Sin Colonia")
-    grid_df['mun'] = grid_df['mun'].fillna("Valle de México")
-    grid_df['pob'] = grid_df['pob'].fillna(0).astype(int)
-    grid_df['building_vol'] = grid_df['building_vol'].fillna(0)
+    # 1-4. Malla + Colonias + Edificios (mapeada una vez por contenedor)
+    grid_df = get_static_grid()
 
     # 5. Variables Temporales
     tz = ZoneInfo("America/Mexico_City")
@@ -360,61 +585,121 @@ def prepare_grid_features(stations_df):
     grid_df['month_sin'] = np.sin(2 * np.pi * now.month / 12)
     grid_df['month_cos'] = np.cos(2 * np.pi * now.month / 12)
 
-    # 6. Interpolación de Clima (IDW)
-    features_to_interp = [('tmp', 20.0), ('rh', 40.0), ('wsp', 1.0), ('wdr', 90.0)]
-    for feat, default in features_to_interp:
-        valid = stations_df.dropna(subset=[feat])
-        if not valid.empty:
-            grid_df[feat] = inverse_distance_weighting(
-                valid['lat'].values, valid['lon'].values, valid[feat].values, 
-                grid_df['lat'].values, grid_df['lon'].values
-            )
-        else: grid_df[feat] = default
-    
+    # 6. Clima: lo resuelve la etapa de interpolación meteorológica (Bloque C)
     grid_df['station_numeric'] = -1
     
     # Debug en Logs
-    print(f"✅ Spatial Merge Completado. Max Vol: {grid_df['building_vol'].max()}")
+    print(f"✅ Malla lista. Max Vol: {grid_df['building_vol'].max()}")
     
     return grid_df
 
 # --- [ANCLA HELPERS: AGREGAR ANTES DE LAMBDA_HANDLER] ---
 
-from scipy.interpolate import griddata # Asegúrate de que este import esté arriba con los demás
+def build_station_index(stations_df):
+    """
+    Celda (posición en grid_df) más cercana a cada estación.
+    Una sola consulta KDTree por corrida; se reutiliza en calibración y marcadores.
+    """
+    if stations_df.empty:
+        return np.empty(0, dtype=np.intp)
+    _, idxs = get_grid_tree().query(stations_df[['lat', 'lon']].values.astype(float), k=1)
+    return idxs
 
-def interpolate_grid(grid_df, x_points, y_points, z_values, method='linear'):
+def inject_station_markers(grid_df, stations_df, station_cells, target_pollutants):
+    """
+    Sobrescribe las celdas de estación con el dato oficial y arma 'sources'.
+    Si dos estaciones caen en la misma celda, gana la última (mismo orden que el loop original).
+    """
+    grid_df['station'] = None
+    grid_df['sources'] = "{}"
+    if len(station_cells) == 0:
+        return grid_df
+
+    # Llaves de 'sources' en el orden histórico: química primero, luego meteorología
+    fields = []
+    for p in target_pollutants:
+        if p == 'co': window = "8h"
+        elif p in ['pm10', 'pm25']: window = "12h"
+        else: window = "1h"
+        fields.append((p, f'{p}_real', f"Oficial {window}", f"IA {window}"))
+    for m in ['tmp', 'rh', 'wsp', 'wdr']:
+        fields.append((m, m, "Oficial", "IA"))
+
+    # 1. Valores oficiales (columna por columna)
+    official = np.zeros((len(station_cells), len(fields)), dtype=bool)
+    for j, (grid_col, st_col, _, _) in enumerate(fields):
+        if st_col not in stations_df.columns: continue
+        vals = pd.to_numeric(stations_df[st_col], errors='coerce').to_numpy(dtype=float)
+        official[:, j] = ~np.isnan(vals)
+        cells = pd.Series(vals[official[:, j]], index=station_cells[official[:, j]])
+        cells = cells[~cells.index.duplicated(keep='last')]
+        col_vals = grid_df[grid_col].to_numpy(dtype=float, copy=True)
+        col_vals[cells.index.values] = cells.values
+        grid_df[grid_col] = col_vals
+
+    # 2. Nombre de estación y fuentes (una serialización por patrón distinto, no por estación)
+    patterns = official.dot(1 << np.arange(len(fields)))
+    sources_json = {
+        key: json.dumps({f[0]: (f[2] if (key >> j) & 1 else f[3]) for j, f in enumerate(fields)})
+        for key in np.unique(patterns).tolist()
+    }
+    markers = pd.DataFrame({
+        'name': stations_df['name'].values,
+        'sources': [sources_json[k] for k in patterns.tolist()]
+    }, index=station_cells)
+    markers = markers[~markers.index.duplicated(keep='last')]
+
+    station_col = np.full(len(grid_df), None, dtype=object)
+    station_col[markers.index.values] = markers['name'].values
+    sources_col = np.full(len(grid_df), "{}", dtype=object)
+    sources_col[markers.index.values] = markers['sources'].values
+    grid_df['station'] = station_col
+    grid_df['sources'] = sources_col
+    return grid_df
+
+def interpolate_grid(grid_df, x_points, y_points, *z_values):
     """
     Interpola valores dispersos (x,y,z) sobre la malla completa del grid_df.
+    Linear (evita 'islas') + relleno 'nearest' en bordes, igual que griddata; la
+    triangulación se cachea por conjunto de puntos y todas las variables salen
+    de un solo producto disperso. Regresa un arreglo por variable.
     """
-    # 1. Coordenadas de destino (Toda la malla)
-    grid_coords = (grid_df['lon'], grid_df['lat'])
-    
-    # 2. Interpolación principal (Linear es mejor para evitar 'islas')
-    grid_z = griddata(
-        (x_points, y_points), 
-        z_values, 
-        grid_coords, 
-        method=method
-    )
-    
-    # 3. Relleno de bordes (Extrapolación con 'nearest' para cubrir esquinas vacías)
-    # Si 'linear' deja huecos (NaNs) en los bordes, los llenamos con el valor más cercano
-    if np.isnan(grid_z).any():
-        grid_z_nearest = griddata(
-            (x_points, y_points), 
-            z_values, 
-            grid_coords, 
-            method='nearest'
-        )
-        # Donde sea NaN en linear, usamos nearest
-        grid_z = np.where(np.isnan(grid_z), grid_z_nearest, grid_z)
-        
-    return grid_z
+    return interpolate_fields('linear', x_points, y_points, grid_df['lon'].values, grid_df['lat'].values, *z_values)
+
+# (variable, default si ninguna estación la reporta)
+IDW_FEATURES = [('tmp', 20.0), ('rh', 40.0), ('wsp', 1.0), ('wdr', 90.0)]
+
+def interpolate_meteo_idw(grid_df, stations_df):
+    """Respaldo IDW desde stations_df cuando no hay suficientes puntos para la interpolación lineal"""
+    for feat, default in IDW_FEATURES:
+        valid = stations_df.dropna(subset=[feat])
+        if not valid.empty:
+            grid_df[feat], = interpolate_fields(
+                'idw', valid['lat'].values, valid['lon'].values,
+                grid_df['lat'].values, grid_df['lon'].values, valid[feat].values
+            )
+        else: grid_df[feat] = default
+    return grid_df
 
 # --- 4. HANDLER PRINCIPAL ---
 def lambda_handler(event, context):
+    """
+    Envoltura con instrumentación: tiempos por etapa en un registro EMF por corrida
+    y cProfile opcional con {"profile": true | "s3"} en el evento.
+    """
+    timer = StageTimer("grid_predictor")
+    with ProfileSession(event, "grid_predictor", s3_client, S3_BUCKET):
+        result = run_predictor(event, context, timer)
+    timer.end()
+    print(timer.summary())
+    timer.emit(status='ok' if result.get('statusCode') == 200 else 'error')
+    return result
+
+def run_predictor(event, context, timer):
     VERSION = "V58.4" 
     print(f"🚀 INICIANDO PREDICTOR MAESTRO {VERSION} - ESTABILIZACIÓN FINAL")
+    # Inicio de la corrida: referencia de edad para la caché de estaciones (no el fin de la descarga)
+    run_started = time.time()
     
     # --- [NUEVO] RELOJ DEL DAILY SUMMARY ---
     tz = ZoneInfo("America/Mexico_City")
@@ -426,7 +711,8 @@ def lambda_handler(event, context):
     is_forced = event.get('force_daily_summary') == True
     
     if is_summary_time or is_forced:
-        generate_daily_summary()
+        with timer.stage('daily_summary'):
+            generate_daily_summary()
         
         # Si fue un test manual forzado, detenemos la Lambda aquí para no hacer una predicción completa
         if is_forced:
@@ -434,83 +720,58 @@ def lambda_handler(event, context):
     # ----------------------------------------
     
     try:
+        timer.begin('modelos')
         models = load_models()
         
         # Ingesta de API con Blindaje
+        timer.begin('ingesta_api')
+        # SIMAT y el respaldo Open-Meteo salen en paralelo (presupuesto, hedge y circuit breaker por fuente).
+        # Si la última lectura buena es más joven que STATION_CACHE_TTL, se sirve de caché sin red.
         stations_raw = []
-        try:
-            r = requests.get(SMABILITY_API_URL, timeout=15)
-            if r.status_code == 200:
-                res = r.json()
+        station_cache.load(s3_client, S3_BUCKET)
+        cache_fresh = station_cache.is_fresh(now=run_started)
+        if cache_fresh:
+            stations_raw = station_cache.snapshot(now=run_started)
+            print(f"♻️ Caché de estaciones vigente ({station_cache.age_s(run_started):.0f} s): {len(stations_raw)} estaciones, sin llamar al SIMAT")
+        spec = {}
+        if not cache_fresh:
+            spec['simat'] = dict(url=SMABILITY_API_URL, budget=SIMAT_TIMEOUT, accept_status=200)
+        if not cache_fresh or sum(1 for s in stations_raw if s.get('meteorological')) < 3:
+            spec['openmeteo'] = dict(url=OPENMETEO_URL, budget=OPENMETEO_TIMEOUT, accept_status=None)
+        fetched = fetch_all(http_client, spec) if spec else {}
+        if fetched:
+            print(f"🌐 Ingesta: {' | '.join(r.describe() for r in fetched.values())}")
+        if not cache_fresh:
+            try:
+                res = fetched['simat'].json()
                 stations_raw = res.get('stations') if isinstance(res, dict) else []
-        except Exception as e:
-            print(f"⚠️ API Error: {e}")
-
-        # Agregamos TODAS las llaves para evitar errores de contabilidad
-        counts = {
-            "o3": 0, "pm10": 0, "pm25": 0, 
-            "co": 0, "so2": 0, 
-            "tmp": 0, "rh": 0, "wsp": 0, "wdr": 0
-        }
-        parsed = []
+            except Exception as e:
+                print(f"⚠️ API Error: {e}")
+            # Huecos del SIMAT (caída total o parcial) se rellenan con la última lectura de cada estación
+            stations_raw, cache_stats = station_cache.blend(stations_raw, now=run_started)
+            if cache_stats['from_cache']:
+                print(f"♻️ Mezcla: {cache_stats['fresh']} frescas + {cache_stats['from_cache']} desde caché (edad máx {cache_stats['max_age_min']} min)")
 
-        for s in stations_raw:
-            if not isinstance(s, dict): continue
-            pol = s.get('pollutants') or {}
-            met = s.get('meteorological') or {}
-            
-            # --- FUNCIÓN DE EXTRACCIÓN NORMATIVA ---
-            def safe_val(d, key, c_key):
-                obj = d.get(key)
-                if isinstance(obj, dict):
-                    # LÓGICA DE VENTANAS DE TIEMPO (NOM-172)
-                    if key == 'co':
-                        target_window = 'avg_8h'   # <--- CO usa 8 horas
-                    elif key in ['pm10', 'pm25']:
-                        target_window = 'avg_12h'  # Partículas usan 12 horas
-                    else:
-                        target_window = 'avg_1h'   # O3, SO2 y Met usan 1 hora
-                    
-                    inner = obj.get(target_window)
-                    if isinstance(inner, dict):
-                        val = inner.get('value')
-                        if val is not None:
-                            if c_key in counts: counts[c_key] += 1
-                            return val
-                return None
-
-            parsed.append({
-                'name': s.get('station_name', 'Unknown'),
-                'lat': float(s.get('latitude')) if s.get('latitude') else None,
-                'lon': float(s.get('longitude')) if s.get('longitude') else None,
-                'o3_real': safe_val(pol, 'o3', 'o3'),
-                'pm10_real': safe_val(pol, 'pm10', 'pm10'),
-                'pm25_real': safe_val(pol, 'pm25', 'pm25'),
-                # --- NUEVOS CAMPOS (QUÍMICA) ---
-                'co_real': safe_val(pol, 'co', 'co'),     
-                'so2_real': safe_val(pol, 'so2', 'so2'),  
-                # --- METEOROLOGÍA ---
-                'tmp': safe_val(met, 'temperature', 'tmp'),
-                'rh': safe_val(met, 'relative_humidity', 'rh'),
-                'wsp': safe_val(met, 'wind_speed', 'wsp'),     # API key: wind_speed
-                'wdr': safe_val(met, 'wind_direction', 'wdr')  # API key: wind_direction
-            })
-        
-        print(f"📊 SALUD API: Recibidas {len(stations_raw)} | O3:{counts['o3']} | TMP:{counts['tmp']}")
+        # Esquema declarativo (app/simat_parser.py): tabla columnar + estadísticas de salud
+        timer.begin('parseo')
+        stations_df, parse_stats = parse_stations(stations_raw)
+        print(parse_stats.health_line())
+        if parse_stats.rejected:
+            print(f"⚠️ [SISTEMA] {parse_stats.rejected} estaciones sin coordenadas válidas descartadas.")
         # --- [PROCESAMIENTO ROBUSTO DE STATIONS_DF] ---
-        if not parsed:
+        if not parse_stats.parsed:
             print("⚠️ [SISTEMA] 0 estaciones recibidas del SIMAT. Preparando contingencia...")
-            stations_df = pd.DataFrame(columns=['name', 'lat', 'lon', 'o3_real', 'pm10_real', 'pm25_real', 'tmp', 'rh', 'wsp'])
-        else:
-            stations_df = pd.DataFrame(parsed).dropna(subset=['lat', 'lon'])
         
         if 'wdr' not in stations_df.columns:
             stations_df['wdr'] = 90.0
 
         # Procesamiento de Malla y Predicción
+        timer.begin('malla')
         grid_df = prepare_grid_features(stations_df)
+        station_cells = build_station_index(stations_df)
 
         # --- [BLOQUE C V58.5: METEOROLOGÍA RESILIENTE (SIMAT + 15 PUNTOS VIRTUALES)] ---
+        timer.begin('meteo')
         
         # 1. Diagnóstico: ¿Tenemos datos locales reales?
         met_stations = [s for s in stations_raw if s.get('meteorological')]
@@ -539,46 +800,41 @@ def lambda_handler(event, context):
         else:
             print(f"\n🌙 MODO NOCTURNO/FALLBACK: Descargando 15 Puntos Virtuales (OpenMeteo)...")
             # --- ESTRATEGIA B: 15 PUNTOS VIRTUALES (OPENMETEO) ---
-            lats = [19.5, 19.5, 19.5, 19.4, 19.4, 19.4, 19.3, 19.3, 19.3, 19.2, 19.2, 19.2, 19.6, 19.1, 19.4]
-            lons = [-99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.1, -99.1, -98.9]
-            
-            str_lats = ",".join(map(str, lats))
-            str_lons = ",".join(map(str, lons))
-            om_url = f"https://api.open-meteo.com/v1/forecast?latitude={str_lats}&longitude={str_lons}&current=temperature_2m,relative_humidity_2m,wind_speed_10m,wind_direction_10m&timezone=auto"
+            # (ya descargados en paralelo con SIMAT durante la ingesta)
+            lats, lons = OPENMETEO_LATS, OPENMETEO_LONS
             
             try:
-                import urllib.request
-                with urllib.request.urlopen(om_url, timeout=3) as url:
-                    data = json.loads(url.read().decode())
-                    
-                    if isinstance(data, list):
-                        for i, d in enumerate(data):
-                            curr = d.get('current', {})
-                            x_pts.append(lons[i])
-                            y_pts.append(lats[i])
-                            z_temps.append(float(curr.get('temperature_2m', 15)))
-                            z_rhs.append(float(curr.get('relative_humidity_2m', 50)))
-                            z_wsps.append(float(curr.get('wind_speed_10m', 2)) / 3.6) # Importante: WSP está aquí
-                            z_wdrs.append(float(curr.get('wind_direction_10m', 0)))
+                data = fetched['openmeteo'].json()
+                
+                if isinstance(data, list):
+                    for i, d in enumerate(data):
+                        curr = d.get('current', {})
+                        x_pts.append(lons[i])
+                        y_pts.append(lats[i])
+                        z_temps.append(float(curr.get('temperature_2m', 15)))
+                        z_rhs.append(float(curr.get('relative_humidity_2m', 50)))
+                        z_wsps.append(float(curr.get('wind_speed_10m', 2)) / 3.6) # Importante: WSP está aquí
+                        z_wdrs.append(float(curr.get('wind_direction_10m', 0)))
+                else:
+                    # Fallback formato simple
+                    curr = data.get('current', {})
+                    t_val = curr.get('temperature_2m', 15)
+                    if isinstance(t_val, list):
+                        z_temps = t_val
+                        z_rhs = curr.get('relative_humidity_2m', [50]*15)
+                        z_wsps = [v/3.6 for v in curr.get('wind_speed_10m', [7.2]*15)]
+                        z_wdrs = curr.get('wind_direction_10m', [0]*15)
+                        x_pts = lons
+                        y_pts = lats
                     else:
-                        # Fallback formato simple
-                        curr = data.get('current', {})
-                        t_val = curr.get('temperature_2m', 15)
-                        if isinstance(t_val, list):
-                            z_temps = t_val
-                            z_rhs = curr.get('relative_humidity_2m', [50]*15)
-                            z_wsps = [v/3.6 for v in curr.get('wind_speed_10m', [7.2]*15)]
-                            z_wdrs = curr.get('wind_direction_10m', [0]*15)
-                            x_pts = lons
-                            y_pts = lats
-                        else:
-                            x_pts, y_pts = lons, lats
-                            z_temps = [float(curr.get('temperature_2m', 15))] * 15
-                            z_rhs = [float(curr.get('relative_humidity_2m', 50))] * 15
-                            z_wsps = [float(curr.get('wind_speed_10m', 7.2))/3.6] * 15
-                            z_wdrs = [float(curr.get('wind_direction_10m', 0))] * 15
-                            
+                        x_pts, y_pts = lons, lats
+                        z_temps = [float(curr.get('temperature_2m', 15))] * 15
+                        z_rhs = [float(curr.get('relative_humidity_2m', 50))] * 15
+                        z_wsps = [float(curr.get('wind_speed_10m', 7.2))/3.6] * 15
+                        z_wdrs = [float(curr.get('wind_direction_10m', 0))] * 15
+                        
                 print(f"   ✅ Datos OpenMeteo obtenidos exitosamente ({len(z_temps)} puntos).")
+                meteo_path = 'openmeteo'
                 
             except Exception as e:
                 print(f"   ⚠️ Error OpenMeteo: {e}. Usando valores default.")
@@ -587,21 +843,25 @@ def lambda_handler(event, context):
                 z_rhs = [60.0] * 15
                 z_wsps = [1.0] * 15
                 z_wdrs = [0.0] * 15
+                meteo_path = 'openmeteo_default'
 
         # 3. Interpolación Espacial (Sobrescribe grid_df con datos frescos)
         if len(x_pts) >= 3:
-            grid_df['tmp'] = interpolate_grid(grid_df, x_pts, y_pts, z_temps, method='linear')
-            grid_df['rh']  = interpolate_grid(grid_df, x_pts, y_pts, z_rhs,   method='linear')
-            grid_df['wsp'] = interpolate_grid(grid_df, x_pts, y_pts, z_wsps,  method='linear')
-            
-            # Interpolación vectorial WDR
+            # Interpolación vectorial WDR (u, v) junto con tmp/rh/wsp en una sola pasada
             u_vec = [-w * np.sin(np.radians(d)) for w, d in zip(z_wsps, z_wdrs)]
             v_vec = [-w * np.cos(np.radians(d)) for w, d in zip(z_wsps, z_wdrs)]
-            grid_u = interpolate_grid(grid_df, x_pts, y_pts, u_vec, method='linear')
-            grid_v = interpolate_grid(grid_df, x_pts, y_pts, v_vec, method='linear')
+            grid_df['tmp'], grid_df['rh'], grid_df['wsp'], grid_u, grid_v = interpolate_grid(
+                grid_df, x_pts, y_pts, z_temps, z_rhs, z_wsps, u_vec, v_vec
+            )
             grid_df['wdr'] = (np.degrees(np.arctan2(-grid_u, -grid_v))) % 360
+            if not USE_OPENMETEO: meteo_path = 'simat'
         else:
-            grid_df.fillna({'tmp': 15.0, 'rh': 50.0, 'wsp': 1.0, 'wdr': 0.0}, inplace=True)
+            # Sin puntos suficientes para linear: IDW sobre las estaciones que sí reportan
+            interpolate_meteo_idw(grid_df, stations_df)
+            meteo_path = 'idw'
+        # Ruta usada (simat | openmeteo | openmeteo_default | idw): va en el registro EMF y la reporta el replay
+        timer.annotate(meteo_path=meteo_path, meteo_points=len(x_pts))
+        print(f"🌦️ Meteorología: {meteo_path} ({len(x_pts)} puntos)")
 
         grid_df.fillna({'tmp': 15.0, 'rh': 50.0, 'wsp': 1.0, 'wdr': 0.0}, inplace=True)
         # --- [FIN BLOQUE C] ---
@@ -630,13 +890,18 @@ def lambda_handler(event, context):
         ]
         if 'wdr' not in grid_df.columns: grid_df['wdr'] = 90.0
 
+        # Inferencia por lotes: una matriz float32 por snapshot, una llamada por modelo
+        timer.begin('inferencia')
+        X_grid = build_feature_matrix(grid_df, feats)
+        base_preds = predict_all(models, X_grid, target_pollutants, feats)
+
         # --- [NUEVO ENCABEZADO DE LOGS] ---
         print("\n📊 REPORTE DE SALUD DEL SISTEMA (V58.3)")
         print("=" * 70)
         
         # 1. Auditoría de Datos de Entrada (Dinámico)
         # Crea una string bonita con todo lo que traiga counts > 0
-        api_details = " | ".join([f"{k.upper()}:{v}" for k, v in counts.items()])
+        api_details = " | ".join([f"{k.upper()}:{v}" for k, v in parse_stats.counts.items()])
         print(f"📡 API SIMAT    : {len(stations_raw)} Estaciones recibidas")
         print(f"📥 Desglose     : {api_details}")
         
@@ -647,15 +912,16 @@ def lambda_handler(event, context):
         print("=" * 70 + "\n")
 
         print(f"🚀 INICIANDO CALIBRACIÓN HÍBRIDA...")
+        timer.begin('calibracion')
 
         # --- BUCLE PRINCIPAL ---
         for p in target_pollutants:
             unit = "ppm" if p == "co" else ("ppb" if p in ["o3", "so2"] else "µg/m³")
             
             if p in models:
-                # 1. PREDICCIÓN BASE
+                # 1. PREDICCIÓN BASE (ya calculada por lotes)
                 # FIX: Convertimos a float64 explícitamente para evitar Warnings de Pandas
-                preds = models[p].predict(grid_df[feats]).clip(0)
+                preds = base_preds[p].clip(0)
                 grid_df[p] = preds.astype('float64') 
                 
                 # 2. CALIBRACIÓN INTELIGENTE
@@ -666,11 +932,7 @@ def lambda_handler(event, context):
                 
                 if real_col in stations_df.columns:
                     v_real_all = stations_df[['name', 'lat', 'lon', real_col]].copy()
-                    st_preds = []
-                    for _, st in v_real_all.iterrows():
-                        dist = ((grid_df['lat'] - st['lat'])**2 + (grid_df['lon'] - st['lon'])**2)
-                        st_preds.append(grid_df.at[dist.idxmin(), p])
-                    v_real_all['raw_ai'] = st_preds
+                    v_real_all['raw_ai'] = grid_df[p].values[station_cells]
                     
                     v_valid = v_real_all.dropna(subset=[real_col])
                     
@@ -753,53 +1015,15 @@ def lambda_handler(event, context):
         print("-" * 85)
 
         # F. Marcadores y Fuentes
-        grid_df['station'] = None
-        grid_df['sources'] = "{}"
+        timer.begin('marcadores')
+        inject_station_markers(grid_df, stations_df, station_cells, target_pollutants)
 
-        for _, st in stations_df.iterrows():
-            dist = ((grid_df['lat'] - st['lat'])**2 + (grid_df['lon'] - st['lon'])**2)
-            idx = dist.idxmin()
-            grid_df.at[idx, 'station'] = st['name']
-            
-            cell_sources = {}
-            # Química
-            for p in target_pollutants:
-                real_val = st.get(f'{p}_real')
-                if p == 'co': window = "8h"
-                elif p in ['pm10', 'pm25']: window = "12h"
-                else: window = "1h"
-                
-                if pd.notnull(real_val):
-                    grid_df.at[idx, p] = float(real_val)
-                    cell_sources[p] = f"Oficial {window}"
-                else:
-                    cell_sources[p] = f"IA {window}"
-            
-            # Meteorología (Incluyendo WDR)
-            for m in ['tmp', 'rh', 'wsp', 'wdr']:
-                real_met = st.get(m)
-                if pd.notnull(real_met):
-                    grid_df.at[idx, m] = float(real_met)
-                    cell_sources[m] = "Oficial"
-                else:
-                    cell_sources[m] = "IA"
-
-            grid_df.at[idx, 'sources'] = json.dumps(cell_sources)
-
-        # G. IAS y Riesgo
-        def calc_ias_row(row):
-            scores = {
-                'O3': get_ias_score(row['o3'], 'o3'), 
-                'PM10': get_ias_score(row['pm10'], 'pm10'), 
-                'PM2.5': get_ias_score(row['pm25'], 'pm25')
-            }
-            dom_pol = max(scores, key=scores.get)
-            return pd.Series([max(scores.values()), dom_pol])
-
-        grid_df[['ias', 'dominant']] = grid_df.apply(calc_ias_row, axis=1)
-        grid_df['risk'] = grid_df['ias'].apply(get_risk_level)
+        # G. IAS y Riesgo (vectorizado sobre columnas completas)
+        timer.begin('ias')
+        apply_ias(grid_df, ('o3', 'pm10', 'pm25'))
         
         # H. Exportación
+        timer.begin('serializacion')
         now_mx = datetime.now(ZoneInfo("America/Mexico_City"))
         str_time = now_mx.strftime("%Y-%m-%d %H:%M:%S")
 
@@ -841,19 +1065,14 @@ def lambda_handler(event, context):
                 print(f"⚠️ Error check {st_name}: {e}")
         print("-" * 30)
 
-        # Guardar
-        final_json = final_df.replace({np.nan: None}).to_json(orient='records')
-        s3_client.put_object(Bucket=S3_BUCKET, Key=S3_GRID_OUTPUT_KEY, Body=final_json, ContentType='application/json')
-        
-        timestamp_name = now_mx.strftime("%Y-%m-%d_%H-%M")
-        history_key = f"live_grid/grid_{timestamp_name}.json"
-        s3_client.put_object(Bucket=S3_BUCKET, Key=history_key, Body=final_json, ContentType='application/json')
+        # Guardar: publicación condicional por hash (latest, histórico, resumen de hoy en paralelo)
+        timer.begin('s3_escritura')
+        published = publish_grid(final_df, now_mx)
+        timestamp_name = published['timestamp']
+        timer.end()
         
         print(f"📦 SUCCESS: Grid Generado V58.3 (Logs Premium).")
         
-        # --- NUEVO: Generar el resumen de HOY inmediatamente después de guardar la malla actual ---
-        generate_today_summary()
-        
         return {
             'statusCode': 200, 
             'body': json.dumps({'message': 'Grid generado', 'timestamp': timestamp_name}),
@@ -0,0 +1,41 @@
+import os
+import sys
+import filecmp
+
+# --- 1. CONFIGURACIÓN ---
+# Las imágenes del Forecast Engine y de la API Ligera solo ven su carpeta, así que los módulos
+# compartidos de app/ viven copiados en ellas (deploy_forecast.sh / deploy_api_light.sh los sincronizan).
+# Cualquier .py de estas carpetas que también exista en app/ es una copia y debe ser idéntica.
+# Uso: python app/shared_modules.py  (sale con 1 si alguna copia quedó desfasada)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(REPO_ROOT, 'app')
+MIRROR_DIRS = [os.path.join(REPO_ROOT, 'forecast_engine', 'app'), os.path.join(REPO_ROOT, 'api_light')]
+# Mismo nombre pero código propio de cada Lambda
+NOT_SHARED = {'lambda_function.py'}
+
+
+def shared_copies():
+    """Pares (original en app/, copia) de todas las carpetas espejo"""
+    pairs = []
+    for mirror in MIRROR_DIRS:
+        if not os.path.isdir(mirror): continue
+        for name in sorted(os.listdir(mirror)):
+            source = os.path.join(SOURCE_DIR, name)
+            if name.endswith('.py') and name not in NOT_SHARED and os.path.isfile(source):
+                pairs.append((source, os.path.join(mirror, name)))
+    return pairs
+
+
+def check():
+    stale = [(src, dst) for src, dst in shared_copies() if not filecmp.cmp(src, dst, shallow=False)]
+    for src, dst in stale:
+        print(f"❌ {os.path.relpath(dst, REPO_ROOT)} difiere de {os.path.relpath(src, REPO_ROOT)}")
+    if stale:
+        print("   Sincronizar con deploy_forecast.sh / api_light/deploy_api_light.sh (o cp) y commitear las copias.")
+        return 1
+    print(f"✅ {len(shared_copies())} copias de módulos compartidos idénticas a app/")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(check())
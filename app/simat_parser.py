@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+
+# --- 1. ESQUEMA DECLARATIVO DEL PAYLOAD /air-quality/current ---
+# columna -> (grupo, llave API, ventana NOM-172, contador de salud)
+# CO usa 8 h, partículas 12 h; O3, SO2 y meteorología 1 h
+STATION_SCHEMA = [
+    ('o3_real',   'pollutants',    'o3',                'avg_1h',  'o3'),
+    ('pm10_real', 'pollutants',    'pm10',              'avg_12h', 'pm10'),
+    ('pm25_real', 'pollutants',    'pm25',              'avg_12h', 'pm25'),
+    ('co_real',   'pollutants',    'co',                'avg_8h',  'co'),
+    ('so2_real',  'pollutants',    'so2',               'avg_1h',  'so2'),
+    ('tmp',       'meteorological', 'temperature',       'avg_1h',  'tmp'),
+    ('rh',        'meteorological', 'relative_humidity', 'avg_1h',  'rh'),
+    ('wsp',       'meteorological', 'wind_speed',        'avg_1h',  'wsp'),
+    ('wdr',       'meteorological', 'wind_direction',    'avg_1h',  'wdr'),
+]
+GROUPS = ('pollutants', 'meteorological')
+# Columnas cuando el SIMAT no manda nada (contrato histórico del predictor: sin co/so2)
+EMPTY_COLUMNS = ['name', 'lat', 'lon', 'o3_real', 'pm10_real', 'pm25_real', 'tmp', 'rh', 'wsp']
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'simat_current_sample.json')
+
+# Compilado una sola vez al importar: (columna, índice de grupo, llave, ventana, contador)
+_COMPILED = tuple((col, GROUPS.index(group), key, window, counter) for col, group, key, window, counter in STATION_SCHEMA)
+
+
+# --- 2. ESTADÍSTICAS DE SALUD ---
+class ParseStats:
+    """Conteos del parseo (antes eran un efecto lateral sobre 'counts')"""
+
+    def __init__(self, received, parsed, valid, counts):
+        self.received = received   # elementos del payload
+        self.parsed = parsed       # elementos que sí son estaciones (dict)
+        self.valid = valid         # estaciones con coordenadas válidas
+        self.counts = counts       # lecturas no nulas por variable
+
+    @property
+    def rejected(self):
+        return self.parsed - self.valid
+
+    def health_line(self):
+        return f"📊 SALUD API: Recibidas {self.received} | O3:{self.counts['o3']} | TMP:{self.counts['tmp']}"
+
+    def as_dict(self):
+        return {'received': self.received, 'parsed': self.parsed, 'valid': self.valid, 'counts': dict(self.counts)}
+
+
+# --- 3. PARSER COLUMNAR ---
+def _group(s, name):
+    g = s.get(name)
+    return g if isinstance(g, dict) else {}
+
+
+def _pick(group, key, window):
+    """grupo[llave][ventana]['value']; cualquier nivel que no sea dict -> None"""
+    obj = group.get(key)
+    if not isinstance(obj, dict): return None
+    inner = obj.get(window)
+    return inner.get('value') if isinstance(inner, dict) else None
+
+
+def parse_stations(stations_raw):
+    """
+    Payload SIMAT -> (stations_df, ParseStats) en una sola pasada por las estaciones
+    (todas las columnas del esquema se llenan en el mismo recorrido).
+    Las coordenadas se validan en bloque (no numéricas, vacías o 0 se descartan).
+    """
+    stations_raw = stations_raw or []
+    columns = {'name': [], 'lat': [], 'lon': [], **{col: [] for col, *_ in _COMPILED}}
+    for s in stations_raw:
+        if not isinstance(s, dict): continue
+        groups = (_group(s, 'pollutants'), _group(s, 'meteorological'))
+        columns['name'].append(s.get('station_name', 'Unknown'))
+        columns['lat'].append(s.get('latitude') or None)
+        columns['lon'].append(s.get('longitude') or None)
+        for col, gi, key, window, _ in _COMPILED:
+            columns[col].append(_pick(groups[gi], key, window))
+    n_parsed = len(columns['name'])
+    counts = {counter: n_parsed - columns[col].count(None) for col, _, _, _, counter in _COMPILED}
+
+    if not n_parsed:
+        stats = ParseStats(len(stations_raw), 0, 0, counts)
+        return pd.DataFrame(columns=EMPTY_COLUMNS), stats
+
+    df = pd.DataFrame(columns)
+    df['lat'] = pd.to_numeric(df['lat'], errors='coerce').astype(float)
+    df['lon'] = pd.to_numeric(df['lon'], errors='coerce').astype(float)
+    df = df[np.isfinite(df['lat'].values) & np.isfinite(df['lon'].values)]
+    return df, ParseStats(len(stations_raw), n_parsed, len(df), counts)
+
+
+# --- 4. REFERENCIA (parser por estación anterior) Y BENCHMARK ---
+def _legacy_parse(stations_raw):
+    counts = {"o3": 0, "pm10": 0, "pm25": 0, "co": 0, "so2": 0, "tmp": 0, "rh": 0, "wsp": 0, "wdr": 0}
+    parsed = []
+    for s in stations_raw:
+        if not isinstance(s, dict): continue
+        pol = s.get('pollutants') or {}
+        met = s.get('meteorological') or {}
+
+        def safe_val(d, key, c_key):
+            obj = d.get(key)
+            if isinstance(obj, dict):
+                if key == 'co': target_window = 'avg_8h'
+                elif key in ['pm10', 'pm25']: target_window = 'avg_12h'
+                else: target_window = 'avg_1h'
+                inner = obj.get(target_window)
+                if isinstance(inner, dict):
+                    val = inner.get('value')
+                    if val is not None:
+                        if c_key in counts: counts[c_key] += 1
+                        return val
+            return None
+
+        parsed.append({
+            'name': s.get('station_name', 'Unknown'),
+            'lat': float(s.get('latitude')) if s.get('latitude') else None,
+            'lon': float(s.get('longitude')) if s.get('longitude') else None,
+            'o3_real': safe_val(pol, 'o3', 'o3'), 'pm10_real': safe_val(pol, 'pm10', 'pm10'),
+            'pm25_real': safe_val(pol, 'pm25', 'pm25'), 'co_real': safe_val(pol, 'co', 'co'),
+            'so2_real': safe_val(pol, 'so2', 'so2'), 'tmp': safe_val(met, 'temperature', 'tmp'),
+            'rh': safe_val(met, 'relative_humidity', 'rh'), 'wsp': safe_val(met, 'wind_speed', 'wsp'),
+            'wdr': safe_val(met, 'wind_direction', 'wdr')
+        })
+    if not parsed:
+        return pd.DataFrame(columns=EMPTY_COLUMNS), counts
+    return pd.DataFrame(parsed).dropna(subset=['lat', 'lon']), counts
+
+
+def load_fixture(path=FIXTURE_PATH):
+    with open(path) as f:
+        return json.load(f)['stations']
+
+
+def fixture_source(path=FIXTURE_PATH):
+    """'record' si el fixture es una respuesta real grabada con app.replay; 'synthetic' si no"""
+    with open(path) as f:
+        return json.load(f).get('_source', 'synthetic')
+
+
+def payload_shapes(stations):
+    """
+    Cuántas estaciones traen cada forma de meteorología: anidada (temperature.avg_1h.value, la que lee
+    este parser) y plana (tmp + location.lat/lon, la que lee el Bloque C del predictor)
+    """
+    stations = [s for s in stations if isinstance(s, dict)]
+    met = [_group(s, 'meteorological') for s in stations]
+    return {
+        'nested': sum(1 for m in met if _pick(m, 'temperature', 'avg_1h') is not None),
+        'flat': sum(1 for m in met if 'tmp' in m),
+        'location': sum(1 for s in stations if isinstance(s.get('location'), dict))
+    }
+
+
+def check(path=FIXTURE_PATH):
+    """El parser columnar debe dar el mismo DataFrame y los mismos conteos que el anterior"""
+    stations = load_fixture(path)
+    for sample in (stations, [], [s for s in stations if not isinstance(s, dict)]):
+        ref_df, ref_counts = _legacy_parse(sample)
+        df, stats = parse_stations(sample)
+        pd.testing.assert_frame_equal(ref_df, df)
+        assert ref_counts == stats.counts, (ref_counts, stats.counts)
+    df, stats = parse_stations(stations)
+    print(f"✅ Parser SIMAT idéntico al anterior sobre el fixture: {stats.as_dict()}")
+    print(f"🔎 Formas de meteorología en el fixture: {payload_shapes(stations)}")
+    if fixture_source(path) != 'record':
+        print("⚠️ Fixture sintético: no confirma qué forma manda producción. "
+              "Grabar uno real con: python -m app.replay record <carpeta> --parser-fixture")
+    return stats
+
+
+def benchmark(mult=10, repeats=20):
+    """Throughput con 'mult' veces las estaciones del fixture (redes de sensores de bajo costo)"""
+    base = [s for s in load_fixture() if isinstance(s, dict)]
+    stations = [{**s, 'station_name': f"{s.get('station_name')}_{i}"} for i in range(mult) for s in base]
+
+    t0 = time.perf_counter()
+    for _ in range(repeats): _legacy_parse(stations)
+    t_ref = (time.perf_counter() - t0) / repeats
+
+    t0 = time.perf_counter()
+    for _ in range(repeats): parse_stations(stations)
+    t_new = (time.perf_counter() - t0) / repeats
+
+    print(f"📊 Parseo de {len(stations)} estaciones ({mult}x el fixture)")
+    print(f"   por estación (anterior): {t_ref * 1000:7.2f} ms ({len(stations) / t_ref:,.0f} est/s)")
+    print(f"   columnar (esquema)     : {t_new * 1000:7.2f} ms ({len(stations) / t_new:,.0f} est/s, {t_ref / t_new:.1f}x)")
+    return {'legacy_s': t_ref, 'columnar_s': t_new}
+
+
+if __name__ == '__main__':
+    check()
+    benchmark()
+    sys.exit(0)
@@ -0,0 +1,157 @@
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import resource
+from contextlib import contextmanager
+
+# --- 1. CONFIGURACIÓN ---
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Smability/AirGrid')
+PROFILE_DIR = "/tmp"
+PROFILE_S3_PREFIX = "profiles/"
+
+# Último registro emitido (para el harness de replay y logs estructurados)
+_LAST_RECORD = {}
+
+
+def _peak_rss_mb():
+    # ru_maxrss viene en KB en Linux (Lambda)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# --- 2. CRONÓMETRO POR ETAPA ---
+class StageTimer:
+    """
+    Registra tiempo de pared, CPU y pico de RSS por etapa.
+    Uso: 'with timer.stage("inferencia"):' para bloques cortos, o timer.begin("x") /
+    timer.begin("y") / timer.end() para tramos largos del handler (cada begin cierra la anterior).
+    """
+
+    def __init__(self, run_name):
+        self.run_name = run_name
+        self.stages = []
+        self.properties = {}
+        self._current = None
+        self._t0 = time.perf_counter()
+
+    def begin(self, name):
+        self.end()
+        self._current = (name, time.perf_counter(), time.process_time(), _peak_rss_mb())
+
+    def end(self):
+        if self._current is None: return
+        name, wall0, cpu0, rss0 = self._current
+        rss = _peak_rss_mb()
+        self.stages.append({
+            'stage': name,
+            'wall_ms': round((time.perf_counter() - wall0) * 1000, 1),
+            'cpu_ms': round((time.process_time() - cpu0) * 1000, 1),
+            'peak_rss_mb': rss,
+            'rss_growth_mb': round(rss - rss0, 1)
+        })
+        self._current = None
+
+    @contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def annotate(self, **properties):
+        """Propiedades de la corrida (p.ej. la ruta de meteorología) que viajan en el registro EMF"""
+        self.properties.update(properties)
+
+    def summary(self):
+        """Tabla corta para los logs (además del registro EMF)"""
+        total = sum(s['wall_ms'] for s in self.stages) or 1.0
+        lines = [f"⏱️ ETAPAS ({self.run_name})", f"{'Etapa':<18} | {'Pared ms':>9} | {'CPU ms':>9} | {'%':>5} | {'RSS MB':>7}"]
+        for s in self.stages:
+            lines.append(f"{s['stage']:<18} | {s['wall_ms']:>9.1f} | {s['cpu_ms']:>9.1f} | {100 * s['wall_ms'] / total:>5.1f} | {s['peak_rss_mb']:>7.1f}")
+        return "\n".join(lines)
+
+    def emit(self, status='ok', **properties):
+        """
+        Un solo registro JSON en CloudWatch Embedded Metric Format por corrida.
+        CloudWatch lo convierte en métricas (Namespace METRICS_NAMESPACE, dimensión Function).
+        """
+        self.end()
+        metrics = []
+        record = {}
+        for s in self.stages:
+            for field, unit in (('wall_ms', 'Milliseconds'), ('cpu_ms', 'Milliseconds'), ('peak_rss_mb', 'Megabytes')):
+                key = f"{s['stage']}.{field}"
+                metrics.append({'Name': key, 'Unit': unit})
+                record[key] = s[field]
+        total_ms = round((time.perf_counter() - self._t0) * 1000, 1)
+        metrics.append({'Name': 'total.wall_ms', 'Unit': 'Milliseconds'})
+        record['total.wall_ms'] = total_ms
+
+        emf = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Function']],
+                    'Metrics': metrics
+                }]
+            },
+            'Function': self.run_name,
+            'status': status,
+            **record,
+            **self.properties,
+            **properties
+        }
+        print(json.dumps(emf, default=str))
+        global _LAST_RECORD
+        _LAST_RECORD = {'status': status, 'total_ms': total_ms, 'stages': [dict(s) for s in self.stages],
+                        'properties': {**self.properties, **properties}}
+        return emf
+
+
+def get_last_record():
+    """Etapas de la última corrida emitida"""
+    return dict(_LAST_RECORD)
+
+
+# --- 3. PERFIL OPCIONAL (cProfile) ---
+class ProfileSession:
+    """
+    cProfile solo si el evento lo pide: {"profile": true} -> /tmp/<run>_<ts>.prof,
+    {"profile": "s3"} -> además se sube a S3 (o al cliente sustituto que se inyecte).
+    """
+
+    def __init__(self, event, run_name, s3_client=None, bucket=None):
+        flag = (event or {}).get('profile')
+        self.enabled = bool(flag)
+        self.upload = flag == 's3'
+        self.run_name = run_name
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.path = None
+        self._prof = cProfile.Profile() if self.enabled else None
+
+    def __enter__(self):
+        if self.enabled: self._prof.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.enabled: return False
+        self._prof.disable()
+        try:
+            self.path = f"{PROFILE_DIR}/{self.run_name}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.prof"
+            self._prof.dump_stats(self.path)
+            top = io.StringIO()
+            pstats.Stats(self._prof, stream=top).sort_stats('cumulative').print_stats(15)
+            print(f"🔎 [PROFILE] {self.path}\n{top.getvalue()}")
+            if self.upload and self.s3_client is not None:
+                key = f"{PROFILE_S3_PREFIX}{os.path.basename(self.path)}"
+                with open(self.path, 'rb') as f:
+                    self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=f.read(), ContentType='application/octet-stream')
+                print(f"🔎 [PROFILE] Subido a s3://{self.bucket}/{key}")
+        except Exception as e:
+            print(f"⚠️ [PROFILE] No se pudo guardar el perfil: {e}")
+        return False
@@ -0,0 +1,105 @@
+import os
+import json
+import gzip
+import time
+import threading
+
+# --- 1. CONFIGURACIÓN ---
+STATION_CACHE_KEY = os.environ.get('STATION_CACHE_KEY', 'live_grid/station_cache.json.gz')
+# Si la caché completa es más joven que esto (s), la corrida no toca la red (reintentos, disparos manuales).
+# Debe quedar muy por debajo del periodo del cron (5 min): la edad se cuenta desde el inicio de la
+# corrida que llamó al SIMAT, así que la siguiente corrida programada siempre ve ~300 s y vuelve a llamar.
+STATION_CACHE_TTL = float(os.environ.get('STATION_CACHE_TTL', '60'))
+# Edad máxima (s) de una estación para rellenar huecos del SIMAT; más vieja ya no calibra
+STATION_MAX_AGE = float(os.environ.get('STATION_MAX_AGE', '10800'))
+
+# Última lectura buena por estación: memoria del contenedor + un objeto pequeño en S3
+_CACHE = {'stations': {}, 'updated_at': 0.0, 'loaded': False, 'dirty': False}
+_LOCK = threading.Lock()
+
+
+def _station_key(s):
+    name = s.get('station_name')
+    return name if name else f"{s.get('latitude')},{s.get('longitude')}"
+
+
+def load(s3_client, bucket):
+    """Carga la caché desde S3 una sola vez por contenedor (cold start)"""
+    if _CACHE['loaded']: return
+    with _LOCK:
+        if _CACHE['loaded']: return
+        _CACHE['loaded'] = True
+        try:
+            obj = s3_client.get_object(Bucket=bucket, Key=STATION_CACHE_KEY)
+            payload = json.loads(gzip.decompress(obj['Body'].read()).decode('utf-8'))
+            _CACHE['stations'] = payload.get('stations', {})
+            _CACHE['updated_at'] = float(payload.get('updated_at', 0.0))
+            print(f"♻️ Caché de estaciones cargada de S3: {len(_CACHE['stations'])} estaciones, edad {age_s() / 60:.1f} min")
+        except Exception as e:
+            print(f"ℹ️ Sin caché de estaciones en S3 ({e})")
+
+
+def age_s(now=None):
+    """Segundos desde el inicio de la corrida que trajo la última respuesta buena del SIMAT"""
+    if not _CACHE['updated_at']: return float('inf')
+    return (now or time.time()) - _CACHE['updated_at']
+
+
+def is_fresh(now=None, ttl=None):
+    ttl = STATION_CACHE_TTL if ttl is None else ttl
+    return bool(_CACHE['stations']) and age_s(now) < ttl
+
+
+def snapshot(now=None, max_age=None):
+    """
+    Estaciones de la caché con su edad ('_age_s'); las más viejas que max_age se descartan.
+    Regresa copias con la forma del payload del SIMAT (el parser las lee igual).
+    """
+    now = now or time.time()
+    max_age = STATION_MAX_AGE if max_age is None else max_age
+    out = []
+    for rec in list(_CACHE['stations'].values()):
+        age = now - rec['observed_at']
+        if age > max_age: continue
+        out.append({**rec['station'], '_age_s': round(age, 1)})
+    return out
+
+
+def blend(fresh, now=None):
+    """
+    Mezcla la respuesta del SIMAT con la caché. Las estaciones frescas (edad 0) ganan; las que
+    faltan en esta corrida se rellenan con su última lectura si no rebasan STATION_MAX_AGE.
+    Actualiza la caché con las frescas. `now` debe ser el inicio de la corrida (no el fin de la
+    descarga) para que la edad no se acorte con la latencia del SIMAT. Regresa (estaciones, stats).
+    """
+    now = now or time.time()
+    fresh = [s for s in (fresh or []) if isinstance(s, dict)]
+    with _LOCK:
+        for s in fresh:
+            _CACHE['stations'][_station_key(s)] = {'station': s, 'observed_at': now}
+        if fresh:
+            _CACHE['updated_at'] = now
+            _CACHE['dirty'] = True
+
+    seen = {_station_key(s) for s in fresh}
+    stale = [s for s in snapshot(now) if _station_key(s) not in seen]
+    stats = {
+        'fresh': len(fresh),
+        'from_cache': len(stale),
+        'max_age_min': round(max((s['_age_s'] for s in stale), default=0.0) / 60, 1)
+    }
+    return fresh + stale, stats
+
+
+def persist(s3_client, bucket):
+    """Sube la caché si cambió en esta corrida (objeto pequeño: una lectura por estación)"""
+    if not _CACHE['dirty']: return
+    try:
+        with _LOCK:
+            body = json.dumps({'updated_at': _CACHE['updated_at'], 'stations': _CACHE['stations']})
+            _CACHE['dirty'] = False
+        s3_client.put_object(Bucket=bucket, Key=STATION_CACHE_KEY, Body=gzip.compress(body.encode('utf-8')),
+                             ContentType='application/json', ContentEncoding='gzip')
+    except Exception as e:
+        _CACHE['dirty'] = True
+        print(f"⚠️ No se pudo guardar la caché de estaciones: {e}")
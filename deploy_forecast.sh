@@ -11,22 +11,28 @@ ZIP_FILE="forecast_source.zip"
 
 echo "🔵 Iniciando Despliegue del FORECAST ENGINE..."
 
-# 1. Empaquetado desde la carpeta forecast_engine
+# 1. Sincronizar módulos compartidos con el Predictor Live (app/ -> forecast_engine/app/)
+echo "🔗 Sincronizando módulos compartidos..."
+for MODULE in ias_engine.py model_registry.py inference_engine.py summary_format.py spatial_interp.py grid_store.py; do
+    cp app/$MODULE forecast_engine/app/$MODULE
+done
+
+# 2. Empaquetado desde la carpeta forecast_engine
 echo "📦 Comprimiendo código fuente..."
 cd forecast_engine
 # Comprimimos el contenido para que al descomprimir quede en la raíz
 zip -r -q ../$ZIP_FILE . -x "__pycache__/*" "*.git*" "*.DS_Store*"
 cd ..
 
-# 2. Subida a S3
+# 3. Subida a S3
 echo "📤 Subiendo source a S3..."
 aws s3 cp $ZIP_FILE s3://$BUCKET_NAME/$ZIP_FILE
 
-# 3. Disparo de CodeBuild
+# 4. Disparo de CodeBuild
 echo "🚀 Disparando CodeBuild: $PROJECT_NAME"
 BUILD_ID=$(aws codebuild start-build --project-name $PROJECT_NAME --query 'build.id' --output text)
 
-# 4. Limpieza y Links
+# 5. Limpieza y Links
 echo "------------------------------------------------------------"
 echo "✅ BUILD LANZADO"
 echo "🔗 RASTREO: https://$REGION.console.aws.amazon.com/codesuite/codebuild/projects/$PROJECT_NAME/build/$BUILD_ID/?region=$REGION"
@@ -0,0 +1,293 @@
+import json
+import mmap
+import os
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# --- 1. CONFIGURACIÓN Y RUTAS ---
+BASE_PATH = os.environ.get('LAMBDA_TASK_ROOT', '/var/task')
+
+# Subir esta versión cada vez que cambie el layout binario o la lógica de cruce espacial
+# (v2: el header lleva el sha256 de las columnas y se verifica al leer)
+GRID_STORE_VERSION = 2
+GRID_STORE_MAGIC = b"SMGRID01"
+GRID_STORE_ALIGN = 64
+GRID_STORE_PATH = f"{BASE_PATH}/app/artifacts/grid_static_v{GRID_STORE_VERSION}.bin"
+
+MALLA_PATH = f"{BASE_PATH}/app/geograficos/malla_valle_mexico_final.geojson"
+COLONIAS_PATH = f"{BASE_PATH}/app/geograficos/grid_colonias_db.json"
+EDIFICIOS_PATH = f"{BASE_PATH}/app/geograficos/capa_edificios_v2.json"
+
+# Orden final de columnas (idéntico al que producía prepare_grid_features)
+GRID_COLUMNS = ['lon', 'lat', 'altitude', 'col', 'mun', 'edo', 'pob', 'building_vol']
+NUMERIC_COLUMNS = ['lon', 'lat', 'altitude', 'building_vol']
+CATEGORY_COLUMNS = ['col', 'mun', 'edo']
+
+# Frame, árbol espacial y huella en memoria: se construyen una sola vez por contenedor.
+# Predictor Live y Forecast Engine comparten este módulo: misma huella = mismas celdas.
+_GRID_FRAME = None
+_GRID_TREE = None
+_GRID_DIGEST = None
+
+
+# --- 2. CONSTRUCCIÓN DESDE LOS JSON FUENTE ---
+def _spatial_merge(target, source, cols_to_merge):
+    """Cruce por vecino más cercano (KDTree) de la FUENTE hacia la malla"""
+    if source.empty:
+        for c in cols_to_merge: target[c] = 0 if c == 'building_vol' else None
+        return
+
+    tree = cKDTree(source[['lat', 'lon']].values)
+    dists, idxs = tree.query(target[['lat', 'lon']].values, k=1)
+
+    for c in cols_to_merge:
+        if c in source.columns:
+            target[c] = source.iloc[idxs][c].values
+
+
+def build_static_grid(malla_path=MALLA_PATH, colonias_path=COLONIAS_PATH, edificios_path=EDIFICIOS_PATH):
+    """
+    Parsea malla + colonias + edificios y ejecuta los cruces espaciales.
+    Es la ruta lenta: solo se usa en el paso de build o como respaldo.
+    """
+    with open(malla_path, 'r') as f:
+        malla_data = json.load(f)
+
+    malla_list = []
+    for feature in malla_data['features']:
+        coords = feature['geometry']['coordinates']
+        malla_list.append({
+            'lon': coords[0],
+            'lat': coords[1],
+            'altitude': feature['properties'].get('elevation', 2240)
+        })
+    grid_df = pd.DataFrame(malla_list)
+
+    try:
+        with open(colonias_path, 'r') as f:
+            cols_df = pd.DataFrame(json.load(f))
+    except:
+        cols_df = pd.DataFrame()
+
+    try:
+        with open(edificios_path, 'r') as f:
+            edificios_df = pd.DataFrame(json.load(f))
+    except:
+        edificios_df = pd.DataFrame()
+
+    _spatial_merge(grid_df, cols_df, ['col', 'mun', 'edo', 'pob'])
+    _spatial_merge(grid_df, edificios_df, ['building_vol'])
+
+    grid_df['col'] = grid_df['col'].fillna("Zona Federal / Sin Colonia")
+    grid_df['mun'] = grid_df['mun'].fillna("Valle de México")
+    grid_df['pob'] = grid_df['pob'].fillna(0).astype(int)
+    grid_df['building_vol'] = grid_df['building_vol'].fillna(0)
+
+    return grid_df[GRID_COLUMNS]
+
+
+# --- 3. FORMATO BINARIO (ESCRITURA) ---
+def _encode_numeric(values):
+    """
+    Elige la codificación más compacta que reproduce el valor EXACTO:
+    float32 + redondeo a N decimales, punto fijo int32, o float64 como último recurso.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    for decimals in range(0, 7):
+        f32 = values.astype(np.float32)
+        if np.array_equal(np.round(f32.astype(np.float64), decimals), values):
+            return f32, {'encoding': 'float32', 'decimals': decimals}
+    for decimals in range(0, 7):
+        scaled = np.round(values * 10**decimals)
+        if np.abs(scaled).max(initial=0) < 2**31 and np.array_equal(scaled / 10**decimals, values):
+            return scaled.astype(np.int32), {'encoding': 'fixed', 'decimals': decimals}
+    return values, {'encoding': 'float64'}
+
+
+def _encode_category(values):
+    """Diccionario ordenado + códigos int32 (-1 = nulo)"""
+    series = pd.Series(values, dtype=object)
+    valid = series.notna()
+    categories = sorted(series[valid].unique().tolist())
+    lookup = {c: i for i, c in enumerate(categories)}
+    codes = np.full(len(series), -1, dtype=np.int32)
+    codes[valid.values] = [lookup[v] for v in series[valid]]
+    return codes, {'encoding': 'dictionary', 'categories': categories}
+
+
+def _hash_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _encode_columns(grid_df):
+    """(metadatos por columna, arreglos codificados) en el orden de GRID_COLUMNS"""
+    buffers = []
+    columns = []
+    for name in GRID_COLUMNS:
+        if name in NUMERIC_COLUMNS:
+            arr, meta = _encode_numeric(grid_df[name].values)
+        elif name in CATEGORY_COLUMNS:
+            arr, meta = _encode_category(grid_df[name].values)
+        else:
+            arr, meta = np.asarray(grid_df[name].values, dtype=np.int32), {'encoding': 'int32'}
+        buffers.append(np.ascontiguousarray(arr))
+        columns.append({'name': name, 'dtype': arr.dtype.str, **meta})
+    return columns, buffers
+
+
+def _digest(columns, buffers):
+    """sha256 de las columnas codificadas (datos + diccionarios), independiente del padding"""
+    h = hashlib.sha256()
+    for col, buf in zip(columns, buffers):
+        h.update(json.dumps({k: v for k, v in col.items() if k != 'offset'}, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        h.update(buf.tobytes())
+    return h.hexdigest()
+
+
+def grid_digest(grid_df):
+    """Huella de un frame estático (la misma que lleva el artefacto construido con él)"""
+    return _digest(*_encode_columns(grid_df))
+
+
+def write_grid_store(grid_df, path=GRID_STORE_PATH, sources=None):
+    """
+    Serializa el frame estático en un único archivo columnar versionado:
+    MAGIC | uint32 largo_header | header JSON | columnas alineadas a 64 bytes.
+    """
+    columns, buffers = _encode_columns(grid_df)
+    content_sha256 = _digest(columns, buffers)
+
+    def _align(n):
+        return (n + GRID_STORE_ALIGN - 1) // GRID_STORE_ALIGN * GRID_STORE_ALIGN
+
+    # El offset de datos depende del largo del header, y el header contiene los offsets.
+    # Reservamos el header con offsets provisionales y recalculamos hasta que se estabilice.
+    data_start = 0
+    while True:
+        offset = data_start
+        for col, buf in zip(columns, buffers):
+            col['offset'] = offset
+            offset = _align(offset + buf.nbytes)
+        header = json.dumps({
+            'version': GRID_STORE_VERSION,
+            'n_cells': len(grid_df),
+            'columns': columns,
+            'sources': sources or {},
+            'content_sha256': content_sha256
+        }, ensure_ascii=False).encode('utf-8')
+        needed = _align(len(GRID_STORE_MAGIC) + 4 + len(header))
+        if needed == data_start: break
+        data_start = needed
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(GRID_STORE_MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for col, buf in zip(columns, buffers):
+            f.write(b'\0' * (col['offset'] - f.tell()))
+            f.write(buf.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+# --- 4. FORMATO BINARIO (LECTURA) ---
+def read_grid_store(path=GRID_STORE_PATH):
+    """
+    Mapea el archivo en memoria y reconstruye el DataFrame de la malla.
+    Verifica el sha256 del header; regresa (DataFrame, huella).
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mm[:len(GRID_STORE_MAGIC)] != GRID_STORE_MAGIC:
+        raise ValueError(f"Archivo de malla inválido: {path}")
+    pos = len(GRID_STORE_MAGIC)
+    header_len = int(np.frombuffer(mm, dtype=np.uint32, count=1, offset=pos)[0])
+    header = json.loads(mm[pos + 4:pos + 4 + header_len].decode('utf-8'))
+    if header.get('version') != GRID_STORE_VERSION:
+        raise ValueError(f"Versión de malla {header.get('version')} != {GRID_STORE_VERSION}")
+
+    n = header['n_cells']
+    arrays = [np.frombuffer(mm, dtype=np.dtype(col['dtype']), count=n, offset=col['offset']) for col in header['columns']]
+    digest = _digest(header['columns'], arrays)
+    if digest != header.get('content_sha256'):
+        raise ValueError(f"Malla corrupta: sha256 {digest[:12]} != {str(header.get('content_sha256'))[:12]}")
+
+    data = {}
+    for col, arr in zip(header['columns'], arrays):
+        enc = col['encoding']
+        if enc == 'float32':
+            data[col['name']] = np.round(arr.astype(np.float64), col['decimals'])
+        elif enc == 'fixed':
+            data[col['name']] = arr.astype(np.float64) / 10**col['decimals']
+        elif enc == 'float64':
+            data[col['name']] = arr.copy()
+        elif enc == 'dictionary':
+            categories = np.array(col['categories'] + [None], dtype=object)
+            data[col['name']] = categories[arr]
+        else:
+            data[col['name']] = arr.astype(np.int64)
+
+    return pd.DataFrame(data)[GRID_COLUMNS], digest
+
+
+def get_static_grid():
+    """
+    Devuelve una copia de la malla estática (geografía + admin + edificios).
+    Se lee del artefacto binario una vez por contenedor; si falta, es de otra
+    versión o no pasa la verificación, se reconstruye desde los JSON para no tumbar la corrida.
+    """
+    global _GRID_FRAME, _GRID_DIGEST
+    if _GRID_FRAME is None:
+        try:
+            _GRID_FRAME, _GRID_DIGEST = read_grid_store()
+            print(f"⚡ Malla estática mapeada desde {os.path.basename(GRID_STORE_PATH)} ({len(_GRID_FRAME)} celdas, sha256 {_GRID_DIGEST[:12]}).")
+        except Exception as e:
+            print(f"⚠️ Artefacto de malla no disponible ({e}). Reconstruyendo desde JSON...")
+            _GRID_FRAME = build_static_grid()
+            _GRID_DIGEST = grid_digest(_GRID_FRAME)
+    return _GRID_FRAME.copy()
+
+
+def get_static_grid_digest():
+    """sha256 de la malla en memoria (igual en ambas Lambdas si parten de las mismas celdas)"""
+    if _GRID_FRAME is None: get_static_grid()
+    return _GRID_DIGEST
+
+
+def get_grid_tree():
+    """KDTree sobre (lat, lon) de la malla estática; las posiciones coinciden con get_static_grid()"""
+    global _GRID_TREE
+    if _GRID_TREE is None:
+        if _GRID_FRAME is None: get_static_grid()
+        _GRID_TREE = cKDTree(_GRID_FRAME[['lat', 'lon']].values)
+    return _GRID_TREE
+
+
+# --- 5. PASO DE BUILD ---
+def main(path=GRID_STORE_PATH):
+    """Genera el artefacto y verifica que la lectura sea idéntica a la ruta JSON"""
+    grid_df = build_static_grid()
+    sources = {os.path.basename(p): _hash_file(p) for p in (MALLA_PATH, COLONIAS_PATH, EDIFICIOS_PATH)}
+    write_grid_store(grid_df, path, sources=sources)
+
+    loaded, digest = read_grid_store(path)
+    pd.testing.assert_frame_equal(
+        loaded.astype(object).where(loaded.notna(), None),
+        grid_df.astype(object).where(grid_df.notna(), None)
+    )
+    print(f"✅ Malla estática v{GRID_STORE_VERSION}: {len(grid_df)} celdas -> {path} ({os.path.getsize(path)} bytes, sha256 {digest})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# --- 1. CONFIGURACIÓN ---
+# Orden canónico de features con el que se entrenaron los 5 modelos
+FEATURES_IA = [
+    'lat', 'lon', 'altitude', 'building_vol', 'station_numeric',
+    'hour_sin', 'hour_cos', 'month_sin', 'month_cos',
+    'tmp', 'rh', 'wsp', 'wdr'
+]
+# Hilos de XGBoost para inferencia (0 = todos los núcleos disponibles)
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '0'))
+
+
+# --- 2. MATRIZ DE FEATURES ---
+def build_feature_matrix(frames, feats=FEATURES_IA):
+    """
+    Una sola matriz float32 contigua (filas × features) por snapshot.
+    Acepta un DataFrame o una lista de DataFrames (p.ej. las 24 horas del forecast),
+    que se apilan en el mismo orden.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    n_rows = sum(len(f) for f in frames)
+    X = np.empty((n_rows, len(feats)), dtype=np.float32)
+    start = 0
+    for f in frames:
+        for j, c in enumerate(feats):
+            X[start:start + len(f), j] = f[c].to_numpy(dtype=np.float32)
+        start += len(f)
+    return X
+
+
+def build_feature_tensor(sources, shape, feats=FEATURES_IA):
+    """
+    Misma matriz que build_feature_matrix sobre la lista de horas, armada directo del tensor
+    del forecast. sources: {feature: arreglo difundible a shape=(horas, celdas)}: estáticos
+    (celdas,), por hora (horas, 1) o completos (horas, celdas). Filas en orden hora-mayor.
+    """
+    n_hours, n_cells = shape
+    X = np.empty((n_hours, n_cells, len(feats)), dtype=np.float32)
+    for j, c in enumerate(feats):
+        X[:, :, j] = np.asarray(sources[c], dtype=np.float64).astype(np.float32)
+    return X.reshape(n_hours * n_cells, len(feats))
+
+
+def _iteration_range(model):
+    """Mismo rango de árboles que usa XGBRegressor.predict (respeta early stopping)"""
+    try: return (0, model.best_iteration + 1)
+    except AttributeError: return (0, 0)
+
+
+def _column_order(booster, feats):
+    """Permutación de columnas si el modelo se entrenó con otro orden de features"""
+    names = booster.feature_names
+    if not names or list(names) == list(feats):
+        return None
+    missing = [n for n in names if n not in feats]
+    if missing:
+        raise ValueError(f"Features faltantes para el modelo: {missing}")
+    return [feats.index(n) for n in names]
+
+
+# --- 3. INFERENCIA POR LOTES ---
+def predict_all(models, X, pollutants, feats=FEATURES_IA, nthread=INFERENCE_THREADS):
+    """
+    Alimenta todos los boosters con la misma matriz vía inplace_predict
+    (sin DataFrame -> DMatrix por llamada). Regresa {contaminante: float32[filas]}.
+    Contaminantes sin modelo no aparecen en el resultado.
+    """
+    preds = {}
+    for p in pollutants:
+        model = models.get(p)
+        if model is None: continue
+        booster = model.get_booster()
+        if nthread:
+            booster.set_param({'nthread': nthread})
+        order = _column_order(booster, feats)
+        data = X if order is None else np.ascontiguousarray(X[:, order])
+        preds[p] = booster.inplace_predict(
+            data,
+            iteration_range=_iteration_range(model),
+            missing=model.missing,
+            validate_features=False
+        )
+    return preds
+
+
+def split_rows(preds, sizes):
+    """Parte las predicciones apiladas de vuelta en bloques (uno por snapshot/hora)"""
+    bounds = np.cumsum([0] + list(sizes))
+    return [{p: v[bounds[i]:bounds[i + 1]] for p, v in preds.items()} for i in range(len(sizes))]
+
+
+# --- 4. MICRO-BENCHMARK ---
+def _synthetic_models(feats, pollutants, seed=0):
+    import xgboost as xgb
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.uniform(0, 1, (2000, len(feats))), columns=feats)
+    models = {}
+    for i, p in enumerate(pollutants):
+        y = X.values @ rng.uniform(0, 10, len(feats)) + rng.normal(0, 1, len(X))
+        m = xgb.XGBRegressor(n_estimators=200, max_depth=6, random_state=i)
+        m.fit(X, y)
+        models[p] = m
+    return models
+
+
+def benchmark(model_dir=None, n_cells=2928, hours=24, pollutants=('o3', 'pm10', 'pm25', 'co', 'so2'), seed=0):
+    """
+    Filas/seg: ruta actual (models[p].predict(df[feats]) por hora y gas) vs. matriz apilada.
+    Con model_dir usa los model_*.json reales; si no, entrena modelos sintéticos.
+    """
+    pollutants = list(pollutants)
+    if model_dir:
+        import xgboost as xgb
+        models = {}
+        for p in pollutants:
+            path = os.path.join(model_dir, f"model_{p}.json")
+            if not os.path.exists(path): continue
+            m = xgb.XGBRegressor()
+            m.load_model(path)
+            models[p] = m
+        pollutants = list(models)
+        feats = list(next(iter(models.values())).get_booster().feature_names or FEATURES_IA)
+    else:
+        feats = FEATURES_IA
+        models = _synthetic_models(feats, pollutants, seed)
+
+    rng = np.random.default_rng(seed)
+    hour_frames = [pd.DataFrame(rng.uniform(0, 1, (n_cells, len(feats))), columns=feats) for _ in range(hours)]
+    n_rows = n_cells * hours
+
+    t0 = time.perf_counter()
+    ref = [{p: models[p].predict(f[feats]) for p in pollutants} for f in hour_frames]
+    t_call = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    X = build_feature_matrix(hour_frames, feats)
+    batched = split_rows(predict_all(models, X, pollutants, feats), [n_cells] * hours)
+    t_batch = time.perf_counter() - t0
+
+    for h in range(hours):
+        for p in pollutants:
+            assert np.array_equal(ref[h][p], batched[h][p]), f"Predicción distinta en hora {h} ({p})"
+
+    total = n_rows * len(pollutants)
+    print(f"📊 Inferencia {n_cells}×{hours} ({n_rows} filas, {len(pollutants)} modelos) -> predicciones idénticas")
+    print(f"   Por llamada : {t_call * 1000:8.1f} ms | {total / t_call:12,.0f} filas/s")
+    print(f"   Por lotes   : {t_batch * 1000:8.1f} ms | {total / t_batch:12,.0f} filas/s ({t_call / t_batch:.1f}x)")
+    return {'per_call_rows_s': total / t_call, 'batched_rows_s': total / t_batch}
+
+
+if __name__ == '__main__':
+    benchmark(*sys.argv[1:2])
+    sys.exit(0)
@@ -0,0 +1,134 @@
+import os
+import glob
+import time
+import xgboost as xgb
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 1. CONFIGURACIÓN ---
+S3_BUCKET = os.environ.get('S3_BUCKET', 'smability-data-lake')
+MODEL_S3_PREFIX = "models/"
+MODEL_POLLUTANTS = ['o3', 'pm10', 'pm25', 'co', 'so2']
+MODEL_CACHE_DIR = "/tmp"
+# 'ubj' = convertir a UBJSON binario (parseo más rápido en recargas) | 'json' = dejar tal cual
+MODEL_CACHE_FORMAT = os.environ.get('MODEL_CACHE_FORMAT', 'ubj')
+# Segundos entre revisiones de ETag en S3 (0 = revisar en cada invocación)
+MODEL_CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', '0'))
+
+# --- 2. ESTADO DEL CONTENEDOR (sobrevive entre invocaciones 'warm') ---
+_MODELS = {}        # p -> {'model': XGBRegressor, 'version': etag/versionId, 'loaded_at': epoch}
+_LAST_CHECK = 0.0
+_LAST_METRICS = {}
+
+
+def _remote_version(s3_client, bucket, key):
+    """HEAD barato: VersionId si el bucket tiene versionado, si no el ETag"""
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    return head.get('VersionId') or head.get('ETag', '').strip('"')
+
+
+def _cache_path(p, version, ext):
+    safe_version = ''.join(ch for ch in str(version) if ch.isalnum())[:32] or 'local'
+    return f"{MODEL_CACHE_DIR}/model_{p}-{safe_version}.{ext}"
+
+
+def _load_booster(s3_client, bucket, prefix, p, version):
+    """Carga un modelo: UBJSON cacheado -> JSON cacheado -> descarga de S3"""
+    ubj_path = _cache_path(p, version, 'ubj')
+    json_path = _cache_path(p, version, 'json')
+
+    m = xgb.XGBRegressor()
+    if os.path.exists(ubj_path):
+        m.load_model(ubj_path)
+        return m
+
+    if not os.path.exists(json_path):
+        print(f"⬇️ Descargando de S3: {prefix}model_{p}.json (versión {version})...")
+        s3_client.download_file(bucket, f"{prefix}model_{p}.json", json_path)
+    m.load_model(json_path)
+
+    if MODEL_CACHE_FORMAT == 'ubj':
+        try:
+            m.save_model(ubj_path)
+            os.remove(json_path)
+        except Exception as e:
+            print(f"⚠️ No se pudo convertir {p} a UBJSON: {e}")
+
+    # Limpiar versiones viejas de este modelo en /tmp
+    for old in glob.glob(f"{MODEL_CACHE_DIR}/model_{p}-*"):
+        if old not in (ubj_path, json_path):
+            try: os.remove(old)
+            except OSError: pass
+    return m
+
+
+def get_models(s3_client, bucket=S3_BUCKET, prefix=MODEL_S3_PREFIX, pollutants=MODEL_POLLUTANTS):
+    """
+    Regresa {contaminante: XGBRegressor} reutilizando los boosters en memoria.
+    Solo recarga los modelos cuyo ETag/versión en S3 cambió. Si S3 no responde,
+    sirve lo que ya esté en memoria.
+    """
+    global _LAST_CHECK, _LAST_METRICS
+    t_start = time.perf_counter()
+    metrics = {'hits': 0, 'reloads': 0, 'failures': 0, 'check_ms': 0.0, 'load_ms': {}, 'cold_start': not _MODELS}
+
+    # 1. ¿Toca revisar versiones en S3?
+    versions = {}
+    must_check = (time.time() - _LAST_CHECK) >= MODEL_CHECK_INTERVAL or any(p not in _MODELS for p in pollutants)
+    if must_check:
+        t0 = time.perf_counter()
+
+        def _check(p):
+            try:
+                return p, _remote_version(s3_client, bucket, f"{prefix}model_{p}.json")
+            except Exception as e:
+                print(f"⚠️ HEAD falló para model_{p}: {e}")
+                return p, None
+
+        with ThreadPoolExecutor(max_workers=len(pollutants)) as executor:
+            versions = dict(executor.map(_check, pollutants))
+        metrics['check_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        _LAST_CHECK = time.time()
+
+    # 2. Recargar solo lo que cambió
+    for p in pollutants:
+        cached = _MODELS.get(p)
+        version = versions.get(p)
+        if cached and (version is None or version == cached['version']):
+            metrics['hits'] += 1
+            continue
+        if version is None:
+            metrics['failures'] += 1
+            print(f"⚠️ No se pudo cargar el modelo {p}. Razón: versión en S3 no disponible")
+            continue
+
+        t0 = time.perf_counter()
+        try:
+            model = _load_booster(s3_client, bucket, prefix, p, version)
+            _MODELS[p] = {'model': model, 'version': version, 'loaded_at': time.time()}
+            metrics['reloads'] += 1
+            metrics['load_ms'][p] = round((time.perf_counter() - t0) * 1000, 1)
+            print(f"✅ Modelo {p} cargado ({'recarga' if cached else 'cold start'}) en {metrics['load_ms'][p]} ms.")
+        except Exception as e:
+            metrics['failures'] += 1
+            if cached:
+                metrics['hits'] += 1
+                print(f"⚠️ Falló recarga de {p} ({e}). Se mantiene la versión en memoria.")
+            else:
+                print(f"⚠️ No se pudo cargar el modelo {p}. Razón: {e}")
+
+    metrics['total_ms'] = round((time.perf_counter() - t_start) * 1000, 1)
+    _LAST_METRICS = metrics
+    print(f"🧠 [MODEL REGISTRY] hits={metrics['hits']} recargas={metrics['reloads']} fallos={metrics['failures']} "
+          f"| HEAD {metrics['check_ms']} ms | total {metrics['total_ms']} ms | cold_start={metrics['cold_start']}")
+
+    return {p: _MODELS[p]['model'] for p in pollutants if p in _MODELS}
+
+
+def get_last_metrics():
+    """Métricas de la última llamada a get_models (para logs estructurados)"""
+    return dict(_LAST_METRICS)
+
+
+def get_model_versions():
+    """Versión (ETag/VersionId) de cada modelo en memoria; cambia si se recarga alguno"""
+    return {p: entry['version'] for p, entry in _MODELS.items()}
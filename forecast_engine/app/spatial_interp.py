@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import hashlib
+import numpy as np
+from scipy import sparse
+from scipy.spatial import Delaunay, cKDTree
+
+# --- 1. CONFIGURACIÓN ---
+# Interpoladores en memoria por conjunto de puntos fuente (estaciones u Open-Meteo).
+# La malla destino es estática, así que en la práctica hay 1-2 entradas por contenedor.
+INTERP_CACHE_SIZE = 8
+_INTERPOLATORS = {}
+# Vecinos por celda para IDW. 0 (default a propósito) = todas las estaciones, idéntico bit a bit al
+# IDW denso original; k > 0 reduce los temporales a celdas × k con diferencias de décimas (ver check_idw)
+IDW_NEIGHBORS = int(os.environ.get('IDW_NEIGHBORS', '0'))
+INTERP_METHODS = ('linear', 'idw', 'nearest')
+
+
+# --- 2. INTERPOLADOR PRECOMPUTADO ---
+class GridInterpolator:
+    """
+    Equivalente a griddata(method='linear') + relleno 'nearest' en los bordes, pero
+    triangulando una sola vez. Los pesos baricéntricos quedan en una matriz dispersa
+    (celdas × puntos fuente) y cada variable se resuelve con un producto matriz-vector.
+    """
+
+    def __init__(self, x_src, y_src, x_dst, y_dst):
+        src = np.column_stack([np.asarray(x_src, dtype=np.float64), np.asarray(y_src, dtype=np.float64)])
+        dst = np.column_stack([np.asarray(x_dst, dtype=np.float64), np.asarray(y_dst, dtype=np.float64)])
+        self.n_src = len(src)
+        self.n_dst = len(dst)
+
+        # 1. Triangulación + simplex que contiene cada celda (mismas tolerancias que griddata)
+        tri = Delaunay(src)
+        simplex = tri.find_simplex(dst)
+        inside = simplex >= 0
+
+        # 2. Coordenadas baricéntricas con el mismo orden de operaciones que LinearNDInterpolator
+        T = tri.transform[simplex[inside]]
+        d = dst[inside] - T[:, 2]
+        c0 = T[:, 0, 0] * d[:, 0] + T[:, 0, 1] * d[:, 1]
+        c1 = T[:, 1, 0] * d[:, 0] + T[:, 1, 1] * d[:, 1]
+        c2 = 1.0 - c0 - c1
+        vertices = tri.simplices[simplex[inside]]
+
+        rows = np.flatnonzero(inside)
+        data = np.column_stack([c0, c1, c2]).ravel()
+        indices = vertices.ravel()
+        indptr = np.zeros(self.n_dst + 1, dtype=np.int64)
+        indptr[rows + 1] = 3
+        indptr = np.cumsum(indptr)
+        # CSR sin reordenar columnas: la suma por fila respeta el orden de los vértices del simplex
+        self.weights = sparse.csr_matrix((data, indices, indptr), shape=(self.n_dst, self.n_src))
+        self.outside = ~inside
+
+        # 3. Vecino más cercano (solo se usa donde el lineal da NaN: fuera del casco convexo)
+        _, self.nearest = cKDTree(src).query(dst, k=1)
+
+    def interpolate(self, *z_values):
+        """
+        Interpola una o varias variables sobre la malla en un solo producto disperso.
+        Regresa un arreglo por variable (mismo orden de entrada).
+        """
+        Z = np.column_stack([np.asarray(z, dtype=np.float64) for z in z_values])
+        out = np.asarray(self.weights @ Z)
+        out[self.outside] = np.nan
+        gaps = np.isnan(out)
+        if gaps.any():
+            out = np.where(gaps, Z[self.nearest], out)
+        return [out[:, j] for j in range(Z.shape[1])]
+
+
+def _points_key(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+def get_interpolator(x_src, y_src, x_dst, y_dst):
+    """Interpolador cacheado por conjunto de puntos (fuente + destino)"""
+    key = _points_key(x_src, y_src, x_dst, y_dst)
+    interp = _INTERPOLATORS.get(key)
+    if interp is None:
+        if len(_INTERPOLATORS) >= INTERP_CACHE_SIZE:
+            _INTERPOLATORS.pop(next(iter(_INTERPOLATORS)))
+        interp = GridInterpolator(x_src, y_src, x_dst, y_dst)
+        _INTERPOLATORS[key] = interp
+    return interp
+
+
+# --- 3. IDW / NEAREST ---
+def idw(x_src, y_src, z, x_dst, y_dst, k=IDW_NEIGHBORS):
+    """
+    IDW (potencia 2) con los k vecinos más cercanos vía KDTree: temporales de celdas × k
+    en lugar de celdas × estaciones. Con k=0 (o k >= estaciones) usa todas las estaciones
+    por broadcasting (sin copias indexadas) -> mismo resultado bit a bit que la versión densa.
+    """
+    x_src, y_src = np.asarray(x_src, dtype=np.float64), np.asarray(y_src, dtype=np.float64)
+    x_dst, y_dst = np.asarray(x_dst, dtype=np.float64), np.asarray(y_dst, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    n = len(x_src)
+
+    if 0 < k < n:
+        _, idx = cKDTree(np.column_stack([x_src, y_src])).query(np.column_stack([x_dst, y_dst]), k=k)
+        idx = np.sort(idx.reshape(len(x_dst), k), axis=1)
+        xs, ys, zs = x_src[idx], y_src[idx], z[idx]
+    else:
+        xs, ys, zs = x_src[None, :], y_src[None, :], z[None, :]
+
+    dist = np.sqrt((x_dst[:, None] - xs)**2 + (y_dst[:, None] - ys)**2)
+    dist = np.maximum(dist, 1e-12)
+    weights = 1.0 / (dist ** 2)
+    return np.sum(weights * zs, axis=1) / np.sum(weights, axis=1)
+
+
+def nearest(x_src, y_src, z, x_dst, y_dst):
+    """Valor de la fuente más cercana a cada celda"""
+    _, idx = cKDTree(np.column_stack([x_src, y_src])).query(np.column_stack([x_dst, y_dst]), k=1)
+    return np.asarray(z, dtype=np.float64)[idx]
+
+
+def interpolate_fields(method, x_src, y_src, x_dst, y_dst, *z_values):
+    """
+    Etapa única de interpolación espacial: 'linear' (Delaunay cacheado + bordes nearest),
+    'idw' (k vecinos) o 'nearest'. Regresa un arreglo por variable.
+    """
+    if method == 'linear':
+        return get_interpolator(x_src, y_src, x_dst, y_dst).interpolate(*z_values)
+    if method == 'idw':
+        return [idw(x_src, y_src, z, x_dst, y_dst) for z in z_values]
+    if method == 'nearest':
+        return [nearest(x_src, y_src, z, x_dst, y_dst) for z in z_values]
+    raise ValueError(f"Método de interpolación desconocido: {method} (opciones: {INTERP_METHODS})")
+
+
+# --- 4. BENCHMARK CONTRA griddata / IDW DENSO ---
+def _griddata_reference(x_src, y_src, z, x_dst, y_dst):
+    from scipy.interpolate import griddata
+    grid_z = griddata((x_src, y_src), z, (x_dst, y_dst), method='linear')
+    if np.isnan(grid_z).any():
+        grid_z_nearest = griddata((x_src, y_src), z, (x_dst, y_dst), method='nearest')
+        grid_z = np.where(np.isnan(grid_z), grid_z_nearest, grid_z)
+    return grid_z
+
+
+def benchmark(n_src=36, hours=24, n_vars=5, seed=0):
+    """Forecast típico: mismos puntos Open-Meteo en las 24 horas, 5 variables por hora"""
+    from app.grid_store import get_static_grid
+    grid = get_static_grid()
+    x_dst, y_dst = grid['lon'].values, grid['lat'].values
+
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_src)))
+    lons, lats = np.meshgrid(np.linspace(x_dst.min() + 0.05, x_dst.max() - 0.05, side),
+                             np.linspace(y_dst.min() + 0.05, y_dst.max() - 0.05, side))
+    x_src, y_src = lons.ravel()[:n_src], lats.ravel()[:n_src]
+    fields = rng.normal(15, 5, (hours, n_vars, n_src))
+
+    t0 = time.perf_counter()
+    ref = [[_griddata_reference(x_src, y_src, fields[h, v], x_dst, y_dst) for v in range(n_vars)] for h in range(hours)]
+    t_ref = time.perf_counter() - t0
+
+    _INTERPOLATORS.clear()
+    t0 = time.perf_counter()
+    new = [get_interpolator(x_src, y_src, x_dst, y_dst).interpolate(*fields[h]) for h in range(hours)]
+    t_new = time.perf_counter() - t0
+
+    max_diff = max(float(np.max(np.abs(ref[h][v] - new[h][v]))) for h in range(hours) for v in range(n_vars))
+    n_diff = sum(int(np.sum(ref[h][v] != new[h][v])) for h in range(hours) for v in range(n_vars))
+    print(f"📊 Interpolación {n_src} puntos -> {len(x_dst)} celdas, {hours}×{n_vars} campos")
+    print(f"   griddata x campo : {t_ref * 1000:8.1f} ms")
+    print(f"   Delaunay cacheado: {t_new * 1000:8.1f} ms ({t_ref / t_new:.0f}x)")
+    print(f"   Diferencia máx   : {max_diff:.3g} ({n_diff} valores distintos)")
+    return {'griddata_s': t_ref, 'cached_s': t_new, 'max_diff': max_diff}
+
+
+def _dense_idw_reference(x, y, z, xi, yi):
+    """IDW original de prepare_grid_features (matrices completas celdas × estaciones)"""
+    dist = np.sqrt((xi[:, None] - x[None, :])**2 + (yi[:, None] - y[None, :])**2)
+    dist = np.maximum(dist, 1e-12)
+    weights = 1.0 / (dist ** 2)
+    return np.sum(weights * z[None, :], axis=1) / np.sum(weights, axis=1)
+
+
+def check_idw(n_src=40, k=8, seed=0):
+    """IDW con todas las estaciones debe ser idéntico al denso; con k vecinos se reporta el error"""
+    from app.grid_store import get_static_grid
+    grid = get_static_grid()
+    xi, yi = grid['lat'].values, grid['lon'].values
+
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(xi.min(), xi.max(), n_src), rng.uniform(yi.min(), yi.max(), n_src)
+    x[0], y[0] = xi[0], yi[0]  # estación encima de una celda (piso de 1e-12)
+    z = rng.normal(15, 5, n_src)
+
+    ref = _dense_idw_reference(x, y, z, xi, yi)
+    exact = idw(x, y, z, xi, yi, k=0)
+    assert np.array_equal(ref, exact), "IDW (todas las estaciones) difiere del denso"
+    knn = idw(x, y, z, xi, yi, k=k)
+    print(f"📊 IDW {n_src} estaciones -> {len(xi)} celdas: k=0 idéntico | k={k} diferencia máx {np.max(np.abs(knn - ref)):.3g}")
+    return float(np.max(np.abs(knn - ref)))
+
+
+# Mismos 15 puntos virtuales que el respaldo Open-Meteo del Bloque C
+_OPENMETEO_POINTS = ([19.5, 19.5, 19.5, 19.4, 19.4, 19.4, 19.3, 19.3, 19.3, 19.2, 19.2, 19.2, 19.6, 19.1, 19.4],
+                     [-99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.2, -99.1, -99.0, -99.1, -99.1, -98.9])
+_IDW_DEFAULTS = [('tmp', 20.0), ('rh', 40.0), ('wsp', 1.0), ('wdr', 90.0)]
+
+
+def _legacy_meteo_fields(grid_lat, grid_lon, stations, points):
+    """
+    Bloque C anterior: IDW denso por variable siempre; si hay >= 3 puntos, griddata lineal
+    (+ bordes nearest) por variable y wdr desde u/v, encima del IDW. Luego los defaults del fillna.
+    """
+    out = {}
+    for feat, default in _IDW_DEFAULTS:
+        ok = ~np.isnan(stations[feat])
+        out[feat] = _dense_idw_reference(stations['lat'][ok], stations['lon'][ok], stations[feat][ok], grid_lat, grid_lon) if ok.any() else np.full(len(grid_lat), default)
+    if points is not None and len(points['x']) >= 3:
+        x, y = points['x'], points['y']
+        for feat in ('tmp', 'rh', 'wsp'):
+            out[feat] = _griddata_reference(x, y, points[feat], grid_lon, grid_lat)
+        u = _griddata_reference(x, y, [-w * np.sin(np.radians(d)) for w, d in zip(points['wsp'], points['wdr'])], grid_lon, grid_lat)
+        v = _griddata_reference(x, y, [-w * np.cos(np.radians(d)) for w, d in zip(points['wsp'], points['wdr'])], grid_lon, grid_lat)
+        out['wdr'] = (np.degrees(np.arctan2(-u, -v))) % 360
+    return out
+
+
+def _meteo_fields(grid_lat, grid_lon, stations, points):
+    """Bloque C actual: una sola etapa, lineal si hay >= 3 puntos y si no IDW por variable"""
+    out = {}
+    if points is not None and len(points['x']) >= 3:
+        u_vec = [-w * np.sin(np.radians(d)) for w, d in zip(points['wsp'], points['wdr'])]
+        v_vec = [-w * np.cos(np.radians(d)) for w, d in zip(points['wsp'], points['wdr'])]
+        out['tmp'], out['rh'], out['wsp'], u, v = interpolate_fields(
+            'linear', points['x'], points['y'], grid_lon, grid_lat, points['tmp'], points['rh'], points['wsp'], u_vec, v_vec)
+        out['wdr'] = (np.degrees(np.arctan2(-u, -v))) % 360
+        return out
+    for feat, default in _IDW_DEFAULTS:
+        ok = ~np.isnan(stations[feat])
+        out[feat] = interpolate_fields('idw', stations['lat'][ok], stations['lon'][ok], grid_lat, grid_lon, stations[feat][ok])[0] if ok.any() else np.full(len(grid_lat), default)
+    return out
+
+
+def check_meteo_paths(seed=0):
+    """
+    Campos finales tmp/rh/wsp/wdr de la malla en las tres rutas del Bloque C (estaciones SIMAT
+    lineal, 15 puntos Open-Meteo lineal, IDW por variable con huecos) contra la implementación
+    anterior. Deben ser idénticos bit a bit.
+    """
+    import csv
+    from app.grid_store import get_static_grid, BASE_PATH
+    grid = get_static_grid()
+    grid_lat, grid_lon = grid['lat'].values, grid['lon'].values
+    with open(f"{BASE_PATH}/training/raw_data/stationssimat.csv") as f:
+        rows = list(csv.DictReader(f))
+
+    rng = np.random.default_rng(seed)
+    n = len(rows)
+    stations = {'lat': np.array([float(r['lat']) for r in rows]), 'lon': np.array([float(r['lon']) for r in rows])}
+    for feat, lo, hi in (('tmp', 8, 28), ('rh', 20, 90), ('wsp', 0, 5), ('wdr', 0, 359)):
+        stations[feat] = np.round(rng.uniform(lo, hi, n), 1)
+        stations[feat][rng.random(n) < 0.4] = np.nan  # estaciones sin esa variable
+    reporting = ~np.isnan(stations['tmp']) & ~np.isnan(stations['rh']) & ~np.isnan(stations['wsp']) & ~np.isnan(stations['wdr'])
+    simat = {'x': stations['lon'][reporting], 'y': stations['lat'][reporting],
+             **{feat: stations[feat][reporting] for feat in ('tmp', 'rh', 'wsp', 'wdr')}}
+    om_lats, om_lons = _OPENMETEO_POINTS
+    openmeteo = {'x': np.array(om_lons), 'y': np.array(om_lats), 'tmp': np.round(rng.uniform(8, 28, 15), 1),
+                 'rh': np.round(rng.uniform(20, 90, 15)), 'wsp': rng.uniform(0, 18, 15) / 3.6, 'wdr': np.round(rng.uniform(0, 359, 15))}
+
+    results = {}
+    for name, points in (('simat', simat), ('openmeteo', openmeteo), ('idw', None)):
+        _INTERPOLATORS.clear()
+        ref = _legacy_meteo_fields(grid_lat, grid_lon, stations, points)
+        new = _meteo_fields(grid_lat, grid_lon, stations, points)
+        for feat in ('tmp', 'rh', 'wsp', 'wdr'):
+            assert np.array_equal(ref[feat], new[feat], equal_nan=True), f"Ruta {name}: {feat} difiere de la implementación anterior"
+        results[name] = f"{len(points['x'])} puntos" if points else f"{n} estaciones con huecos"
+    print(f"📊 Campos tmp/rh/wsp/wdr idénticos a la implementación anterior: "
+          f"{' | '.join(f'{k} ({v})' for k, v in results.items())}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
+    check_idw()
+    check_meteo_paths()
+    sys.exit(0)
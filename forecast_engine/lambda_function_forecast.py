@@ -2,192 +2,331 @@ import json
 import boto3
 import pandas as pd
 import numpy as np
-import xgboost as xgb
 import requests
 import gzip
+import io
 import os
+import time
+import hashlib
 from datetime import datetime, timedelta
-from scipy.interpolate import griddata
+from concurrent.futures import ThreadPoolExecutor
 from zoneinfo import ZoneInfo
+from app.ias_engine import compute_ias, dominant_categories, RISK_LEVELS
+from app.model_registry import get_models, get_model_versions
+from app.inference_engine import FEATURES_IA, build_feature_tensor, predict_all
+from app.summary_format import encode_summary
+from app.spatial_interp import interpolate_fields
+from app.grid_store import get_static_grid, get_static_grid_digest
 
 # --- 1. CONFIGURACIÓN Y CONSTANTES ---
 S3_BUCKET = "smability-data-lake"
 S3_FORECAST_PREFIX = "forecast/"
 MODEL_S3_PREFIX = "models/"
-BASE_PATH = os.environ.get('LAMBDA_TASK_ROOT', '/var/task')
 
 # Endpoint calibrado (Zona Metropolitana del Valle de México)
 # Trae 24h de pronóstico para múltiples puntos clave de la malla
-OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast?latitude=19.15,19.15,19.15,19.15,19.15,19.15,19.276,19.276,19.276,19.276,19.276,19.276,19.402,19.402,19.402,19.402,19.402,19.402,19.528,19.528,19.528,19.528,19.528,19.528,19.654,19.654,19.654,19.654,19.654,19.654,19.78,19.78,19.78,19.78,19.78,19.78&longitude=-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86&hourly=temperature_2m,relative_humidity_2m,wind_speed_10m,wind_direction_10m&timezone=America%2FMexico_City&forecast_days=2&wind_speed_unit=ms"
+# Modelo fijo (no best_match): la caché de 4c sabe exactamente qué corridas componen la respuesta
+OPEN_METEO_MODEL = os.environ.get('OPEN_METEO_MODEL', 'gfs_global')
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast?latitude=19.15,19.15,19.15,19.15,19.15,19.15,19.276,19.276,19.276,19.276,19.276,19.276,19.402,19.402,19.402,19.402,19.402,19.402,19.528,19.528,19.528,19.528,19.528,19.528,19.654,19.654,19.654,19.654,19.654,19.654,19.78,19.78,19.78,19.78,19.78,19.78&longitude=-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86,-99.39,-99.284,-99.178,-99.072,-98.966,-98.86&hourly=temperature_2m,relative_humidity_2m,wind_speed_10m,wind_direction_10m&timezone=America%2FMexico_City&forecast_days=2&wind_speed_unit=ms&models=" + OPEN_METEO_MODEL
 
 s3_client = boto3.client('s3')
+# El .bin (tensor int16 + índice por celda) es lo que lee la API Ligera; el .json.gz
+# se sigue publicando mientras el frontend migra (SUMMARY_WRITE_JSON=0 para apagarlo)
+SUMMARY_WRITE_JSON = os.environ.get('SUMMARY_WRITE_JSON', '1') == '1'
+# Publicación de los 24 archivos horarios: hilos de subida y reintentos por archivo
+UPLOAD_WORKERS = int(os.environ.get('FORECAST_UPLOAD_WORKERS', '8'))
+UPLOAD_RETRIES = int(os.environ.get('FORECAST_UPLOAD_RETRIES', '3'))
+UPLOAD_BACKOFF_S = 0.5
 
 # --- 2. NORMATIVIDAD (IAS - NOM-172-SEMARNAT-2019) ---
-
-# O3 (1h) - Unidades: ppb
-BPS_O3 = [(0,58,0,50), (59,92,51,100), (93,135,101,150), (136,175,151,200), (176,240,201,300)]
-# PM10 (Promedio) - Unidades: µg/m³
-BPS_PM10 = [(0,45,0,50), (46,60,51,100), (61,132,101,150), (133,213,151,200), (214,354,201,300)]
-# PM2.5 (Promedio) - Unidades: µg/m³
-BPS_PM25 = [(0,25,0,50), (26,45,51,100), (46,79,101,150), (80,147,151,200), (148,250,201,300)]
-# CO (8h) - Unidades: ppm
-BPS_CO = [(0, 8.75, 0, 50), (8.76, 11.00, 51, 100), (11.01, 13.30, 101, 150), (13.31, 15.50, 151, 200), (15.51, 20.00, 201, 300)]
-# SO2 (1h) - Unidades: ppb
-BPS_SO2 = [(0, 40, 0, 50), (41, 75, 51, 100), (76, 185, 101, 150), (186, 304, 151, 200), (305, 500, 201, 300)]
-
-def get_ias_score(c, pollutant):
-    """Calcula el índice Aire y Salud (IAS) interpolado"""
-    try:
-        c = float(c)
-        if pollutant == 'o3': bps = BPS_O3
-        elif pollutant == 'pm10': bps = BPS_PM10
-        elif pollutant == 'pm25': bps = BPS_PM25
-        elif pollutant == 'co': bps = BPS_CO
-        elif pollutant == 'so2': bps = BPS_SO2
-        else: return 0 
-        
-        for (c_lo, c_hi, i_lo, i_hi) in bps:
-            if c <= c_hi:
-                return i_lo + ((c - c_lo) / (c_hi - c_lo)) * (i_hi - i_lo)
-        return bps[-1][3] # Saturación máxima (Riesgo Extremo)
-    except: return 0
-
-def get_risk_level(ias):
-    if ias <= 50: return "Bajo"
-    if ias <= 100: return "Moderado"
-    if ias <= 150: return "Alto"
-    if ias <= 200: return "Muy Alto"
-    return "Extremadamente Alto"
+# Tablas BPS_* y motor vectorizado de IAS: app/ias_engine.py (mismo módulo que el Predictor Live)
 
 # --- 3. GESTIÓN DE RECURSOS ---
 def load_models():
-    """Descarga y carga en memoria los 5 modelos XGBoost"""
-    models = {}
-    pollutants = ['o3', 'pm10', 'pm25', 'co', 'so2']
-    print(f"🔄 Cargando modelos Forecast: {pollutants}")
-    
-    for p in pollutants:
-        local_path = f"/tmp/model_{p}.json"
-        s3_key = f"{MODEL_S3_PREFIX}model_{p}.json"
-        try:
-            if not os.path.exists(local_path):
-                s3_client.download_file(S3_BUCKET, s3_key, local_path)
-            
-            m = xgb.XGBRegressor()
-            m.load_model(local_path)
-            models[p] = m
-            print(f"   ✅ Modelo {p} OK.")
-        except Exception as e:
-            print(f"   ⚠️ Falló carga de {p} ({e}). Se usará 0.0 por defecto.")
-    return models
+    """Modelos XGBoost desde el registro del contenedor (recarga solo si cambió su ETag en S3)"""
+    return get_models(s3_client, S3_BUCKET, MODEL_S3_PREFIX)
 
 def load_static_grid():
-    """Carga Malla enriquecida con Colonias y Edificios"""
-    # 1. Cargar Malla Base
-    MALLA_PATH = f"{BASE_PATH}/app/geograficos/malla_valle_mexico_final.geojson"
-    with open(MALLA_PATH, 'r') as f:
-        malla_data = json.load(f)
+    """
+    Malla enriquecida (colonias + edificios) desde el artefacto compartido con el Predictor Live
+    (app/grid_store.py, construido en el build). Misma huella sha256 = mismas celdas en ambas Lambdas.
+    """
+    grid_df = get_static_grid()
+    print(f"🔐 Malla estática sha256 {get_static_grid_digest()[:12]}")
+    return grid_df
     
-    malla_list = []
-    for feature in malla_data['features']:
-        coords = feature['geometry']['coordinates']
-        malla_list.append({
-            'lon': round(coords[0], 5),
-            'lat': round(coords[1], 5),
-            'altitude': feature['properties'].get('elevation', 2240)
-        })
-    grid_df = pd.DataFrame(malla_list)
-
-    # 2. Enriquecer con Colonias (Paridad con Live Grid)
+# --- 4. MOTOR MATEMÁTICO ---
+def interpolate_on_grid(grid_df, x_src, y_src, *z_src):
+    """Interpolación Linear + bordes nearest, con triangulación cacheada (una por set de puntos)"""
+    if len(x_src) < 4: return [[np.mean(z)] * len(grid_df) for z in z_src] # Fallback
+    
+    return interpolate_fields('linear', x_src, y_src, grid_df['lon'].values, grid_df['lat'].values, *z_src)
+
+# --- 4b. TENSOR DEL FORECAST (horas × celdas) ---
+OPEN_METEO_VARS = {'tmp': 'temperature_2m', 'rh': 'relative_humidity_2m', 'wsp': 'wind_speed_10m', 'wdr': 'wind_direction_10m'}
+OUTPUT_STATIC = ['lat', 'lon', 'col', 'mun', 'edo', 'pob', 'altitude', 'building_vol']
+# Columna de salida -> (variable del tensor, decimales)
+OUTPUT_ROUNDING = [
+    ('tmp', 'tmp', 1), ('rh', 'rh', 0), ('wsp', 'wsp', 1), ('wdr', 'wdr', 0),
+    ('o3 1h', 'o3', 1), ('pm10 12h', 'pm10', 1), ('pm25 12h', 'pm25', 1), ('co 8h', 'co', 2), ('so2 1h', 'so2', 1)
+]
+SOURCES_MAP = {
+    "tmp": "Open-Meteo", "rh": "Open-Meteo", "wsp": "Open-Meteo",
+    "o3": "AI Forecast", "pm10": "AI Forecast", "pm25": "AI Forecast",
+    "co": "AI Forecast", "so2": "AI Forecast"
+}
+
+def pivot_open_meteo(raw_data):
+    """
+    Respuesta multi-punto de Open-Meteo -> (horas ISO, lons, lats, {var: (horas × puntos)}).
+    Las horas quedan en el orden en que llegan; un punto sin alguna hora queda en NaN.
+    """
+    times = list(dict.fromkeys(t for location in raw_data for t in location['hourly']['time']))
+    pos = {t: i for i, t in enumerate(times)}
+    met = {v: np.full((len(times), len(raw_data)), np.nan) for v in OPEN_METEO_VARS}
+    for j, location in enumerate(raw_data):
+        rows = [pos[t] for t in location['hourly']['time']]
+        for v, om_key in OPEN_METEO_VARS.items():
+            met[v][rows, j] = np.asarray(location['hourly'][om_key], dtype=np.float64)
+    lons = np.array([location['longitude'] for location in raw_data], dtype=np.float64)
+    lats = np.array([location['latitude'] for location in raw_data], dtype=np.float64)
+    return times, lons, lats, met
+
+# --- 4c. CACHÉ DE OPEN-METEO (memoria del contenedor + S3) ---
+# La respuesta de 36 puntos × 48 h solo cambia cuando Open-Meteo publica una corrida nueva del
+# modelo. Se guarda ya pivoteada (horas × puntos × variables, .npz) con llave = hash del request;
+# la generación es el 'last_run_availability_time' más reciente entre los meta.json de los datasets
+# que componen OPEN_METEO_MODEL. Sin meta.json (o con un modelo sin datasets conocidos) se cae a
+# una edad máxima. Si Open-Meteo falla (timeout, 429) se usa la copia vieja si cubre las 24 h.
+OPEN_METEO_MODEL_DATASETS = {
+    'gfs_global': ('ncep_gfs013', 'ncep_gfs025'),
+    'gfs_seamless': ('ncep_gfs013', 'ncep_gfs025', 'ncep_hrrr_conus'),
+}
+OPEN_METEO_META_URLS = [f"https://api.open-meteo.com/data/{d}/static/meta.json" for d in OPEN_METEO_MODEL_DATASETS.get(OPEN_METEO_MODEL, ())]
+OPEN_METEO_MAX_AGE = int(os.environ.get('OPEN_METEO_MAX_AGE', '10800'))
+OPEN_METEO_REQUEST_HASH = hashlib.sha256(OPEN_METEO_URL.encode('utf-8')).hexdigest()[:12]
+OPEN_METEO_CACHE_KEY = f"forecast_cache/open_meteo_{OPEN_METEO_REQUEST_HASH}.npz"
+_OPEN_METEO_CACHE = {} # {'generation', 'fetched_at', 'times', 'lons', 'lats', 'met'}
+
+def open_meteo_generation():
+    """Instante (epoch s) en que quedó disponible la corrida más nueva entre los datasets del modelo; None si no se sabe"""
     try:
-        COLONIAS_PATH = f"{BASE_PATH}/app/geograficos/grid_colonias_db.json"
-        with open(COLONIAS_PATH, 'r') as f:
-            colonias_data = json.load(f)
-        cols_df = pd.DataFrame(colonias_data)
-        
-        # Merge por llaves redondeadas para precisión
-        grid_df['lat_key'] = grid_df['lat'].round(5)
-        grid_df['lon_key'] = grid_df['lon'].round(5)
-        cols_df['lat_key'] = cols_df['lat'].round(5)
-        cols_df['lon_key'] = cols_df['lon'].round(5)
-        
-        grid_df = pd.merge(grid_df, cols_df[['lat_key', 'lon_key', 'col', 'mun', 'edo', 'pob']], 
-                           on=['lat_key', 'lon_key'], how='left')
-        
-        grid_df.drop(columns=['lat_key', 'lon_key'], inplace=True)
+        if not OPEN_METEO_META_URLS:
+            raise ValueError(f"modelo '{OPEN_METEO_MODEL}' sin datasets conocidos")
+        return max(int(requests.get(url, timeout=5).json()['last_run_availability_time']) for url in OPEN_METEO_META_URLS)
     except Exception as e:
-        print(f"⚠️ No se pudo cargar DB de Colonias: {e}")
-        for c in ['col', 'mun', 'edo', 'pob']: grid_df[c] = None
-    
-    # 3. Edificios (Estrategia de Alias Temporal - SOLUCIÓN FINAL)
+        print(f"⚠️ Sin meta.json de Open-Meteo ({e}). Se usa edad máxima de {OPEN_METEO_MAX_AGE // 60} min.")
+        return None
+
+def _encode_open_meteo(entry):
+    buf = io.BytesIO()
+    np.savez_compressed(buf, times=np.array(entry['times']), lons=entry['lons'], lats=entry['lats'],
+                        variables=np.array(list(OPEN_METEO_VARS)), values=np.stack([entry['met'][v] for v in OPEN_METEO_VARS], axis=-1))
+    return buf.getvalue()
+
+def _decode_open_meteo(body, metadata):
+    with np.load(io.BytesIO(body), allow_pickle=False) as npz:
+        values = npz['values']
+        met = {str(v): np.ascontiguousarray(values[..., k]) for k, v in enumerate(npz['variables'])}
+        entry = {'times': npz['times'].tolist(), 'lons': npz['lons'], 'lats': npz['lats'], 'met': met}
+    entry['generation'] = int(metadata['generation']) if metadata.get('generation') else None
+    entry['fetched_at'] = float(metadata.get('fetched-at', 0))
+    return entry
+
+def _covers(entry, target_start_naive, hours=24):
+    last_needed = (target_start_naive + timedelta(hours=hours - 1)).strftime("%Y-%m-%dT%H:%M")
+    return bool(entry and entry['times']) and entry['times'][-1] >= last_needed
+
+def _open_meteo_usable(entry, generation, target_start_naive):
+    """Misma corrida (o edad < máximo si no hay generación) y cubre las 24 horas del vector"""
+    if not _covers(entry, target_start_naive): return False
+    if generation is not None:
+        return entry['generation'] == generation
+    return time.time() - entry['fetched_at'] < OPEN_METEO_MAX_AGE
+
+def _stored_open_meteo():
     try:
-        EDIFICIOS_PATH = f"{BASE_PATH}/app/geograficos/capa_edificios_v2.json"
-        
-        with open(EDIFICIOS_PATH, 'r') as f:
-            edificios_data = json.load(f)
-            if isinstance(edificios_data, dict) and 'features' in edificios_data:
-                 edificios_df = pd.DataFrame([f['properties'] for f in edificios_data['features']])
-            else:
-                edificios_df = pd.DataFrame(edificios_data)
-        
-        # 1. RENOMBRADO SEGURO
-        if 'building_vol' in edificios_df.columns:
-            edificios_df.rename(columns={'building_vol': 'vol_urbano_temp'}, inplace=True)
-        else:
-            print(f"⚠️ Columnas disponibles: {edificios_df.columns.tolist()}")
-            edificios_df['vol_urbano_temp'] = 0
-
-        # 2. PREPARAR LLAVES (Round 2 para Match)
-        edificios_df['lat_key'] = edificios_df['lat'].round(2)
-        edificios_df['lon_key'] = edificios_df['lon'].round(2)
-        grid_df['lat_key'] = grid_df['lat'].round(2)
-        grid_df['lon_key'] = grid_df['lon'].round(2)
-        
-        print(f"🏗️ Merge Seguro Iniciado... (Grid: {len(grid_df)}, Edificios: {len(edificios_df)})")
+        obj = s3_client.get_object(Bucket=S3_BUCKET, Key=OPEN_METEO_CACHE_KEY)
+        return _decode_open_meteo(obj['Body'].read(), obj.get('Metadata') or {})
+    except Exception:
+        return None
 
-        # 3. MERGE
-        grid_df = pd.merge(grid_df, edificios_df[['lat_key', 'lon_key', 'vol_urbano_temp']], 
-                           on=['lat_key', 'lon_key'], how='left')
-        
-        # 4. LIMPIEZA Y ASIGNACIÓN
-        grid_df['building_vol'] = grid_df['vol_urbano_temp'].fillna(0)
-        grid_df.drop(columns=['lat_key', 'lon_key', 'vol_urbano_temp'], inplace=True)
-        
-        print(f"✅ Datos Urbanos integrados. Max Vol: {grid_df['building_vol'].max()}")
+def get_open_meteo(target_start_naive):
+    """(horas ISO, lons, lats, {var: (horas × puntos)}) desde la caché o desde Open-Meteo"""
+    generation = open_meteo_generation()
+    entry = _OPEN_METEO_CACHE or None
+    if not _open_meteo_usable(entry, generation, target_start_naive):
+        stored = _stored_open_meteo() # Otro contenedor (o una corrida anterior) pudo haberla bajado ya
+        if stored is not None and (entry is None or stored['fetched_at'] > entry['fetched_at']): entry = stored
+    if _open_meteo_usable(entry, generation, target_start_naive):
+        if entry is not _OPEN_METEO_CACHE: _OPEN_METEO_CACHE.update(entry)
+        print(f"♻️ Open-Meteo desde caché (corrida {entry['generation']}, edad {(time.time() - entry['fetched_at']) / 60:.0f} min)")
+        return entry['times'], entry['lons'], entry['lats'], entry['met']
 
+    try:
+        r = requests.get(OPEN_METEO_URL, timeout=25)
+        raw_data = r.json()
+        if not isinstance(raw_data, list): raw_data = [raw_data]
+        times, lons, lats, met = pivot_open_meteo(raw_data)
     except Exception as e:
-        print(f"⚠️ Error cargando Capa Edificios: {e}")
-        if 'building_vol' not in grid_df.columns:
-             grid_df['building_vol'] = 0
-
-    # --- LIMPIEZA FINAL ---
-    grid_df['col'] = grid_df['col'].fillna("Zona Federal")
-    grid_df['mun'] = grid_df['mun'].fillna("Valle de México")
-    grid_df['pob'] = grid_df['pob'].fillna(0)
-    grid_df['building_vol'] = grid_df['building_vol'].fillna(0)
-    
-    return grid_df
-    
-# --- 4. MOTOR MATEMÁTICO ---
-def interpolate_on_grid(grid_df, x_src, y_src, z_src, method='linear'):
-    """Interpolación IDW/Linear robusta"""
-    if len(x_src) < 4: return [np.mean(z_src)] * len(grid_df) # Fallback
-    
-    grid_coords = (grid_df['lon'], grid_df['lat'])
-    # Interpolación lineal
-    grid_z = griddata((x_src, y_src), z_src, grid_coords, method=method)
-    
-    # Rellenar bordes (NaNs) con nearest
-    if np.isnan(grid_z).any():
-        grid_z_nearest = griddata((x_src, y_src), z_src, grid_coords, method='nearest')
-        grid_z = np.where(np.isnan(grid_z), grid_z_nearest, grid_z)
-    
-    return grid_z
+        if _covers(entry, target_start_naive):
+            print(f"⚠️ Open-Meteo no respondió ({e}). Usando la copia de hace {(time.time() - entry['fetched_at']) / 60:.0f} min.")
+            return entry['times'], entry['lons'], entry['lats'], entry['met']
+        raise
+
+    fresh = {'generation': generation, 'fetched_at': time.time(), 'times': times, 'lons': lons, 'lats': lats, 'met': met}
+    _OPEN_METEO_CACHE.clear()
+    _OPEN_METEO_CACHE.update(fresh)
+    try:
+        metadata = {'fetched-at': f"{fresh['fetched_at']:.0f}", 'request': OPEN_METEO_REQUEST_HASH}
+        if generation is not None: metadata['generation'] = str(generation)
+        s3_client.put_object(Bucket=S3_BUCKET, Key=OPEN_METEO_CACHE_KEY, Body=_encode_open_meteo(fresh),
+                             ContentType='application/octet-stream', Metadata=metadata)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la caché de Open-Meteo: {e}")
+    print(f"🌍 Open-Meteo descargado: {len(times)} horas × {len(lons)} puntos (corrida {generation})")
+    return times, lons, lats, met
+
+def build_forecast_tensor(grid_df, om_lons, om_lats, met, hour_dts):
+    """
+    Meteorología interpolada + features temporales para todas las horas a la vez.
+    Los mismos puntos Open-Meteo en las 24 horas -> una sola triangulación y un solo producto
+    disperso para las horas × 5 variables. Regresa {feature: arreglo difundible a (horas, celdas)}.
+    """
+    n_hours = len(hour_dts)
+    # Viento vectorial (u, v) para interpolar la dirección sin el salto 359° -> 0°
+    u_vec = -met['wsp'] * np.sin(np.radians(met['wdr']))
+    v_vec = -met['wsp'] * np.cos(np.radians(met['wdr']))
+    fields = [met['tmp'], met['rh'], met['wsp'], u_vec, v_vec]
+    columns = interpolate_on_grid(grid_df, om_lons, om_lats, *[f[h] for f in fields for h in range(n_hours)])
+    tmp, rh, wsp, grid_u, grid_v = np.asarray(columns, dtype=np.float64).reshape(len(fields), n_hours, len(grid_df))
+
+    def per_hour(fn):
+        return np.array([[fn(dt_obj)] for dt_obj in hour_dts], dtype=np.float64).reshape(n_hours, 1)
+
+    tensor = {c: grid_df[c].to_numpy() for c in ['lat', 'lon', 'altitude', 'building_vol']}
+    tensor.update({
+        'tmp': tmp, 'rh': rh, 'wsp': wsp,
+        'wdr': (np.degrees(np.arctan2(-grid_u, -grid_v))) % 360,
+        'hour_sin': per_hour(lambda d: np.sin(2 * np.pi * d.hour / 24)),
+        'hour_cos': per_hour(lambda d: np.cos(2 * np.pi * d.hour / 24)),
+        'month_sin': per_hour(lambda d: np.sin(2 * np.pi * d.month / 12)),
+        'month_cos': per_hour(lambda d: np.cos(2 * np.pi * d.month / 12)),
+        'station_numeric': -1
+    })
+    return tensor
+
+def build_output_frame(grid_df, times, tensor, pollutants):
+    """Tensor -> DataFrame de horas·celdas filas con las columnas del JSON por hora (hora-mayor)"""
+    n_hours, n_cells = len(times), len(grid_df)
+    output_df = grid_df[OUTPUT_STATIC].iloc[np.tile(np.arange(n_cells), n_hours)].reset_index(drop=True)
+    output_df.insert(0, 'timestamp', np.repeat([t_iso.replace("T", " ") for t_iso in times], n_cells))
+    for col, var, decimals in OUTPUT_ROUNDING:
+        output_df[col] = np.round(tensor[var], decimals).ravel()
+    output_df['ias'] = tensor['ias'].astype(int).ravel()
+    output_df['risk'] = pd.Categorical.from_codes(tensor['risk'].ravel(), categories=RISK_LEVELS)
+    output_df['dominant'] = pd.Categorical.from_codes(tensor['dominant'].ravel(), categories=dominant_categories(pollutants))
+    output_df['station'] = None
+    output_df['sources'] = json.dumps(SOURCES_MAP)
+    return output_df.replace({np.nan: None})
+
+# --- 4d. FORECAST INCREMENTAL (estado por hora) ---
+# Entre corridas casi siempre solo sale una hora y entra otra; las horas traslapadas tienen la misma
+# meteorología. Cada hora se identifica por el hash de su entrada (valores Open-Meteo de esa hora,
+# puntos, malla, versiones de modelos); el estado guarda la química ya predicha (float32) por hora.
+FORECAST_INCREMENTAL = os.environ.get('FORECAST_INCREMENTAL', '1') == '1'
+FORECAST_STATE_KEY = "forecast_cache/forecast_state.npz"
+FORECAST_STATE_VERSION = 1 # Subir si cambia cómo se calcula una hora (invalida el estado)
+_FORECAST_STATE = {} # {'times', 'hashes', 'preds': {p: (horas × celdas)}}
+
+def forecast_run_signature(grid_df):
+    """Todo lo que, además de la meteorología de la hora, determina su archivo"""
+    h = hashlib.sha256(f"v{FORECAST_STATE_VERSION}|{','.join(FEATURES_IA)}|".encode('utf-8'))
+    h.update(json.dumps(get_model_versions(), sort_keys=True).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(grid_df[OUTPUT_STATIC], index=False).to_numpy().tobytes())
+    return h
+
+def hour_input_hashes(signature, times, om_lons, om_lats, met):
+    signature.update(np.ascontiguousarray(om_lons).tobytes())
+    signature.update(np.ascontiguousarray(om_lats).tobytes())
+    hashes = []
+    for h, t_iso in enumerate(times):
+        hour = signature.copy()
+        hour.update(t_iso.encode('utf-8'))
+        for v in OPEN_METEO_VARS:
+            hour.update(np.ascontiguousarray(met[v][h]).tobytes())
+        hashes.append(hour.hexdigest()[:16])
+    return hashes
+
+def reusable_hours(state, times, hashes):
+    """{hora del vector actual: índice en el estado} para las horas con la misma entrada"""
+    previous = {(t, hsh): i for i, (t, hsh) in enumerate(zip(state.get('times', []), state.get('hashes', [])))}
+    return {h: previous[key] for h, key in enumerate(zip(times, hashes)) if key in previous}
 
-def generate_forecast_summary(archivos_nuevos):
+def load_forecast_state():
+    if _FORECAST_STATE: return _FORECAST_STATE
+    try:
+        obj = s3_client.get_object(Bucket=S3_BUCKET, Key=FORECAST_STATE_KEY)
+        with np.load(io.BytesIO(obj['Body'].read()), allow_pickle=False) as npz:
+            _FORECAST_STATE.update({
+                'times': npz['times'].tolist(), 'hashes': npz['hashes'].tolist(),
+                'preds': {str(p): npz[f"pred_{p}"] for p in npz['pollutants']},
+                'summary_ok': bool(npz['summary_ok']) if 'summary_ok' in npz.files else False
+            })
+    except Exception as e:
+        print(f"ℹ️ Sin estado de forecast previo ({e}). Se calculan las 24 horas.")
+    return _FORECAST_STATE
+
+def save_forecast_state(times, hashes, preds, summary_ok):
+    """
+    Se guarda solo después de publicar: toda hora del estado ya tiene su archivo en S3.
+    summary_ok marca si el resumen (.json.gz/.bin) se escribió; si no, la siguiente corrida lo reintenta.
+    """
+    _FORECAST_STATE.clear()
+    _FORECAST_STATE.update({'times': list(times), 'hashes': list(hashes), 'preds': preds, 'summary_ok': summary_ok})
+    try:
+        buf = io.BytesIO()
+        np.savez_compressed(buf, times=np.array(times), hashes=np.array(hashes), pollutants=np.array(list(preds)),
+                            summary_ok=np.array(bool(summary_ok)),
+                            **{f"pred_{p}": v for p, v in preds.items()})
+        s3_client.put_object(Bucket=S3_BUCKET, Key=FORECAST_STATE_KEY, Body=buf.getvalue(), ContentType='application/octet-stream')
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el estado del forecast: {e}")
+
+def _put_with_retries(key, body):
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            return s3_client.put_object(Bucket=S3_BUCKET, Key=key, Body=body, ContentType='application/json')
+        except Exception as e:
+            if attempt == UPLOAD_RETRIES: raise
+            print(f"⚠️ PUT {key} falló ({e}). Reintento {attempt + 1}/{UPLOAD_RETRIES}...")
+            time.sleep(UPLOAD_BACKOFF_S * 2 ** attempt)
+
+def publish_forecast_files(output_df, hour_dts, n_cells):
+    """Una tarea por hora (to_json + PUT con reintentos) en un pool acotado; regresa los nombres en orden"""
+    def upload(h, dt_obj):
+        file_name = dt_obj.strftime("%Y-%m-%d_%H-%M.json")
+        json_body = output_df.iloc[h * n_cells:(h + 1) * n_cells].to_json(orient='records')
+        _put_with_retries(f"{S3_FORECAST_PREFIX}{file_name}", json_body)
+        return file_name, len(json_body)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = [executor.submit(upload, h, dt_obj) for h, dt_obj in enumerate(hour_dts)]
+    elapsed = time.perf_counter() - t0
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        raise RuntimeError(f"Publicación del forecast falló en {len(errors)} de {len(futures)} archivos: {errors[0]}")
+    results = [f.result() for f in futures]
+    total_mb = sum(size for _, size in results) / 1e6
+    print(f"📤 {len(results)} archivos ({total_mb:.1f} MB) en {elapsed:.2f}s | "
+          f"{len(results) / elapsed:.1f} archivos/s, {total_mb / elapsed:.1f} MB/s ({UPLOAD_WORKERS} hilos)")
+    return [name for name, _ in results]
+
+def generate_forecast_summary(archivos_nuevos, tensor, grid_df):
     """
-    Toma la lista de los 24 archivos que se acaban de generar,
-    extrae el IAS y los gases principales, y arma un vector ligero en S3.
+    Arma el vector ligero de 24 h por celda (IAS, gases principales y dominante) directo del
+    tensor en memoria, sin volver a leer de S3 los archivos horarios recién publicados.
     """
     print(f"\n🔮 [FORECAST SUMMARY] Integrando {len(archivos_nuevos)} archivos recién creados...")
     try:
@@ -209,58 +348,52 @@ def generate_forecast_summary(archivos_nuevos):
             "timestamp_start": timestamp_start_iso, # <--- ¡AQUÍ ESTÁ LA HORA CERO!
             "celdas": {}
         }
-        archivos_procesados = 0
-        
-        # Procesar exactamente los 24 archivos que nos pasaron
-        for idx, filename in enumerate(archivos_nuevos):
-            if idx >= 24: break # Seguro anti-desbordes
-            
-            key = f"{S3_FORECAST_PREFIX}{filename}"
-            try:
-                resp = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
-                datos_hora = json.loads(resp['Body'].read().decode('utf-8'))
-                
-                for celda in datos_hora:
-                    lat = round(celda['lat'], 3)
-                    lon = round(celda['lon'], 3)
-                    geo_key = f"{lat},{lon}"
-                    
-                    if geo_key not in resumen['celdas']:
-                        resumen['celdas'][geo_key] = {
-                            "ias": [0]*24,
-                            "o3_1h": [0.0]*24,
-                            "pm10_12h": [0.0]*24,
-                            "pm25_12h": [0.0]*24,
-                            "dominante": ["N/A"]*24  # <--- NUEVO ARREGLO
-                        }
-                    
-                    # --- EXTRAER TODOS LOS CONTAMINANTES ---
-                    resumen['celdas'][geo_key]['ias'][idx] = int(celda.get('ias', 0))
-                    
-                    # Manejo seguro para los gases
-                    resumen['celdas'][geo_key]['o3_1h'][idx] = float(celda.get('o3 1h', celda.get('o3', 0.0)))
-                    resumen['celdas'][geo_key]['pm10_12h'][idx] = float(celda.get('pm10 12h', celda.get('pm10', 0.0)))
-                    resumen['celdas'][geo_key]['pm25_12h'][idx] = float(celda.get('pm25 12h', celda.get('pm25', 0.0)))
-                    
-                    # --- EXTRAER EL DOMINANTE ---
-                    resumen['celdas'][geo_key]['dominante'][idx] = celda.get('dominant', 'N/A')
-                    
-                archivos_procesados += 1
-            except Exception as e:
-                print(f"⚠️ Error procesando {key} para el resumen: {e}")
-
-        # Comprimir y Subir a S3
-        json_str = json.dumps(resumen, separators=(',', ':'))
-        comprimido = gzip.compress(json_str.encode('utf-8'))
+        archivos_procesados = min(len(archivos_nuevos), 24) # Seguro anti-desbordes
+        pad = 24 - archivos_procesados
+
+        # (horas × celdas) -> una lista de 24 valores por celda; los gases con el mismo valor que
+        # quedaba en el JSON horario (float redondeado a 1 decimal, escrito con 10 decimales)
+        def por_celda(values, default, cast=None):
+            rows = values[:archivos_procesados].T.tolist()
+            if cast: rows = [[cast(v) for v in row] for row in rows]
+            return [row + [default] * pad for row in rows]
+
+        gas = lambda v: round(v, 10)
+        ias = por_celda(tensor['ias'].astype(int), 0)
+        o3 = por_celda(np.round(tensor['o3'], 1).astype(np.float64), 0.0, gas)
+        pm10 = por_celda(np.round(tensor['pm10'], 1).astype(np.float64), 0.0, gas)
+        pm25 = por_celda(np.round(tensor['pm25'], 1).astype(np.float64), 0.0, gas)
+        labels = np.array(dominant_categories(['o3', 'pm10', 'pm25', 'co', 'so2']), dtype=object)
+        dominante = por_celda(labels[tensor['dominant']], "N/A")
+
+        lats, lons = grid_df['lat'].tolist(), grid_df['lon'].tolist()
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            # Misma llave que lee la API Ligera; si dos celdas redondean igual, gana la última
+            resumen['celdas'][f"{round(lat, 3)},{round(lon, 3)}"] = {
+                "ias": ias[i], "o3_1h": o3[i], "pm10_12h": pm10[i], "pm25_12h": pm25[i], "dominante": dominante[i]
+            }
+
+        # Binario para la API Ligera (lectura por celda con byte-range)
         output_key = "forecast_summary/latest_forecast.json.gz"
-        
         s3_client.put_object(
-            Bucket=S3_BUCKET, 
-            Key=output_key, 
-            Body=comprimido, 
-            ContentType='application/json', 
-            ContentEncoding='gzip'
+            Bucket=S3_BUCKET,
+            Key=output_key.replace('.json.gz', '.bin'),
+            Body=encode_summary(resumen, 'forecast'),
+            ContentType='application/octet-stream'
         )
+        
+        # Comprimir y Subir a S3 (json.gz de transición para el frontend)
+        if SUMMARY_WRITE_JSON:
+            json_str = json.dumps(resumen, separators=(',', ':'))
+            comprimido = gzip.compress(json_str.encode('utf-8'))
+            
+            s3_client.put_object(
+                Bucket=S3_BUCKET, 
+                Key=output_key, 
+                Body=comprimido, 
+                ContentType='application/json', 
+                ContentEncoding='gzip'
+            )
         print(f"✅ [FORECAST SUMMARY] Guardado en S3: {output_key} ({archivos_procesados} horas integradas con Gases)")
         return True
     except Exception as e:
@@ -291,170 +424,87 @@ def lambda_handler(event, context):
         base_grid_df = load_static_grid()
         print(f"🗺️ Malla lista: {len(base_grid_df)} celdas.")
         
-        # B. Ingesta Open-Meteo
+        # B. Ingesta Open-Meteo (caché por corrida del modelo) ya pivoteada: (horas × puntos) por variable
         print("🌍 Consultando Meteorología Futura...")
-        r = requests.get(OPEN_METEO_URL, timeout=25)
-        raw_data = r.json()
-        if not isinstance(raw_data, list): raw_data = [raw_data]
+        times, om_lons, om_lats, met = get_open_meteo(target_start_time_naive)
+        print(f"⏳ Procesando {len(times)} horas...")
 
-        # C. Pivoteo (Ubicación -> Tiempo)
-        hourly_buffer = {} 
-        for location in raw_data:
-            lat, lon = location['latitude'], location['longitude']
-            hourly = location['hourly']
-            times = hourly['time'] # ISO Strings
-            
-            for i, t_iso in enumerate(times):
-                if t_iso not in hourly_buffer:
-                    hourly_buffer[t_iso] = {'lats':[], 'lons':[], 'tmp':[], 'rh':[], 'wsp':[], 'wdr':[]}
-                
-                # Acumulamos los puntos dispersos para esta hora
-                hourly_buffer[t_iso]['lats'].append(lat)
-                hourly_buffer[t_iso]['lons'].append(lon)
-                hourly_buffer[t_iso]['tmp'].append(hourly['temperature_2m'][i])
-                hourly_buffer[t_iso]['rh'].append(hourly['relative_humidity_2m'][i])
-                hourly_buffer[t_iso]['wsp'].append(hourly['wind_speed_10m'][i])
-                hourly_buffer[t_iso]['wdr'].append(hourly['wind_direction_10m'][i])
-
-        # D. Generación de Archivos
-        generated_files = []
-        print(f"⏳ Procesando {len(hourly_buffer)} horas...")
-        
-        files_count = 0
-        
-        for t_iso, met_data in hourly_buffer.items():
-            current_grid = base_grid_df.copy()
-            
-            # Parsing Fecha
-            dt_obj = datetime.strptime(t_iso, "%Y-%m-%dT%H:%M")
-            file_name = dt_obj.strftime("%Y-%m-%d_%H-%M.json")
+        # Filtro T+1 y corte a 24 horas (pedimos 48h a Open-Meteo)
+        hour_dts = [datetime.strptime(t_iso, "%Y-%m-%dT%H:%M") for t_iso in times]
+        sel = [i for i, dt_obj in enumerate(hour_dts) if dt_obj >= target_start_time_naive][:24]
+        if len(sel) >= 24:
+            print("✅ Se alcanzaron las 24 horas de pronóstico.")
+        times = [times[i] for i in sel]
+        hour_dts = [hour_dts[i] for i in sel]
+        met = {v: met[v][sel] for v in met}
+        n_hours, n_cells = len(sel), len(base_grid_df)
 
-            # --- INICIO ANCLA B (Filtro y Logs) ---
-            
-            # FILTRO: Si la hora del dato es MENOR a nuestro target (T+1), la saltamos
-            if dt_obj < target_start_time_naive:
-                continue 
-            
-            # LOG INPUT (Solo la primera vez que entra al vector válido)
-            if files_count == 0:
-                print(f"\n🔍 INSPECCIÓN INPUT (Hora {t_iso}):")
-                print(f"   Temp Prom: {np.mean(met_data['tmp']):.1f}°C | Viento Prom: {np.mean(met_data['wsp']):.1f} m/s")
-            
-            # --- FIN ANCLA B (Parte 1) ---
-            
-            
-            # 1. Interpolación Meteorológica
-            current_grid['tmp'] = interpolate_on_grid(current_grid, met_data['lons'], met_data['lats'], met_data['tmp'])
-            current_grid['rh']  = interpolate_on_grid(current_grid, met_data['lons'], met_data['lats'], met_data['rh'])
-            current_grid['wsp'] = interpolate_on_grid(current_grid, met_data['lons'], met_data['lats'], met_data['wsp'])
-            
-            # Viento vectorial
-            u_vec = [-w * np.sin(np.radians(d)) for w, d in zip(met_data['wsp'], met_data['wdr'])]
-            v_vec = [-w * np.cos(np.radians(d)) for w, d in zip(met_data['wsp'], met_data['wdr'])]
-            grid_u = interpolate_on_grid(current_grid, met_data['lons'], met_data['lats'], u_vec)
-            grid_v = interpolate_on_grid(current_grid, met_data['lons'], met_data['lats'], v_vec)
-            current_grid['wdr'] = (np.degrees(np.arctan2(-grid_u, -grid_v))) % 360
-
-            # 2. Features IA
-            current_grid['hour_sin'] = np.sin(2 * np.pi * dt_obj.hour / 24)
-            current_grid['hour_cos'] = np.cos(2 * np.pi * dt_obj.hour / 24)
-            current_grid['month_sin'] = np.sin(2 * np.pi * dt_obj.month / 12)
-            current_grid['month_cos'] = np.cos(2 * np.pi * dt_obj.month / 12)
-            current_grid['station_numeric'] = -1 
-            
-            features_ia = ['lat', 'lon', 'altitude', 'building_vol', 'station_numeric', 
-                           'hour_sin', 'hour_cos', 'month_sin', 'month_cos', 
-                           'tmp', 'rh', 'wsp', 'wdr']
-            
-            # 3. Inferencia Química (5 Gases)
-            for p in ['o3', 'pm10', 'pm25', 'co', 'so2']:
-                if p in models:
-                    preds = models[p].predict(current_grid[features_ia]).clip(0)
-                    current_grid[p] = preds
-                else:
-                    current_grid[p] = 0.0
-
-            # --- INICIO ANCLA B (Parte 2 - Logs de Salida) ---
-            # LOG OUTPUT (Sanity Check de la predicción)
-            if files_count == 0: # Solo logueamos detallado el primer archivo generado
-                print(f"📊 ESTADÍSTICAS OUTPUT ({t_iso}):")
-                print(f"   PM2.5 -> Min: {current_grid['pm25'].min():.1f} | Max: {current_grid['pm25'].max():.1f} | Mean: {current_grid['pm25'].mean():.1f}")
-                print(f"   O3    -> Min: {current_grid['o3'].min():.1f}   | Max: {current_grid['o3'].max():.1f}")
-                print(f"   Urbano -> Max Vol Edificios: {current_grid['building_vol'].max()} (Si es 0, no cargó edificios)")
-                print("---------------------------------------------------")
-            
-            files_count += 1
-
-            # 4. Cálculo de Índices (IAS)
-            def calc_ias_row(row):
-                scores = {
-                    'O3': get_ias_score(row['o3'], 'o3'),
-                    'PM10': get_ias_score(row['pm10'], 'pm10'),
-                    'PM2.5': get_ias_score(row['pm25'], 'pm25'),
-                    'CO': get_ias_score(row['co'], 'co'),
-                    'SO2': get_ias_score(row['so2'], 'so2')
-                }
-                dom_pol = max(scores, key=scores.get)
-                return pd.Series([max(scores.values()), dom_pol])
-            
-            current_grid[['ias', 'dominant']] = current_grid.apply(calc_ias_row, axis=1)
-            current_grid['risk'] = current_grid['ias'].apply(get_risk_level)
-            
-            # 5. Exportación
-            output_df = pd.DataFrame()
-            output_df['timestamp'] = [t_iso.replace("T", " ")] * len(current_grid)
-            
-            # Geografía
-            for c in ['lat', 'lon', 'col', 'mun', 'edo', 'pob', 'altitude', 'building_vol']:
-                output_df[c] = current_grid[c]
-            
-            # Meteorología
-            output_df['tmp'] = current_grid['tmp'].round(1)
-            output_df['rh'] = current_grid['rh'].round(0)
-            output_df['wsp'] = current_grid['wsp'].round(1)
-            output_df['wdr'] = current_grid['wdr'].round(0)
-            
-            # Química (Mapping Frontend)
-            output_df['o3 1h']    = current_grid['o3'].round(1)
-            output_df['pm10 12h'] = current_grid['pm10'].round(1)
-            output_df['pm25 12h'] = current_grid['pm25'].round(1)
-            output_df['co 8h']    = current_grid['co'].round(2)
-            output_df['so2 1h']   = current_grid['so2'].round(1)
-            
-            # Indices y Metadata
-            output_df['ias'] = current_grid['ias'].astype(int)
-            output_df['risk'] = current_grid['risk']
-            output_df['dominant'] = current_grid['dominant']
-            output_df['station'] = None 
-            
-            # Sources Explícitos
-            sources_map = {
-                "tmp": "Open-Meteo", "rh": "Open-Meteo", "wsp": "Open-Meteo",
-                "o3": "AI Forecast", "pm10": "AI Forecast", "pm25": "AI Forecast",
-                "co": "AI Forecast", "so2": "AI Forecast"
-            }
-            output_df['sources'] = json.dumps(sources_map)
-            
-            # Guardar S3
-            json_body = output_df.replace({np.nan: None}).to_json(orient='records')
-            s3_key = f"{S3_FORECAST_PREFIX}{file_name}"
-            s3_client.put_object(Bucket=S3_BUCKET, Key=s3_key, Body=json_body, ContentType='application/json')
-            generated_files.append(file_name)
-
-            # --- INICIO CAMBIO 3: CORTAR A LAS 24 HORAS ---
-            # Como pedimos 48h a Open-Meteo, debemos frenar cuando tengamos el vector completo
-            if len(generated_files) >= 24:
-                print("✅ Se alcanzaron las 24 horas de pronóstico. Deteniendo loop.")
-                break
-            # --- FIN CAMBIO 3 -----------------------------
-
-        print(f"✅ FORECAST COMPLETADO: {len(generated_files)} archivos generados.")
+        generated_files, published = [], []
+        if n_hours:
+            t0 = time.perf_counter()
+            # LOG INPUT (primera hora del vector válido)
+            print(f"\n🔍 INSPECCIÓN INPUT (Hora {times[0]}):")
+            print(f"   Temp Prom: {np.mean(met['tmp'][0]):.1f}°C | Viento Prom: {np.mean(met['wsp'][0]):.1f} m/s")
+
+            # D. Incremental: solo se recalculan las horas cuya entrada (meteorología, modelos, malla) cambió
+            hashes = hour_input_hashes(forecast_run_signature(base_grid_df), times, om_lons, om_lats, met)
+            state = load_forecast_state() if FORECAST_INCREMENTAL else {}
+            reuse = reusable_hours(state, times, hashes)
+            changed = [h for h in range(n_hours) if h not in reuse]
+            print(f"♻️ Forecast incremental: {len(reuse)} horas reutilizadas | {len(changed)} por calcular")
+
+            # Tensor (horas nuevas × celdas): meteorología, features y química de esas horas juntas
+            pollutants = ['o3', 'pm10', 'pm25', 'co', 'so2']
+            changed_dts = [hour_dts[h] for h in changed]
+            if changed:
+                tensor = build_forecast_tensor(base_grid_df, om_lons, om_lats, {v: met[v][changed] for v in met}, changed_dts)
+                # 3. Inferencia Química (5 Gases): una llamada por modelo sobre horas·celdas filas
+                X_all = build_feature_tensor(tensor, (len(changed), n_cells), FEATURES_IA)
+                preds = predict_all(models, X_all, pollutants, FEATURES_IA)
+                print(f"🧠 Inferencia por lotes: {X_all.shape[0]} filas × {len(models)} modelos.")
+
+            # Tensor completo de química (24 h): horas reutilizadas del estado + horas nuevas
+            full = {}
+            for p in pollutants:
+                full[p] = np.zeros((n_hours, n_cells), dtype=np.float32 if p in models else np.float64)
+                for h, i in reuse.items():
+                    full[p][h] = state['preds'][p][i]
+                if changed and p in preds:
+                    full[p][changed] = preds[p].reshape(len(changed), n_cells).clip(0)
+
+            # LOG OUTPUT (Sanity Check de la primera hora)
+            print(f"📊 ESTADÍSTICAS OUTPUT ({times[0]}):")
+            print(f"   PM2.5 -> Min: {full['pm25'][0].min():.1f} | Max: {full['pm25'][0].max():.1f} | Mean: {full['pm25'][0].mean():.1f}")
+            print(f"   O3    -> Min: {full['o3'][0].min():.1f}   | Max: {full['o3'][0].max():.1f}")
+            print(f"   Urbano -> Max Vol Edificios: {base_grid_df['building_vol'].max()} (Si es 0, no cargó edificios)")
+            print("---------------------------------------------------")
+
+            # 4. Cálculo de Índices (IAS) sobre el tensor completo
+            full['ias'], full['dominant'], full['risk'] = compute_ias(full, pollutants)
+
+            # 5. Exportación: un solo DataFrame (horas nuevas·celdas filas) que se parte por hora
+            if changed:
+                for v in ['o3', 'pm10', 'pm25', 'co', 'so2', 'ias', 'dominant', 'risk']:
+                    tensor[v] = full[v][changed]
+                output_df = build_output_frame(base_grid_df, [times[h] for h in changed], tensor, pollutants)
+                print(f"⏱️ Tensor {len(changed)}×{n_cells} listo en {time.perf_counter() - t0:.2f}s")
+
+                # E. Generación de Archivos: serialización + PUT en paralelo (solo horas nuevas o cambiadas)
+                published = publish_forecast_files(output_df, changed_dts, n_cells)
+            generated_files = [dt_obj.strftime("%Y-%m-%d_%H-%M.json") for dt_obj in hour_dts]
+
+        print(f"✅ FORECAST COMPLETADO: {len(generated_files)} horas ({len(published)} archivos publicados).")
         
         # --- NUEVO: Generar el resumen ligero pasándole los archivos directamente ---
-        if len(generated_files) > 0:
-            generate_forecast_summary(generated_files)
+        # Mismas horas, ninguna cambió y el resumen anterior sí se escribió -> resumen y estado en S3 ya son estos
+        summary_generated = False
+        if generated_files and (published or state.get('times') != times or not state.get('summary_ok')):
+            summary_generated = generate_forecast_summary(generated_files, full, base_grid_df)
+            save_forecast_state(times, hashes, {p: full[p] for p in pollutants if p in models}, summary_generated)
+        elif generated_files:
+            print("♻️ [FORECAST SUMMARY] Sin horas nuevas ni cambios: resumen vigente.")
             
-        return {'statusCode': 200, 'body': json.dumps({'files': len(generated_files), 'summary_generated': True})}
+        return {'statusCode': 200, 'body': json.dumps({'files': len(generated_files), 'published': len(published), 'summary_generated': summary_generated})}
 
     except Exception as e:
         print(f"❌ ERROR: {str(e)}")